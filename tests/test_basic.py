@@ -2,6 +2,7 @@ import openpyxl
 import pytest
 
 from xlnumba import Compiler
+from xlnumba.ast import numba_signature
 
 
 @pytest.fixture(scope='module')
@@ -95,3 +96,51 @@ def test_formula_input(xlsx_sheet):
     fn = ctx.compile(disable_numba=True)
     result = fn(src=2)
     assert result == {'dst': 4}
+
+
+def test_eager_compilation(xlsx_sheet):
+    """
+    Eager compilation builds the signature from the inputs, so the function is compiled before the first call and
+    calls with an incompatible type raise rather than compiling a new version.
+    """
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "B1")
+    fn = ctx.compile(eager=True)
+    assert len(fn.signatures) == 1
+    assert fn(2.0) == {'dst': 3}
+    with pytest.raises(TypeError):
+        fn("text")
+    assert len(fn.signatures) == 1
+
+
+def test_eager_signature(xlsx_sheet):
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("base", "A2")
+    ctx.add_input("exp", "B2")
+    ctx.add_output("dst", "C2")
+    assert numba_signature(ctx._inputs) == "(float64, float64)"
+    assert numba_signature(ctx._inputs, batch=True) == "(float64[:], float64[:])"
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_return_tuple(disable_numba):
+    """
+    Outputs can be returned as a named tuple, which unlike a dictionary can mix scalar and array outputs under numba.
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 1
+    for row in range(2, 5):
+        ws[f"B{row}"] = f"=$A$1 * {row}"
+    ws["C1"] = "=SUM(B2:B4)"
+    ctx = Compiler(wb)
+    ctx.add_input("src", "A1")
+    ctx.add_output("total", "C1")
+    ctx.add_output("values", "B2:B4")
+    fn = ctx.compile(disable_numba=disable_numba, return_tuple=True)
+    result = fn(src=2)
+    assert result.total == 18
+    assert list(result.values) == [4, 6, 8]
+    assert result[0] == 18
+    assert list(result._asdict()) == ['total', 'values']
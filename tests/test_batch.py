@@ -0,0 +1,89 @@
+import numpy
+import openpyxl
+import pytest
+
+from xlnumba import Compiler
+
+
+@pytest.fixture(scope='module')
+def xlsx_sheet(request):
+    return openpyxl.load_workbook('tests/fixtures/basic.xlsx')
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_batch_single_output(xlsx_sheet, disable_numba):
+    """
+    Batch functions evaluate every scenario in the input array and return one result per scenario.
+    """
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "B1")
+    fn = ctx.compile_batch(disable_numba=disable_numba)
+    result = fn(src=numpy.array([1.0, 2.0, 3.0]))
+    assert list(result.keys()) == ['dst']
+    assert (result['dst'] == [2.0, 3.0, 4.0]).all()
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_batch_multiple_outputs(xlsx_sheet, disable_numba):
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("base", "A2")
+    ctx.add_input("exp", "B2")
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "C2")
+    ctx.add_output("dst2", "C1")
+    fn = ctx.compile_batch(disable_numba=disable_numba)
+    result = fn(base=numpy.array([2.0, 3.0]), exp=numpy.array([1.0, 2.0]), src=numpy.array([0.0, 1.0]))
+    assert (result['dst'] == [4.0, 27.0]).all()
+    assert (result['dst2'] == [3.0, 4.0]).all()
+
+
+def test_batch_default_inputs(xlsx_sheet):
+    """
+    Inputs which are not provided use the default value from the sheet for all scenarios.
+    """
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("base", "A2")
+    ctx.add_input("exp", "B2")
+    ctx.add_output("dst", "C2")
+    fn = ctx.compile_batch(disable_numba=True)
+    result = fn(exp=numpy.array([1.0, 2.0]))
+    assert (result['dst'] == [4.0, 8.0]).all()
+
+
+def test_batch_mismatched_inputs(xlsx_sheet):
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("base", "A2")
+    ctx.add_input("exp", "B2")
+    ctx.add_output("dst", "C2")
+    fn = ctx.compile_batch(disable_numba=True)
+    with pytest.raises(ValueError):
+        fn(base=numpy.array([1.0, 2.0]), exp=numpy.array([1.0]))
+
+
+@pytest.mark.parametrize("parallel, threads", [(True, None), (False, 3)], ids=['prange', 'threads'])
+def test_batch_parallel(xlsx_sheet, parallel, threads):
+    """
+    Parallel evaluation must produce the same results, in the same order, as the serial batch function.
+    """
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("base", "A2")
+    ctx.add_input("exp", "B2")
+    ctx.add_output("dst", "C2")
+    fn = ctx.compile_batch(parallel=parallel, threads=threads)
+    base = numpy.linspace(1.0, 2.0, 101)
+    exp = numpy.linspace(0.0, 3.0, 101)
+    result = fn(base=base, exp=exp)
+    assert result['dst'] == pytest.approx(base ** (exp + 1))
+
+
+def test_batch_eager(xlsx_sheet):
+    ctx = Compiler(xlsx_sheet)
+    ctx.add_input("base", "A2")
+    ctx.add_input("exp", "B2")
+    ctx.add_output("dst", "C2")
+    fn = ctx.compile_batch(eager=True)
+    result = fn(base=numpy.array([2.0, 3.0]), exp=numpy.array([1.0, 2.0]))
+    assert (result['dst'] == [4.0, 27.0]).all()
+    with pytest.raises(TypeError):
+        fn(exp=numpy.array([1.0, 2.0]))
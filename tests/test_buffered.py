@@ -0,0 +1,105 @@
+import tracemalloc
+
+import numpy
+import openpyxl
+import pytest
+
+from xlnumba import Compiler
+
+
+def _workbook(rows=100):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["E1"] = 1
+    for row in range(1, rows + 1):
+        ws[f"A{row}"] = row / 10
+        ws[f"C{row}"] = f"=SIN(A{row} * $E$1) * 2 + A{row} * A{row}"
+        ws[f"D{row}"] = f"=C{row} * 2 + ABS(A{row})"
+    ws["F1"] = f"=SUM(D1:D{rows})"
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "E1")
+    ctx.add_output("result", f"D1:D{rows}")
+    ctx.add_output("total", "F1")
+    return ctx
+
+
+def _expected(scale):
+    a = numpy.arange(1, 101) / 10
+    result = (numpy.sin(a * scale) * 2 + a * a) * 2 + numpy.abs(a)
+    return result, result.sum()
+
+
+@pytest.mark.parametrize("disable_optimizations", [False, True], ids=['optimized', 'unoptimized'])
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_buffered_outputs(disable_numba, disable_optimizations):
+    """
+    Outputs are written in to the arrays passed by the caller, scalars in to an array of a single entry.
+    """
+    fn = _workbook().compile_buffered(disable_numba=disable_numba, disable_optimizations=disable_optimizations)
+    assert fn.outputs == {'result': ((100,), numpy.float64), 'total': ((1,), numpy.float64)}
+    assert fn.input_names == ['scale']
+
+    outputs = fn.allocate_outputs()
+    result = outputs['result']
+    for scale in [3, 0.5]:
+        assert fn(outputs, scale=scale) is outputs
+        expected, total = _expected(scale)
+        assert result == pytest.approx(expected)
+        assert outputs['total'][0] == pytest.approx(total)
+    assert outputs['result'] is result
+
+
+def test_buffered_workspace():
+    """
+    Intermediate arrays are written in to the workspace, results which aren't alive at the same time share an array.
+    """
+    fn = _workbook().compile_buffered(disable_numba=True, disable_optimizations=True)
+    assert 0 < len(fn.workspace) < 7  # seven operations on arrays compute the result.
+    assert all(x == ((100, 1), numpy.float64) for x in fn.workspace)
+
+    workspace = fn.allocate_workspace()
+    outputs = fn(fn.allocate_outputs(), workspace, scale=2)
+    assert outputs['result'] == pytest.approx(_expected(2)[0])
+
+
+@pytest.mark.parametrize("disable_optimizations", [False, True], ids=['optimized', 'unoptimized'])
+def test_buffered_no_allocations(disable_optimizations):
+    """ Once the outputs and workspace are allocated, calls don't create any arrays. """
+    fn = _workbook(1000).compile_buffered(disable_numba=True, disable_optimizations=disable_optimizations)
+    assert fn.allocating == []
+    outputs = fn.allocate_outputs()
+    fn(outputs, scale=2)
+
+    tracemalloc.start()
+    try:
+        for scale in range(10):
+            fn(outputs, scale=scale)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 1000 * 8  # smaller than any array of the calculation.
+
+
+def test_buffered_allocating():
+    """ Arrays which aren't written in to the workspace, such as the array holding a recurrence, are reported. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 1
+    ws["B1"] = 0.5
+    for row in range(2, 1001):
+        ws[f"A{row}"] = f"=A{row - 1} * $B$1 + 1"
+    ws["C1"] = "=SUM(A1:A1000)"
+    ctx = Compiler(wb)
+    ctx.add_input("rate", "B1")
+    ctx.add_output("total", "C1")
+    fn = ctx.compile_buffered(disable_numba=True)
+    assert len(fn.allocating) == 1
+
+    outputs = fn.allocate_outputs()
+    tracemalloc.start()
+    try:
+        fn(outputs, rate=0.5)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak >= 1000 * 8
@@ -0,0 +1,57 @@
+import openpyxl
+import pytest
+
+from xlnumba import Compiler
+
+
+def _compiler(tmp_path, file='tests/fixtures/basic.xlsx'):
+    ctx = Compiler(file, cache_dir=tmp_path)
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "B1")
+    return ctx
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_cache_round_trip(tmp_path, disable_numba):
+    """
+    First compilation stores the generated module, the second loads it without reading the workbook.
+    """
+    fn = _compiler(tmp_path).compile(disable_numba=disable_numba)
+    assert fn(src=2) == {'dst': 3}
+    assert len(list(tmp_path.glob("xlnumba_*.py"))) == 1
+
+    ctx = _compiler(tmp_path)
+    fn = ctx.compile(disable_numba=disable_numba)
+    assert ctx._wb is None
+    assert fn(src=2) == {'dst': 3}
+    assert len(list(tmp_path.glob("xlnumba_*.py"))) == 1
+
+
+def test_cache_numba_cache_files(tmp_path):
+    fn = _compiler(tmp_path).compile()
+    fn(src=2)
+    assert any((tmp_path / "__pycache__").glob("*.nbi"))
+
+
+def test_cache_key_options(tmp_path):
+    """ Different options or specifications must not share cached modules """
+    _compiler(tmp_path).compile(disable_numba=True)
+    _compiler(tmp_path).compile(disable_numba=True, disable_optimizations=True)
+    ctx = _compiler(tmp_path)
+    ctx.add_output("dst2", "C1")
+    ctx.compile(disable_numba=True)
+    assert len(list(tmp_path.glob("xlnumba_*.py"))) == 3
+
+
+def test_cache_batch(tmp_path):
+    fn = _compiler(tmp_path).compile_batch(disable_numba=True)
+    fn = _compiler(tmp_path).compile_batch(disable_numba=True)
+    assert list(fn(src=[1.0, 2.0])['dst']) == [2.0, 3.0]
+
+
+def test_cache_workbook(tmp_path):
+    """ Workbook objects are hashed on their contents so remain cacheable """
+    wb = openpyxl.load_workbook('tests/fixtures/basic.xlsx')
+    assert _compiler(tmp_path, wb).compile(disable_numba=True)(src=2) == {'dst': 3}
+    assert _compiler(tmp_path, wb).compile(disable_numba=True)(src=2) == {'dst': 3}
+    assert len(list(tmp_path.glob("xlnumba_*.py"))) == 1
@@ -22,3 +22,40 @@ def test_range_reference(xl):
 def test_range_reference_cells(xl):
     reference = ExcelReference(xl, '$A3:B$4')
     reference.get_cells()
+
+
+def test_array_index():
+    """ Arrays spanning several blocks of the index are found from any of the cells within them. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["B2"] = openpyxl.worksheet.formula.ArrayFormula("B2:C200", "=D2:E200*2")
+    ws["B300"] = openpyxl.worksheet.formula.ArrayFormula("B300:B301", "=D300:D301*2")
+
+    assert ExcelReference(wb, 'C150')._ref_type == ExcelReference.ReferenceType.ARRAY
+    assert ExcelReference(wb, 'B70:C130')._array_src == 'B2#'
+    assert ExcelReference(wb, 'B301')._array_src == 'B300#'
+    assert ExcelReference(wb, 'D150')._ref_type == ExcelReference.ReferenceType.CELL
+    assert ExcelReference(wb, 'B150:B250')._ref_type == ExcelReference.ReferenceType.RANGE
+
+
+def test_reference_keys(xl):
+    """ References to the same cells share an interned key, however they were created. """
+    cells = ExcelReference(xl, 'A3:B4').get_cells()
+    assert cells[1].key is ExcelReference(xl, 'B3').key
+    assert cells[1] == ExcelReference(xl, 'Sheet1!$B$3')
+    assert hash(cells[1]) == hash(ExcelReference(xl, 'B3'))
+    assert ExcelReference(xl, 'B3') != ExcelReference(xl, 'B3:B3')
+
+
+def test_reference_keys_across_workbooks(xl):
+    other = openpyxl.load_workbook('tests/fixtures/basic.xlsx')
+    assert ExcelReference(xl, 'B3') == ExcelReference(other, 'B3')
+    assert ExcelReference(xl, 'B3') != ExcelReference(other, 'B4')
+
+
+def test_reference_keys_other_types(xl):
+    """ Keys and references compare unequal to other objects rather than failing. """
+    ref = ExcelReference(xl, 'B3')
+    assert ref.key != 'Sheet1!B3'
+    assert ref != 'Sheet1!B3'
+    assert ref.key != ref
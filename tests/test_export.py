@@ -0,0 +1,80 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+from xlnumba import Compiler, xlnumba_function
+
+
+@xlnumba_function("TEST_EXPORT_FUNC")
+def export_func(x):
+    return 2 * x + 1
+
+
+def _import(path):
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_export_module(tmp_path, disable_numba):
+    ctx = Compiler('tests/fixtures/basic.xlsx')
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "B1")
+    path = tmp_path / "model.py"
+    ctx.export_module(path, disable_numba=disable_numba)
+    module = _import(path)
+    assert module.compiled_function(src=2) == {'dst': 3}
+    assert module.compiled_function() == {'dst': 5}
+
+
+def test_export_user_function(tmp_path):
+    """
+    User functions are copied into the module rather than relying on them being registered when it is imported.
+    """
+    wb = openpyxl.Workbook()
+    wb.active['A1'] = 3
+    wb.active['B1'] = '=TEST_EXPORT_FUNC(A1)'
+    ctx = Compiler(wb)
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "B1")
+    path = tmp_path / "model.py"
+    code = ctx.export_module(path)
+    assert 'def export_func(x):' in code
+    assert 'xlnumba_function' not in code
+    assert _import(path).compiled_function(src=4) == {'dst': 9}
+
+
+def test_export_without_compiler(tmp_path):
+    """ Exported modules only import the runtime, so they can be used without openpyxl or astor installed. """
+    ctx = Compiler('tests/fixtures/basic.xlsx')
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "B1")
+    ctx.export_module(tmp_path / "model.py")
+    script = textwrap.dedent("""
+        import sys
+        sys.modules['openpyxl'] = None
+        sys.modules['astor'] = None
+        import model
+        assert model.compiled_function(src=2) == {'dst': 3}
+        assert 'xlnumba.compiler' not in sys.modules
+    """)
+    subprocess.run([sys.executable, '-c', script], cwd=tmp_path, check=True,
+                   env={**os.environ, 'PYTHONPATH': str(Path.cwd())})
+
+
+@pytest.mark.parametrize("module", ['mathematical', 'special', 'statistical', 'text', 'logical', 'lookup'])
+def test_excel_functions_kernels(module):
+    """ Kernels moved to the runtime can still be imported from the excel_functions modules. """
+    runtime = importlib.import_module(f"xlnumba.runtime.{module}")
+    functions = importlib.import_module(f"xlnumba.excel_functions.{module}")
+    kernels = [name for name, value in vars(runtime).items()
+               if not name.startswith('_') and getattr(value, '__module__', None) == runtime.__name__]
+    assert kernels and all(getattr(functions, name) is getattr(runtime, name) for name in kernels)
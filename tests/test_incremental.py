@@ -0,0 +1,122 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+from xlnumba import Compiler
+from xlnumba.compiler_frame import CompilerReference
+from xlnumba.excel_functions import user_functions
+from xlnumba.excel_reference import ExcelReference
+
+
+def _workbook():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws['A1'] = 1
+    ws['B1'] = "=A1+1"
+    ws['C1'] = "=B1*2"
+    ws['E1'] = 3
+    ws['D1'] = "=SUM(E1:E2)+5"
+    return wb
+
+
+def _cached_node(ctx, address):
+    ref = ExcelReference(ctx.wb, address)
+    return ctx._reference_cache.references[CompilerReference(mode=CompilerReference.Mode.range, active_cell=ref)]
+
+
+def _compiler(wb, cache_dir=None):
+    ctx = Compiler(wb, cache_dir=cache_dir)
+    ctx.add_input("a", "A1")
+    ctx.add_output("c", "C1")
+    ctx.add_output("d", "D1")
+    return ctx
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_incremental_changed_cell(disable_numba):
+    """ Only the edited cell and its dependents are rebuilt, the rest of the graph is reused. """
+    wb = _workbook()
+    ctx = _compiler(wb)
+    assert ctx.compile(disable_numba=disable_numba)(a=1) == {'c': 4, 'd': 8}
+    c_node, d_node = _cached_node(ctx, "C1"), _cached_node(ctx, "D1")
+
+    wb.active['E2'] = 10
+    assert ctx.compile(disable_numba=disable_numba)(a=1) == {'c': 4, 'd': 18}
+    assert _cached_node(ctx, "C1") is c_node
+    assert _cached_node(ctx, "D1") is not d_node
+
+
+def test_incremental_unchanged():
+    """ Cached nodes are not modified by optimizations, so compiling again produces the same result. """
+    ctx = _compiler(_workbook())
+    first = ctx.compile(disable_numba=True)
+    c_node = _cached_node(ctx, "C1")
+    second = ctx.compile(disable_numba=True)
+    assert _cached_node(ctx, "C1") is c_node
+    assert first(a=2) == second(a=2) == {'c': 6, 'd': 8}
+
+
+def test_incremental_reload(tmp_path):
+    path = tmp_path / "model.xlsx"
+    wb = _workbook()
+    wb.save(path)
+
+    ctx = _compiler(str(path))
+    assert ctx.compile(disable_numba=True)(a=1) == {'c': 4, 'd': 8}
+    c_node = _cached_node(ctx, "C1")
+
+    wb.active['B1'] = "=A1+2"
+    wb.save(path)
+    assert ctx.reload().compile(disable_numba=True)(a=1) == {'c': 6, 'd': 8}
+    assert _cached_node(ctx, "C1") is not c_node
+
+
+def test_incremental_structure_change():
+    """ Adding a sheet or changing the inputs discards all cached nodes. """
+    wb = _workbook()
+    ctx = _compiler(wb)
+    ctx.compile(disable_numba=True)
+    c_node = _cached_node(ctx, "C1")
+
+    wb.create_sheet("Other")
+    assert ctx.compile(disable_numba=True)(a=1) == {'c': 4, 'd': 8}
+    assert _cached_node(ctx, "C1") is not c_node
+
+
+def test_incremental_stored(tmp_path, monkeypatch):
+    """ A compiler in a new process starts from the nodes stored by the last compilation of the file. """
+    # user functions installed by other tests are part of the key, the new process has none.
+    monkeypatch.setattr(user_functions, 'INSTALLED_FUNCTIONS', {})
+    path = tmp_path / "model.xlsx"
+    wb = _workbook()
+    wb.save(path)
+    assert _compiler(str(path), tmp_path / "cache").compile(disable_numba=True)(a=1) == {'c': 4, 'd': 8}
+
+    wb.active['E2'] = 10
+    wb.save(path)
+    # string hashes differ between processes, the stored references must still match those of the new workbook.
+    script = textwrap.dedent("""
+        import xlnumba.compiler
+        from xlnumba import Compiler
+
+        built = []
+        create_compiler_frame = xlnumba.compiler.create_compiler_frame
+        def recording(ref, *args):
+            built.append(repr(ref.active_cell))
+            return create_compiler_frame(ref, *args)
+        xlnumba.compiler.create_compiler_frame = recording
+
+        ctx = Compiler("model.xlsx", cache_dir="cache")
+        ctx.add_input("a", "A1")
+        ctx.add_output("c", "C1")
+        ctx.add_output("d", "D1")
+        assert ctx.compile(disable_numba=True)(a=1) == {'c': 4, 'd': 18}
+        assert 'Sheet!D1' in built and 'Sheet!C1' not in built, built
+    """)
+    subprocess.run([sys.executable, '-c', script], cwd=tmp_path, check=True,
+                   env={**os.environ, 'PYTHONPATH': str(Path.cwd()), 'PYTHONHASHSEED': '1'})
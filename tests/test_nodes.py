@@ -0,0 +1,138 @@
+import ast
+
+import xlnumba.excel_functions as excel_functions
+from xlnumba.excel_reference import DataType
+from xlnumba.nodes import LiteralNode, BinOpNode, ComparisonNode, FunctionOpNode, InputNode, clone_graph, post_order
+from xlnumba.optimizations.lazy_conditional import ConditionalNode
+from xlnumba.shape import Shape, SCALAR_SHAPE
+
+
+def _diamonds(bottom, count):
+    # each level uses the level below it twice, so there are 2 ** count paths from the top to the bottom.
+    node = bottom
+    for idx in range(count):
+        left = BinOpNode(f"left{idx}", ast.Add, node, LiteralNode(f"l{idx}", 1))
+        right = BinOpNode(f"right{idx}", ast.Mult, node, LiteralNode(f"r{idx}", 2))
+        node = BinOpNode(f"level{idx}", ast.Add, left, right)
+    return node
+
+
+def test_annotations_cached():
+    # The shape of each node is only computed once, rather than once for each path to it.
+    bottom = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    top = _diamonds(bottom, 200)
+    assert top.shape == SCALAR_SHAPE
+    assert top.data_type == DataType.Number
+
+
+def test_annotations_invalidated():
+    # Replacing a node clears the annotations of every node above it.
+    bottom = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    top = _diamonds(bottom, 5)
+    comparison = ComparisonNode("cmp", ast.Gt, top, LiteralNode("zero", 0))
+    assert comparison.shape == SCALAR_SHAPE
+
+    bottom.replace_in_graph(InputNode("array", Shape(10, 1), DataType.Number))
+    assert top.shape == Shape(10, 1)
+    assert comparison.shape == Shape(10, 1)
+    assert comparison.data_type == DataType.Boolean
+
+
+def test_annotations_cloned():
+    # Clones don't share annotations with the graph they were cloned from.
+    bottom = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    top = _diamonds(bottom, 3)
+    assert top.shape == SCALAR_SHAPE
+
+    clone, = clone_graph([top])
+    clone_bottom = next(x for x in _walk(clone) if x.varname == "src")
+    clone_bottom.replace_in_graph(InputNode("array", Shape(1, 4), DataType.Number))
+    assert clone.shape == Shape(1, 4)
+    assert top.shape == SCALAR_SHAPE
+
+
+def _walk(node):
+    stack, seen = [node], set()
+    while stack:
+        current = stack.pop()
+        if current not in seen:
+            seen.add(current)
+            yield current
+            stack.extend(current.children)
+
+
+def test_generate_deep_chain():
+    # Chains deeper than the recursion limit, such as a balance carried forward down a column.
+    node = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    for idx in range(20_000):
+        node = BinOpNode(f"row{idx}", ast.Add, node, LiteralNode(f"l{idx}", 1))
+    stmts = node.generate_ast_tree(set())
+    assert len(stmts) == 20_000
+    assert stmts[-1].targets[0].id == "row19999"
+
+
+def test_generate_schedule():
+    # The operand needing the most arrays alive at once is computed first, then only its result is alive while the
+    # other operand is computed.
+    inputs = [InputNode(f"in{idx}", Shape(10, 1), DataType.Number) for idx in range(5)]
+    left = BinOpNode("left", ast.Add, inputs[0], LiteralNode("one", 1))
+    right = BinOpNode("right", ast.Mult,
+                      BinOpNode("a", ast.Add, inputs[1], inputs[2]), BinOpNode("b", ast.Add, inputs[3], inputs[4]))
+    top = BinOpNode("top", ast.Sub, left, right)
+
+    assert left.temporaries == 1
+    assert right.temporaries == 3
+    assert top.scheduled_children() == [right, left]
+    stmts = top.generate_ast_tree(set())
+    assert [x.targets[0].id for x in stmts] == ["a", "b", "right", "left", "top"]
+    assert [x.varname for x in post_order([top]) if x.ast] == ["a", "b", "right", "left", "top"]
+
+
+def test_generate_deep_chain_conditionals():
+    # Conditionals generate the nodes needed ahead of the if block through the same walk, so chains through
+    # conditionals can be deeper than the recursion limit.
+    node = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    for idx in range(5_000):
+        test = ComparisonNode(f"test{idx}", ast.Gt, node, LiteralNode(f"zero{idx}", 0))
+        increment = BinOpNode(f"inc{idx}", ast.Add, node, LiteralNode(f"one{idx}", 1))
+        node = ConditionalNode(FunctionOpNode(f"if{idx}", excel_functions.IF,
+                                              [test, increment, LiteralNode(f"l{idx}", 0)]))
+    stmts = node.generate_ast_tree(set())
+    assert len(stmts) == 2 * 5_000  # comparison and if statement of each conditional.
+    assert isinstance(stmts[-1], ast.If) and stmts[-1].body[0].targets[0].id == "inc4999"
+
+
+def _assert_cached_below(node):
+    # every node of the graph with annotations has children with annotations, which invalidate relies on.
+    for current in _walk(node):
+        if current._annotations:
+            assert all(child._annotations for child in current.children), current
+
+
+def test_annotations_invalidated_after_temporaries():
+    # The count of temporaries is cached by a walk of its own, from the bottom up.
+    bottom = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    top = _diamonds(bottom, 5)
+    assert top.temporaries == 0
+    _assert_cached_below(top)
+
+    bottom.replace_in_graph(InputNode("array", Shape(10, 1), DataType.Number))
+    _assert_cached_below(top)
+    assert top.shape == Shape(10, 1)
+    assert top.temporaries == _diamonds(InputNode("fresh", Shape(10, 1), DataType.Number), 5).temporaries > 0
+
+
+def test_annotations_invalidated_after_clone():
+    # Clones keep the annotations of the original graph, only those of the clones above a replaced node are cleared.
+    bottom = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    top = _diamonds(bottom, 5)
+    assert top.temporaries == 0
+
+    clone, = clone_graph([top])
+    _assert_cached_below(clone)
+    clone_bottom = next(x for x in _walk(clone) if x.varname == "src")
+    clone_bottom.replace_in_graph(InputNode("array", Shape(10, 1), DataType.Number))
+    _assert_cached_below(clone)
+    assert clone.shape == Shape(10, 1)
+    assert clone.temporaries == _diamonds(InputNode("fresh", Shape(10, 1), DataType.Number), 5).temporaries > 0
+    assert top.shape == SCALAR_SHAPE and top.temporaries == 0
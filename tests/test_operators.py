@@ -1,6 +1,7 @@
 import openpyxl
 import pytest
 
+from xlnumba import Compiler
 from .util import get_param_from_sheet, default_test
 
 FILE_NAME = 'tests/fixtures/operators.xlsx'
@@ -16,3 +17,14 @@ def xls_sheet(request):
 @pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
 def test_operator(xls_sheet, sheet, row, expected_result, disable_numba):
     default_test(xls_sheet, sheet, row, expected_result, disable_numba=disable_numba)
+
+
+def test_negation_shared_operand():
+    # Negating a cell must not change the value of the cell for other formulas using it.
+    wb = openpyxl.Workbook()
+    wb.active["A1"] = 3
+    wb.active["B1"] = "=-A1 * A1"
+    ctx = Compiler(wb)
+    ctx.add_input("src", "A1")
+    ctx.add_output("dst", "B1")
+    assert ctx.compile(disable_numba=True, disable_optimizations=True)(src=3) == {'dst': -9}
@@ -0,0 +1,97 @@
+import ast
+
+import numpy as np
+import openpyxl
+import pytest
+
+from xlnumba import Compiler
+from xlnumba.nodes import LiteralNode, BinOpNode, IndexNode, InputNode, ArgumentArrayNode, wrap_output
+from xlnumba.optimizations import buffer_reuse
+from xlnumba.optimizations.buffer_reuse import working_set, plan_workspace
+from xlnumba.excel_reference import DataType
+from xlnumba.shape import Shape
+
+
+def _scaled(name="scaled"):
+    src = InputNode("src", Shape(50, 1), DataType.Number)
+    return BinOpNode(name, ast.Mult, src, LiteralNode("lit", 2.5))
+
+
+def test_buffer_reuse_operand():
+    # An operation writes in to the array of an operand nothing else uses.
+    scaled = _scaled()
+    top = BinOpNode("top", ast.Add, scaled, LiteralNode("l1", 1))
+    buffer_reuse([("dst", wrap_output("dst", top, top.shape))])
+
+    assert top.buffer is scaled
+    assert scaled.buffer is None  # inputs are never written to.
+
+
+def test_buffer_reuse_shared():
+    # An operand used by several operations is reused by the operation depending on all of the others.
+    scaled = _scaled()
+    shifted = BinOpNode("shifted", ast.Add, scaled, LiteralNode("l1", 1))
+    top = BinOpNode("top", ast.Mult, scaled, shifted)
+    buffer_reuse([("dst", wrap_output("dst", top, top.shape))])
+
+    assert shifted.buffer is None
+    assert top.buffer is scaled
+
+
+def test_buffer_reuse_view():
+    # Arrays which may be used through a view of the array are kept.
+    scaled = _scaled()
+    view = IndexNode("view", scaled, [[0, 50], [0, 1]])
+    top = BinOpNode("top", ast.Mult, scaled, view)
+    buffer_reuse([("dst", wrap_output("dst", top, top.shape))])
+
+    assert top.buffer is None
+
+
+def test_buffer_reuse_working_set():
+    # Each step of a chain writes over the array of the previous step, so only one array is alive at a time.
+    node = _scaled("step0")
+    for idx in range(1, 5):
+        node = BinOpNode(f"step{idx}", ast.Add, node, LiteralNode(f"l{idx}", 1))
+    graph = [("dst", wrap_output("dst", node, node.shape))]
+    assert working_set(graph) == 2 * 50 * 8  # each step reads the array of the step before it.
+
+    buffer_reuse(graph)
+    assert working_set(graph) == 50 * 8
+    assert working_set(graph, reuse=False) == 2 * 50 * 8
+
+
+def test_plan_workspace():
+    # Steps of a chain alternate between two arrays of the workspace, and the last step writes in to the output.
+    node = _scaled("step0")
+    for idx in range(1, 5):
+        node = BinOpNode(f"step{idx}", ast.Add, node, LiteralNode(f"l{idx}", 1))
+    output = wrap_output("dst", node, node.shape)
+    argument = ArgumentArrayNode("_out_dst", node.shape, 'float64')
+    workspace, written, allocating = plan_workspace([("dst", output)], {output: argument})
+
+    assert written == {output}
+    assert allocating == []
+    assert [x.varname for x in workspace] == ["_ws0", "_ws1"]
+    assert node.buffer.varname == "_out_dst"
+    assert node.children[0].buffer is workspace[1]
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_buffer_reuse_workbook(disable_numba):
+    # The fused loop computing D writes over the array of C, which isn't needed afterwards.
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["E1"] = 1
+    for row in range(1, 101):
+        ws[f"A{row}"] = row / 10
+        ws[f"C{row}"] = f"=A{row} * $E$1"
+        ws[f"D{row}"] = f"=C{row} + C{row} * C{row}"
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "E1")
+    ctx.add_output("result", "D1:D100")
+    assert "numpy.empty" not in ctx.generate_code(disable_numba=True)
+
+    scaled = np.arange(1, 101) / 10 * 3
+    result = ctx.compile(disable_numba=disable_numba)(scale=3)
+    assert result['result'] == pytest.approx(scaled + scaled * scaled)
@@ -1,8 +1,12 @@
 import ast
+import importlib
 
 import xlnumba.excel_functions as excel_functions
-from xlnumba.nodes import LiteralNode, FunctionOpNode, BinOpNode, ExcelArrayNode, IndexNode
-from xlnumba.shape import Shape
+from xlnumba.excel_reference import DataType
+from xlnumba.execution import get_execution_context
+from xlnumba.nodes import LiteralNode, FunctionOpNode, BinOpNode, ExcelArrayNode, IndexNode, InputNode, wrap_output
+from xlnumba.optimizations import collapse_literals
+from xlnumba.shape import Shape, SCALAR_SHAPE
 from ..util import get_collapsed_result
 
 
@@ -60,3 +64,28 @@ def test_collapse_index_element():
         ((1, 2), (0, 1))
     )
     assert get_collapsed_result(node) == 2
+
+
+def test_collapse_literals_single_evaluation(monkeypatch):
+    # Every static node used by the rest of the graph is evaluated in one context, arrays as well as scalars.
+    contexts = []
+
+    def counted_context():
+        contexts.append(get_execution_context())
+        return contexts[-1]
+    monkeypatch.setattr(importlib.import_module("xlnumba.optimizations.collapse_literals"), "get_execution_context",
+                        counted_context)
+
+    table = ExcelArrayNode("ar1", Shape(3, 1), [LiteralNode(f"tmp{idx}", idx) for idx in range(3)])
+    doubled = BinOpNode("doubled", ast.Mult, table, LiteralNode("two", 2))
+    total = FunctionOpNode("total", excel_functions.SUM, [doubled])
+    src = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    graph = [("a", wrap_output("a", BinOpNode("a", ast.Add, total, src))),
+             ("b", wrap_output("b", BinOpNode("b", ast.Mult, doubled, src), Shape(3, 1)))]
+    collapse_literals(graph)
+
+    assert len(contexts) == 1
+    a, b = graph[0][1].top, graph[1][1].top
+    assert isinstance(a.left, LiteralNode) and a.left.value == 6
+    assert isinstance(b.left, LiteralNode) and b.left.value.tolist() == [[0], [2], [4]]
+    assert b.right is src
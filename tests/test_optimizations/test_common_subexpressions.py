@@ -0,0 +1,73 @@
+import ast
+
+import openpyxl
+import pytest
+
+import xlnumba.excel_functions as excel_functions
+from xlnumba import Compiler
+from xlnumba.nodes import LiteralNode, FunctionOpNode, BinOpNode, InputNode, wrap_output
+from xlnumba.optimizations import common_subexpressions
+from xlnumba.excel_reference import DataType
+from xlnumba.shape import SCALAR_SHAPE
+
+
+def test_common_subexpressions_merge():
+    # Equal calculations on the same inputs are merged, and the merge is carried up to their parents.
+    src = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    left = FunctionOpNode("left", excel_functions.ABS, [BinOpNode("l1", ast.Add, src, LiteralNode("l2", 1))])
+    right = FunctionOpNode("right", excel_functions.ABS, [BinOpNode("r1", ast.Add, src, LiteralNode("r2", 1))])
+    top = BinOpNode("top", ast.Mult, left, right)
+    common_subexpressions([("dst", wrap_output("dst", top))])
+
+    assert top.left is top.right
+    assert top.left.parents_set() == {top}
+    assert src.parents_set() == {top.left.children[0]}
+
+
+def test_common_subexpressions_distinct():
+    # Calculations differing in their operator or literal values are kept.
+    src = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    add = BinOpNode("add", ast.Add, src, LiteralNode("l1", 1))
+    sub = BinOpNode("sub", ast.Sub, src, LiteralNode("l2", 1))
+    flt = BinOpNode("flt", ast.Add, src, LiteralNode("l3", 1.5))
+    top = FunctionOpNode("top", excel_functions.SUM, [add, sub, flt])
+    common_subexpressions([("dst", wrap_output("dst", top))])
+
+    assert len({id(x) for x in top.children}) == 3
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_common_subexpressions_workbook(disable_numba):
+    # The same aggregate repeated in many cells is only calculated once.
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, 51):
+        ws[f"A{row}"] = row
+        ws[f"B{row}"] = f"=A{row} / SUM($A$1:$A$50)"
+        ws[f"D{row}"] = f"=B{row} * SUM($A$1:$A$50)"
+    ws["C1"] = "=B5 + B7 + D9"
+    ctx = Compiler(wb)
+    ctx.add_input("value", "A1")
+    ctx.add_output("total", "C1")
+    assert ctx.generate_code(disable_numba=True).count("numpy.sum") == 1
+
+    total = sum(range(2, 51)) + 10
+    assert ctx.compile(disable_numba=disable_numba)(value=10) == {'total': pytest.approx(12 / total + 9)}
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_common_subexpressions_blank_cells(disable_numba):
+    # Blank cells of overlapping ranges are merged in to a single literal, used several times by each array.
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 1
+    ws["B1"] = "=A1+1"
+    ws["B3"] = "=A1*2"
+    ws["B5"] = "=A1*3"
+    ws["C1"] = "=SUM(B1:B5)"
+    ws["C2"] = "=SUM(B3:B5)"
+    ws["C3"] = "=C1+C2"
+    ctx = Compiler(wb)
+    ctx.add_input("value", "A1")
+    ctx.add_output("total", "C3")
+    assert ctx.compile(disable_numba=disable_numba)(value=2) == {'total': 23}
@@ -0,0 +1,159 @@
+import ast
+
+import numpy as np
+import openpyxl
+import pytest
+
+import xlnumba.excel_functions as excel_functions
+from xlnumba import Compiler
+from xlnumba.nodes import LiteralNode, FunctionOpNode, BinOpNode, ComparisonNode, InputNode, wrap_output
+from xlnumba.optimizations import fuse_elementwise
+from xlnumba.optimizations.fuse_elementwise import FusedNode
+from xlnumba.excel_reference import DataType
+from xlnumba.shape import Shape
+
+
+def test_fuse_elementwise_chain():
+    # A chain of operations on arrays is computed by a single node, using the arrays and literals as inputs.
+    src = InputNode("src", Shape(50, 1), DataType.Number)
+    other = InputNode("other", Shape(50, 1), DataType.Number)
+    scale = LiteralNode("scale", 2)
+    sin = FunctionOpNode("sin", excel_functions.SIN, [src])
+    add = BinOpNode("add", ast.Add, BinOpNode("mult", ast.Mult, sin, scale), other)
+    top = FunctionOpNode("top", excel_functions.ABS, [add])
+    output = wrap_output("dst", top, top.shape)
+    fuse_elementwise([("dst", output)])
+
+    fused = output.children[0]
+    assert isinstance(fused, FusedNode)
+    assert fused.children == [src, scale, other]
+    assert src.parents_set() == {fused}
+    assert other.parents_set() == {fused}
+
+
+def test_fuse_elementwise_shared():
+    # Arrays used by more than one operation are computed ahead of the group using them.
+    src = InputNode("src", Shape(50, 1), DataType.Number)
+    shared = BinOpNode("shared", ast.Mult, src, LiteralNode("l1", 2))
+    add = BinOpNode("add", ast.Add, shared, LiteralNode("l2", 1))
+    sub = BinOpNode("sub", ast.Sub, shared, LiteralNode("l3", 1))
+    top = BinOpNode("top", ast.Mult, add, sub)
+    output = wrap_output("dst", top, top.shape)
+    fuse_elementwise([("dst", output)])
+
+    fused = output.children[0]
+    assert isinstance(fused, FusedNode)
+    assert shared in fused.children and src not in fused.children
+    assert shared.parents_set() == {fused}
+
+
+def test_fuse_elementwise_conditional():
+    # IF is computed element by element within the group, with the comparison it tests.
+    src = InputNode("src", Shape(1, 20), DataType.Number)
+    test = ComparisonNode("test", ast.Gt, src, LiteralNode("l1", 0))
+    double = BinOpNode("double", ast.Mult, src, LiteralNode("l2", 2))
+    top = FunctionOpNode("top", excel_functions.IF, [test, double, LiteralNode("l3", 0)])
+    output = wrap_output("dst", top, top.shape)
+    fuse_elementwise([("dst", output)])
+
+    fused = output.children[0]
+    assert isinstance(fused, FusedNode)
+    assert fused.expression[0] == 'condition'
+    assert src.parents_set() == {fused}
+
+
+def test_fuse_elementwise_declared_shape():
+    # SQRT is declared a single number but returns an array for a range, so operations using it aren't fused as the
+    # loop would read it as a single number.
+    src = InputNode("src", Shape(10, 1), DataType.Number)
+    sqrt = FunctionOpNode("sqrt", excel_functions.SQRT, [src])
+    add = BinOpNode("add", ast.Add, BinOpNode("mult", ast.Mult, src, LiteralNode("l1", 2)), sqrt)
+    top = FunctionOpNode("top", excel_functions.ABS, [add])
+    output = wrap_output("dst", top, top.shape)
+    fuse_elementwise([("dst", output)])
+
+    assert output.children == [top]
+    assert add.children[1] is sqrt and not isinstance(add.children[0], FusedNode)
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_fuse_elementwise_workbook(disable_numba):
+    # A filled down formula is computed by a single loop, without arrays for each operation in the formula.
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["E1"] = 1
+    for row in range(1, 101):
+        ws[f"A{row}"] = row / 10
+        ws[f"B{row}"] = row
+        ws[f"C{row}"] = f"=ABS(SIN(A{row} * $E$1) * 2 - B{row})"
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "E1")
+    ctx.add_output("result", "C1:C100")
+    code = ctx.generate_code(disable_numba=True)
+    assert code.count("for ") == 2  # loops over the rows and columns of the block.
+    assert code.count("numpy.empty") == 1
+
+    a, b = np.arange(1, 101) / 10, np.arange(1, 101)
+    expected = np.abs(np.sin(a * 3) * 2 - b)
+    result = ctx.compile(disable_numba=disable_numba)(scale=3)
+    assert result['result'] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_fuse_elementwise_integers(disable_numba):
+    # Operations on integers give integers, as the unfused operations on integer arrays do.
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["D1"] = 3
+    for row in range(1, 6):
+        ws[f"A{row}"] = row
+    ws["E1"] = "=SUM(ABS(A1:A5*$D$1+1))"
+    ws["F1"] = "=SUM(IF(A1:A5>2,A1:A5*$D$1,0.5))"
+
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "D1")
+    ctx.add_output("total", "E1")
+    assert "for " in ctx.generate_code(disable_numba=True)
+    for disable_optimizations in (False, True):
+        total = ctx.compile(disable_numba=disable_numba, disable_optimizations=disable_optimizations)(scale=3)['total']
+        assert total == 50 and isinstance(total, (int, np.integer))
+
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "D1")
+    ctx.add_output("mixed", "F1")
+    mixed = ctx.compile(disable_numba=disable_numba)(scale=3)['mixed']
+    assert mixed == 37 and isinstance(mixed, float)
+
+
+def test_fuse_elementwise_deep_chain():
+    # Inputs of fused nodes are generated by the same walk as other nodes, so chains through fused nodes can be deeper
+    # than the recursion limit.
+    node = InputNode("src", Shape(3, 1), DataType.Number)
+    for idx in range(5_000):
+        node = FusedNode(f"fused{idx}", Shape(3, 1), DataType.Number, [node], [Shape(3, 1)],
+                         ('binop', ast.Add, ('input', 0), ('input', 0)), 'float64')
+    stmts = node.generate_ast_tree(set())
+    assert len(stmts) == 2 * 5_000  # allocation and loop of each fused node.
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_fuse_elementwise_divide_by_zero(disable_numba):
+    # Dividing by zero within the loop gives inf or nan as the unfused operations on arrays do, rather than raising.
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 1
+    for row in range(1, 11):
+        ws[f"B{row}"] = row - 1
+    ws["C1"] = "=SUM(ABS(SIN(B1:B10)*2+B1:B10)/(B1:B10+A1))"
+    ws["D1"] = "=SUM((B1:B10*2+A1)^(A1-1))"
+
+    results = []
+    for disable_optimizations in (False, True):
+        ctx = Compiler(wb)
+        ctx.add_input("a", "A1")
+        ctx.add_output("divide", "C1")
+        ctx.add_output("power", "D1")
+        results.append(ctx.compile(disable_numba=disable_numba, disable_optimizations=disable_optimizations)(a=0.0))
+    fused, unfused = results
+    assert np.isnan(fused['divide']) and np.isnan(unfused['divide'])
+    assert fused['power'] == unfused['power'] == np.inf
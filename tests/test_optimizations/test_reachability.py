@@ -0,0 +1,49 @@
+import ast
+
+from xlnumba.nodes import LiteralNode, BinOpNode, InputNode
+from xlnumba.optimizations.reachability import ReachabilityIndex
+from xlnumba.excel_reference import DataType
+from xlnumba.shape import SCALAR_SHAPE
+
+
+def _diamonds(count):
+    # each level uses the level below it twice, so there are 2 ** count paths from the top to the bottom.
+    bottom = node = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    levels = []
+    for idx in range(count):
+        left = BinOpNode(f"left{idx}", ast.Add, node, LiteralNode(f"l{idx}", 1))
+        right = BinOpNode(f"right{idx}", ast.Mult, node, LiteralNode(f"r{idx}", 2))
+        node = BinOpNode(f"level{idx}", ast.Add, left, right)
+        levels.append(node)
+    return bottom, levels
+
+
+def test_reachability_diamonds():
+    # Queries don't walk the paths through the graph.
+    bottom, levels = _diamonds(200)
+    index = ReachabilityIndex([levels[-1]], [levels[10], levels[-1]])
+
+    assert index.position[bottom] == 0
+    assert all(index.position[x] < index.position[y] for x, y in zip(levels, levels[1:]))
+    assert index.below(bottom, [levels[10]])
+    assert index.below(levels[5], [levels[10]])
+    assert not index.below(levels[10], [levels[10]])
+    assert not index.below(levels[50], [levels[10]])
+    assert index.below(levels[50], [levels[10], levels[-1]])
+    assert bottom.depends_on([levels[-1]])
+
+
+def test_reachability_add_dependents():
+    # Replacing a node adds its dependents to the nodes used by the replacement.
+    bottom, levels = _diamonds(5)
+    other = BinOpNode("other", ast.Add, InputNode("other_src", SCALAR_SHAPE, DataType.Number), LiteralNode("l", 1))
+    top = BinOpNode("top", ast.Add, levels[-1], other)
+    index = ReachabilityIndex([top], [top])
+    assert index.below(levels[2], [top])
+    assert index.below(other, [top])
+
+    index = ReachabilityIndex([levels[-1]], [levels[-1]])
+    assert not index.below(other, [levels[-1]])
+    index.add_dependents(other, levels[0])  # i.e. levels[0] replaced by a node using other.
+    assert index.below(other, [levels[-1]])
+    assert index.below(other.children[0], [levels[-1]])
@@ -0,0 +1,92 @@
+import ast
+
+import openpyxl
+import pytest
+
+import xlnumba.excel_functions as excel_functions
+from xlnumba import Compiler
+from xlnumba.excel_reference import DataType
+from xlnumba.nodes import LiteralNode, FunctionOpNode, BinOpNode, ComparisonNode, InputNode, wrap_output
+from xlnumba.optimizations import simplify_arithmetic
+from xlnumba.shape import Shape, SCALAR_SHAPE
+
+
+def _simplify(node):
+    out_node = wrap_output("dst", node, node.shape)
+    simplify_arithmetic([("dst", out_node)])
+    return out_node.top
+
+
+def _negate(node):
+    return BinOpNode(node.varname + "_neg", ast.Mult, node, LiteralNode(node.varname + "_m", -1))
+
+
+@pytest.mark.parametrize("shape", [SCALAR_SHAPE, Shape(3, 1)], ids=['scalar', 'array'])
+def test_simplify_identities(shape):
+    # Adding zero, multiplying by one and raising to one are removed.
+    src = InputNode("src", shape, DataType.Number)
+    node = BinOpNode("add", ast.Add, LiteralNode("l1", 0), src)
+    node = BinOpNode("mult", ast.Mult, node, LiteralNode("l2", 1))
+    node = BinOpNode("pow", ast.Pow, node, LiteralNode("l3", 1))
+    assert _simplify(node) is src
+    assert len(src.parents_set()) == 1
+
+
+def test_simplify_identities_types():
+    # Identities with floats or booleans change the type of the result so are kept.
+    src = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    node = BinOpNode("mult", ast.Mult, src, LiteralNode("l1", 1.0))
+    assert _simplify(node) is node
+
+    cmp = ComparisonNode("cmp", ast.Gt, src, LiteralNode("l2", 0))
+    node = BinOpNode("mult", ast.Mult, cmp, LiteralNode("l3", 1))
+    assert _simplify(node) is node
+
+
+def test_simplify_negation():
+    # Negated values are subtracted rather than multiplied by -1 and added.
+    left = InputNode("left", SCALAR_SHAPE, DataType.Number)
+    right = InputNode("right", SCALAR_SHAPE, DataType.Number)
+    node = _simplify(BinOpNode("add", ast.Add, left, _negate(right)))
+    assert node.operator is ast.Sub and node.left is left and node.right is right
+
+    node = _simplify(BinOpNode("mult", ast.Mult, _negate(left), _negate(right)))
+    assert node.operator is ast.Mult and node.left is left and node.right is right
+
+
+def test_simplify_power():
+    # Integer powers are expanded in to multiplications, reusing the squares.
+    src = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    node = _simplify(BinOpNode("pow", ast.Pow, src, LiteralNode("l1", 5)))
+    assert node.operator is ast.Mult and node.right is src
+    square = node.left
+    assert square.left is square.right and square.left.left is src
+
+    node = _simplify(FunctionOpNode("sqrt", excel_functions.POWER, [src, LiteralNode("l2", 0.5)]))
+    assert node.excel_name == 'INTERNAL_SQRT'
+
+
+def test_simplify_division():
+    # Only divisions which give exactly the same result as the multiplication are changed.
+    src = InputNode("src", SCALAR_SHAPE, DataType.Number)
+    node = _simplify(BinOpNode("div", ast.Div, src, LiteralNode("l1", 4)))
+    assert node.operator is ast.Mult and node.right.value == 0.25
+
+    node = _simplify(BinOpNode("div", ast.Div, src, LiteralNode("l2", 10)))
+    assert node.operator is ast.Div
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_simplify_workbook(disable_numba):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 3
+    ws["B1"] = "=-A1 + A1 * 2 - -A1 + A1 ^ 3 + A1 / 4 + POWER(A1, 2) * 1 + 0 + (-A1) * 3"
+    ctx = Compiler(wb)
+    ctx.add_input("value", "A1")
+    ctx.add_output("dst", "B1")
+    code = ctx.generate_code(disable_numba=True)
+    assert "**" not in code and "/" not in code and "-1" not in code
+
+    expected = -5 + 5 * 2 + 5 + 5 ** 3 + 5 / 4 + 5 ** 2 - 5 * 3
+    assert ctx.compile(disable_numba=disable_numba)(value=5)['dst'] == pytest.approx(expected)
@@ -0,0 +1,71 @@
+import ast
+
+import openpyxl
+import pytest
+
+from xlnumba import Compiler
+from xlnumba.partition import ast_partitioned_body, partition_statements
+
+
+def _workbook(rows=100):
+    # formulas differ on each row so they aren't compiled as a recurrence, giving one statement per cell.
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws['A1'] = 1.0
+    for row in range(2, rows + 1):
+        ws[f'A{row}'] = f'=A{row - 1}*1.01+{row}'
+        ws[f'B{row}'] = f'=A{row}+A{row // 2 + 1}*{row}'
+    ws['C1'] = f'=SUM(B2:B{rows})'
+    return wb
+
+
+def _compiler(wb, cache_dir=None):
+    ctx = Compiler(wb, cache_dir=cache_dir)
+    ctx.add_input("src", "A1")
+    ctx.add_output("total", "C1")
+    ctx.add_output("last", "A100")
+    return ctx
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_partition(disable_numba):
+    wb = _workbook()
+    expected = _compiler(wb).compile(disable_numba=True)(src=2.0)
+    result = _compiler(wb).compile(disable_numba=disable_numba, partition=20)(src=2.0)
+    assert result == pytest.approx(expected)
+
+    code = _compiler(wb).generate_code(disable_numba=True)
+    assert "_part_" not in code
+
+
+def test_partition_cache(tmp_path):
+    # Each helper is a module of its own, an edit only writes the modules of the helpers whose code changed.
+    wb = _workbook()
+    _compiler(wb, tmp_path).compile(disable_numba=True, partition=20)
+    parts = set(tmp_path.glob("xlnumba_*_part_*.py"))
+    assert len(parts) > 5
+
+    wb.active['A80'] = '=A79*1.02+80'
+    expected = _compiler(wb).compile(disable_numba=True)(src=2.0)
+    result = _compiler(wb, tmp_path).compile(disable_numba=True, partition=20)(src=2.0)
+    assert result == pytest.approx(expected)
+    assert len(set(tmp_path.glob("xlnumba_*_part_*.py")) - parts) == 1
+
+
+def test_partition_live_variables():
+    body = ast.parse("a = x + 1\nb = a * 2\nc = b + a\nd = c - x\nreturn {'d': d, 'b': b}").body
+    helpers, calls = ast_partitioned_body("fn", body, ["x"], 2, [], [])
+    assert [[x.arg for x in helper.args.args] for helper in helpers] == [["x"], ["a"], ["b", "a"], ["c", "x"]]
+    assert [[x.id for x in call.targets[0].elts] for call in calls[:-1]] == [["a"], ["b"], ["c"], ["d"]]
+    assert isinstance(calls[-1], ast.Return)
+
+
+def test_partition_boundaries():
+    # Boundaries don't move when a statement is added ahead of them.
+    statements = ast.parse("\n".join(f"v{idx} = {idx}" for idx in range(200))).body
+    chunks = partition_statements(statements, 10)
+    assert all(5 <= len(x) <= 20 for x in chunks[:-1])
+
+    edited = partition_statements(statements[:3] + ast.parse("extra = 1").body + statements[3:], 10)
+    assert len(edited[0]) == len(chunks[0]) + 1
+    assert [[ast.dump(y) for y in x] for x in edited[1:]] == [[ast.dump(y) for y in x] for x in chunks[1:]]
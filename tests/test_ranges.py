@@ -63,3 +63,110 @@ def test_return_1d_range_partial(xls_sheet):
     result = fn(src=3)
     expected_result = [8, 14, 20, 26, 32]
     assert (result['dst'] == expected_result).all()
+
+
+def _constant_range_workbook():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, 101):
+        ws[f"A{row}"] = row
+    ws["A50"] = None
+    ws["B1"] = "=SUM(A1:A100)*C1"
+    ws["C1"] = 1
+    return wb
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_constant_range(disable_numba):
+    """ Ranges of constants are built as a single array, rather than a node per cell. """
+    ctx = Compiler(_constant_range_workbook())
+    ctx.add_input("src", "C1")
+    ctx.add_output("dst", "B1")
+    code = ctx.generate_code(disable_numba=True, disable_optimizations=True)
+    assert "sheet_a99" not in code
+    assert ctx.compile(disable_numba=disable_numba)(src=2) == {'dst': 2 * (5050 - 50)}
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_constant_range_hoisted(disable_numba):
+    """ Constant arrays are globals of the module, built once rather than on every call. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, 51):
+        ws[f"A{row}"] = row
+        ws[f"B{row}"] = row * 1.5
+    ws["D1"] = 3
+    ws["E1"] = "=VLOOKUP(D1, A1:B50, 2)"
+    ctx = Compiler(wb)
+    ctx.add_input("key", "D1")
+    ctx.add_output("value", "E1")
+    for disable_optimizations in [False, True]:
+        code = ctx.generate_code(disable_numba=True, disable_optimizations=disable_optimizations)
+        body = code[code.index("def compiled_function"):]
+        assert "numpy.array" in code and "numpy.array" not in body
+
+    fn = ctx.compile(disable_numba=disable_numba)
+    assert fn(key=3) == {'value': 4.5}
+    assert fn(key=20) == {'value': 30}
+
+
+def test_constant_range_with_input():
+    """ Input cells within a range override their value, so the range can't be constant. """
+    ctx = Compiler(_constant_range_workbook())
+    ctx.add_input("src", "A2")
+    ctx.add_output("dst", "B1")
+    assert ctx.compile(disable_numba=True)(src=1002) == {'dst': 5050 - 50 + 1000}
+
+
+def _formula_block_workbook():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, 101):
+        ws[f"A{row}"] = row
+        ws[f"B{row}"] = f"=ABS(A{row} - 50) * $D$1 + 1"
+        ws[f"{openpyxl.utils.get_column_letter(row)}201"] = row
+        ws[f"{openpyxl.utils.get_column_letter(row)}202"] = f"={openpyxl.utils.get_column_letter(row)}201 * 2 - 1"
+    ws["C1"] = "=SUM(B1:B100)"
+    ws["C2"] = "=SUM(A202:CV202)"
+    ws["D1"] = 2
+    return wb
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_formula_block(disable_numba):
+    """ Formulas filled down a column or across a row are built as one array expression, not a node per cell. """
+    ctx = Compiler(_formula_block_workbook())
+    ctx.add_input("scale", "D1")
+    ctx.add_output("column", "C1")
+    ctx.add_output("row", "C2")
+    code = ctx.generate_code(disable_numba=True, disable_optimizations=True)
+    assert "sheet_b50" not in code
+    assert "sheet_a50" not in code
+    assert "sheet_bz202" not in code
+    expected = sum(abs(row - 50) * 3 + 1 for row in range(1, 101)), sum(row * 2 - 1 for row in range(1, 101))
+    assert ctx.compile(disable_numba=disable_numba)(scale=3) == {'column': expected[0], 'row': expected[1]}
+
+
+def test_formula_block_fallback():
+    """
+    Ranges with differing formulas are built cell by cell, ranges which depend on previous cells of the range are
+    built by a loop over the range (see test_recurrence.py).
+    """
+    wb = _formula_block_workbook()
+    ws = wb.active
+    for row in range(2, 101):
+        ws[f"E{row}"] = f"=E{row - 1} + A{row}"
+    ws["E1"] = "=A1"
+    ws["B50"] = "=A50 * 100"
+    ws["C3"] = "=SUM(E1:E100)"
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "D1")
+    ctx.add_output("column", "C1")
+    ctx.add_output("running", "C3")
+    code = ctx.generate_code(disable_numba=True, disable_optimizations=True)
+    assert "sheet_b49" in code
+    assert "sheet_e99" not in code
+    assert "for " in code
+    expected = sum(abs(row - 50) * 3 + 1 for row in range(1, 101) if row != 50) + 5000
+    assert ctx.compile(disable_numba=True)(scale=3) == {
+        'column': expected, 'running': sum(sum(range(1, row + 1)) for row in range(1, 101))}
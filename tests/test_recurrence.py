@@ -0,0 +1,169 @@
+import numpy
+import openpyxl
+import pytest
+from openpyxl.utils import get_column_letter
+
+from xlnumba import Compiler
+
+
+def _balance_workbook(periods=100):
+    """ Balance carried forward each period, C = previous balance with interest less the payment in D. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["B1"] = 0.05
+    ws["C2"] = 1000
+    for row in range(3, periods + 3):
+        ws[f"D{row}"] = row
+        ws[f"C{row}"] = f"=C{row - 1} * (1 + $B$1) - D{row}"
+    ws["E1"] = f"=SUM(C2:C{periods + 2})"
+    return wb
+
+
+def _balances(rate, periods=100):
+    balances = [1000]
+    for row in range(3, periods + 3):
+        balances.append(balances[-1] * (1 + rate) - row)
+    return balances
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_recurrence(disable_numba):
+    """ Cells depending on the previous cells of their column are computed by a single loop. """
+    ctx = Compiler(_balance_workbook())
+    ctx.add_input("rate", "B1")
+    ctx.add_output("last", "C102")
+    ctx.add_output("total", "E1")
+    code = ctx.generate_code(disable_numba=True)
+    assert "for " in code
+    assert "sheet_c50" not in code
+
+    balances = _balances(0.1)
+    result = ctx.compile(disable_numba=disable_numba)(rate=0.1)
+    assert result['last'] == pytest.approx(balances[-1])
+    assert result['total'] == pytest.approx(sum(balances))
+
+
+def test_recurrence_coupled():
+    """ Columns depending on each other are computed by the same loop, in the order they depend on each other. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["B1"] = 0.1
+    ws["B2"] = 50
+    ws["C2"] = 1000
+    for row in range(3, 51):
+        ws[f"D{row}"] = f"=C{row - 1} * $B$1"
+        ws[f"C{row}"] = f"=C{row - 1} + D{row} - $B$2"
+    ws["E1"] = "=SUM(D3:D50)"
+    ctx = Compiler(wb)
+    ctx.add_input("rate", "B1")
+    ctx.add_output("balance", "C50")
+    ctx.add_output("interest", "E1")
+    code = ctx.generate_code(disable_numba=True)
+    assert code.count("for ") == 1
+
+    balance, interest = 1000, []
+    for _ in range(3, 51):
+        interest.append(balance * 0.2)
+        balance += interest[-1] - 50
+    result = ctx.compile(disable_numba=True)(rate=0.2)
+    assert result['balance'] == pytest.approx(balance)
+    assert result['interest'] == pytest.approx(sum(interest))
+
+
+def test_recurrence_horizontal():
+    """ Recurrences across a row, using the two previous cells. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 1
+    ws["B2"] = 1
+    ws["C2"] = 1
+    for col in range(4, 40):
+        ws[f"{get_column_letter(col)}2"] = f"={get_column_letter(col - 1)}2 * $A$1 + {get_column_letter(col - 2)}2"
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "A1")
+    ctx.add_output("last", f"{get_column_letter(39)}2")
+    assert "for " in ctx.generate_code(disable_numba=True)
+
+    values = [1, 1]
+    for _ in range(4, 40):
+        values.append(values[-1] * 2 + values[-2])
+    assert ctx.compile(disable_numba=True)(scale=2) == {'last': pytest.approx(values[-1])}
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_recurrence_integer(disable_numba):
+    """ Recurrences of integers keep their integer type, while any other operation gives floats. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 1
+    ws["B1"] = 1
+    ws["C1"] = 2
+    for row in range(2, 15):
+        ws[f"A{row}"] = f"=A{row - 1} * 4 + 1"
+        ws[f"B{row}"] = f"=B{row - 1} / 2 + 1"
+    ws["D1"] = "=A14 * C1"
+
+    # numba returns a typed dict, so integer and float outputs are compiled separately.
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "C1")
+    ctx.add_output("integer", "A14")
+    ctx.add_output("scaled", "D1")
+    assert "for " in ctx.generate_code(disable_numba=True)
+    result = ctx.compile(disable_numba=disable_numba)(scale=2)
+    assert result['integer'] == 89478485 and isinstance(result['integer'], (int, numpy.integer))
+    assert result['scaled'] == 2 * 89478485
+
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "C1")
+    ctx.add_output("float", "B14")
+    assert "for " in ctx.generate_code(disable_numba=True)
+    assert isinstance(ctx.compile(disable_numba=disable_numba)(scale=2)['float'], float)
+
+
+def test_recurrence_input_fallback():
+    """ Inputs replace the formula in their cell, so a column with an input in it is built cell by cell. """
+    ctx = Compiler(_balance_workbook())
+    ctx.add_input("balance", "C50")
+    ctx.add_output("last", "C102")
+    code = ctx.generate_code(disable_numba=True)
+    assert "for " not in code
+
+    balance = 500
+    for row in range(51, 103):
+        balance = balance * 1.05 - row
+    assert ctx.compile(disable_numba=True)(balance=500) == {'last': pytest.approx(balance)}
+
+
+def test_recurrence_circular_fallback():
+    """ Cells of the recurrence used by the references the recurrence depends on are built cell by cell. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    other = wb.create_sheet("Other")
+    ws["A1"] = 1
+    ws["B1"] = 1
+    for row in range(2, 30):
+        ws[f"A{row}"] = f"=A{row - 1} + Other!A{row} * $B$1"
+        other[f"A{row}"] = f"=Sheet!A{row - 1} * 0.5"
+    ctx = Compiler(wb)
+    ctx.add_input("scale", "B1")
+    ctx.add_output("last", "A29")
+
+    value = 1
+    for _ in range(2, 30):
+        value += value * 0.5 * 3
+    assert ctx.compile(disable_numba=True)(scale=3) == {'last': pytest.approx(value)}
+
+
+def test_recurrence_incremental():
+    """ Editing a cell of the recurrence rebuilds the loop. """
+    wb = _balance_workbook()
+    ctx = Compiler(wb)
+    ctx.add_input("rate", "B1")
+    ctx.add_output("last", "C102")
+    assert ctx.compile(disable_numba=True)(rate=0.1) == {'last': pytest.approx(_balances(0.1)[-1])}
+
+    wb.active["C2"] = 2000
+    balance = 2000
+    for row in range(3, 103):
+        balance = balance * 1.1 - row
+    assert ctx.compile(disable_numba=True)(rate=0.1) == {'last': pytest.approx(balance)}
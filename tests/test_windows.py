@@ -0,0 +1,116 @@
+import numpy as np
+import openpyxl
+import pytest
+from openpyxl.utils import get_column_letter
+
+from xlnumba import Compiler
+from xlnumba.runtime.window import sliding_sum
+
+
+def _window_workbook(rows=60):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(2, rows + 2):
+        ws[f"B{row}"] = row * 1.5
+        ws[f"C{row}"] = f"=SUM($B$2:B{row})"
+        if row >= 5:
+            ws[f"D{row}"] = f"=AVERAGE(B{row - 3}:B{row})"
+            ws[f"E{row}"] = f"=MIN(B{row - 3}:B{row})"
+    return wb
+
+
+def _source(value, rows=60):
+    source = np.array([row * 1.5 for row in range(2, rows + 2)])
+    source[8] = value  # B10
+    return source
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+def test_windows(disable_numba):
+    """ Running totals and moving aggregates filled down a column are computed by a single pass. """
+    wb = _window_workbook()
+    wb.active["F1"] = "=C61 + C20 + SUM(D5:D61) + E10"
+    ctx = Compiler(wb)
+    ctx.add_input("value", "B10")
+    ctx.add_output("result", "F1")
+    code = ctx.generate_code(disable_numba=True)
+    assert "expanding_sum" in code and "sliding_average" in code and "sliding_min" in code
+    assert "sheet_c30" not in code
+
+    source = _source(100)
+    averages = [source[i - 3:i + 1].mean() for i in range(3, 60)]
+    expected = source.sum() + source[:19].sum() + sum(averages) + source[5:9].min()
+    assert ctx.compile(disable_numba=disable_numba)(value=100)['result'] == pytest.approx(expected)
+
+
+def test_windows_horizontal():
+    """ Windows along a row. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for col in range(1, 31):
+        ws.cell(1, col).value = col % 7
+        if col >= 3:
+            ws.cell(2, col).value = f"=MAX({get_column_letter(col - 2)}1:{get_column_letter(col)}1)"
+    ctx = Compiler(wb)
+    ctx.add_input("value", "D1")
+    ctx.add_output("result", "C2:AD2")
+    assert "sliding_max" in ctx.generate_code(disable_numba=True)
+
+    source = np.array([col % 7 for col in range(1, 31)])
+    source[3] = 10
+    expected = [source[i - 2:i + 1].max() for i in range(2, 30)]
+    np.testing.assert_allclose(ctx.compile(disable_numba=True)(value=10)['result'], expected)
+
+
+def test_windows_input_fallback():
+    """ Inputs replace the formula in their cell, so a block with an input in it is built cell by cell. """
+    wb = _window_workbook()
+    wb.active["F1"] = "=C30 + C40"
+    ctx = Compiler(wb)
+    ctx.add_input("total", "C30")
+    ctx.add_output("result", "F1")
+    assert "expanding_sum" not in ctx.generate_code(disable_numba=True)
+    assert ctx.compile(disable_numba=True)(total=0)['result'] == pytest.approx(1.5 * sum(range(2, 41)))
+
+
+def test_windows_blank_fallback():
+    """ Blank cells are ignored by Excel's aggregates, so windows over blank cells are built cell by cell. """
+    wb = _window_workbook()
+    wb.active["B30"] = None
+    ctx = Compiler(wb)
+    ctx.add_input("value", "B10")
+    ctx.add_output("result", "D40")
+    assert "sliding_average" not in ctx.generate_code(disable_numba=True)
+
+
+def test_windows_circular_fallback():
+    """ Cells of the block used by the source of the windows are built cell by cell. """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = 0.5
+    ws["C1"] = 0
+    for row in range(2, 30):
+        ws[f"B{row}"] = f"=C{row - 1} * $A$1 + 1"
+        ws[f"C{row}"] = f"=SUM($B$2:B{row})"
+    ctx = Compiler(wb)
+    ctx.add_input("rate", "A1")
+    ctx.add_output("result", "C29")
+
+    total = 0
+    for _ in range(2, 30):
+        total += total * 0.25 + 1
+    assert ctx.compile(disable_numba=True)(rate=0.25)['result'] == pytest.approx(total)
+
+
+@pytest.mark.parametrize("disable_numba", [True, False], ids=['python', 'numba'])
+@pytest.mark.parametrize("source", [
+    np.array([1e16, 1, 1, 1, 1, 1e-3, 1e16, 2, 3, 4]),
+    np.random.default_rng(0).random(200) * 10.0 ** np.random.default_rng(1).integers(-3, 17, 200),
+    np.array([1, 2, np.inf, 3, 4, 5, -np.inf, 6, 7, 8, np.nan, 9, 10, 11, 12]),
+], ids=['mixed', 'random', 'infinite'])
+@pytest.mark.parametrize("size", [2, 3, 5])
+def test_sliding_sum_kernel(disable_numba, source, size):
+    """ Running totals don't build up rounding errors, or carry infinities past the windows containing them. """
+    fn = sliding_sum.py_func if disable_numba else sliding_sum
+    expected = [np.sum(source[i:i + size]) for i in range(source.size - size + 1)]
+    np.testing.assert_allclose(fn(source.reshape((1, -1)), size)[0], expected, rtol=1e-12)
@@ -0,0 +1,73 @@
+import glob
+import io
+
+import openpyxl
+import pytest
+
+from xlnumba import Compiler
+from xlnumba.xlsx_reader import load_workbook, XlsxWorksheet
+from .util import get_param_from_sheet
+
+RANGES_FILE_NAME = 'tests/fixtures/ranges.xlsx'
+
+
+@pytest.mark.parametrize("file_name", sorted(glob.glob('tests/fixtures/*.xlsx')))
+def test_reader_matches_openpyxl(file_name):
+    """ Every cell must have the same value and data type as openpyxl's editable mode. """
+    expected = openpyxl.load_workbook(file_name, rich_text=True)
+    wb = load_workbook(file_name)
+
+    assert wb.sheetnames == expected.sheetnames
+    assert wb.active.title == expected.active.title
+    assert {k: v.value for k, v in wb.defined_names.items()} == {k: v.value for k, v in expected.defined_names.items()}
+
+    for name in expected.sheetnames:
+        expected_sheet, sheet = expected[name], wb[name]
+        assert sheet.array_formulae == dict(expected_sheet.array_formulae)
+        assert (sheet.max_row, sheet.max_column) == (expected_sheet.max_row, expected_sheet.max_column)
+
+        for (row, col), expected_cell in list(expected_sheet._cells.items()):
+            cell = sheet.cell(row, col)
+            if expected_cell.value is None:
+                assert cell.value is None
+            elif isinstance(expected_cell.value, openpyxl.worksheet.formula.ArrayFormula):
+                assert (cell.value.ref, cell.value.text) == (expected_cell.value.ref, expected_cell.value.text)
+                assert cell.data_type == expected_cell.data_type
+            else:
+                assert cell.value == (str(expected_cell.value) if expected_cell.data_type == 's'
+                                      else expected_cell.value)
+                assert cell.data_type == expected_cell.data_type
+
+
+def test_reader_lazy_sheets():
+    """ Sheets are only parsed once they are used. """
+    wb = load_workbook('tests/fixtures/functions.xlsx')
+    assert not any(wb[name]._loaded for name in wb.sheetnames)
+    sheet = wb[wb.sheetnames[0]]
+    assert sheet['A1'] is not None
+    assert [wb[name]._loaded for name in wb.sheetnames] == [True] + [False] * (len(wb.sheetnames) - 1)
+
+
+def test_reader_unsorted_cells():
+    """ Cells written out of order are found, and a repeated cell overrides the earlier one. """
+    sheet = XlsxWorksheet(load_workbook('tests/fixtures/basic.xlsx'), 'Unsorted', None)
+    sheet._loaded = True
+    sheet._parse(io.BytesIO(b'<worksheet><sheetData>'
+                            b'<row r="3"><c r="B3"><v>1</v></c><c r="A3"><v>2</v></c></row>'
+                            b'<row r="1"><c r="C1"><f>A3*2</f></c><c r="B3"><v>3</v></c></row>'
+                            b'</sheetData></worksheet>'))
+    assert [sheet['A3'].value, sheet['B3'].value, sheet['C1'].value, sheet['A1'].value] == [2, 3, '=A3*2', None]
+    assert sheet['C1'].data_type == 'f'
+    assert (sheet.max_row, sheet.max_column) == (3, 3)
+
+
+@pytest.mark.parametrize("sheet, row, expected_result", get_param_from_sheet(RANGES_FILE_NAME))
+def test_fast_loader_ranges(sheet, row, expected_result):
+    ctx = Compiler(RANGES_FILE_NAME, fast_loader=True)
+    ctx.add_input("src", f"{sheet.title}!F1")
+    ctx.add_output("dst", f"{sheet.title}!B{row}")
+    result = ctx.compile(disable_numba=True)(src=3)
+    if isinstance(expected_result, float):
+        assert result['dst'] == pytest.approx(expected_result)
+    else:
+        assert result['dst'] == expected_result
@@ -1,6 +1,20 @@
-from .compiler import Compiler, get_execution_context
-from .excel_functions import xlnumba_function
+import importlib
+
 from .exceptions import *
 from .logger import logger, VERBOSE_LOG_LEVEL
 
 __version__ = '0.1.0'
+
+# The compiler (and openpyxl and astor along with it) is only imported when first used, so modules written by
+# Compiler.export_module, which import xlnumba.runtime, don't need the compiler's dependencies.
+_LAZY_ATTRIBUTES = {
+    'Compiler': '.compiler',
+    'get_execution_context': '.compiler',
+    'xlnumba_function': '.excel_functions',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
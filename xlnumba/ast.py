@@ -2,7 +2,8 @@ import ast
 
 import astor
 
-from .excel_reference import ExcelReference
+from .excel_reference import ExcelReference, DataType
+from .exceptions import UnsupportedException
 from .logger import logger
 
 NUMBA_FLAGS = {
@@ -12,6 +13,25 @@ NUMBA_FLAGS = {
 }
 
 GENERATOR_VAR_NAME = "_rgenerator"
+BATCH_INDEX_VAR_NAME = "_batch_idx"
+BATCH_SIZE_VAR_NAME = "_batch_size"
+BATCH_RESULT_VAR_NAME = "_batch_result"
+
+# Numba types used for explicit signatures, keyed by the data type of the input cell.  Formulas and blank cells
+# overridden by an input default to numbers.
+NUMBA_TYPES = {
+    'n': 'float64',
+    'f': 'float64',
+    'X': 'float64',
+    'b': 'boolean',
+    's': 'unicode_type',
+}
+
+# Numpy types used when allocating arrays to hold results of the generated code.
+NUMPY_DTYPES = {
+    DataType.Number: 'numpy.float64',
+    DataType.Boolean: 'numpy.bool_',
+}
 
 
 def ast_tuple(x, y):
@@ -33,31 +53,75 @@ def ast_call(func, args, keywords=None) -> ast.Call:
     return ast.Call(func=func, args=args, keywords=keywords)
 
 
-def numba_decorator() -> list[ast.Call]:
+def numba_decorator(parallel=False, cache=False, signature: str = None) -> list[ast.Call]:
     """
     Ast decorator for compiled function to enable numba compilation and optimization of the
     function.
+
+    :param parallel: Enable numba automatic parallelization, required for prange loops to execute across cores.
+    :param cache: Enable numba's on-disk cache, only valid when the function is written to a module on disk.
+    :param signature: Explicit numba signature; the function is compiled eagerly when it is defined and calls
+    with other argument types raise rather than compiling a new specialization.
     """
+    args = [] if signature is None else [ast.Constant(signature)]
     keywords = []
     for key, value in NUMBA_FLAGS.items():
         keywords.append(ast.keyword(arg=key, value=ast.Constant(value)))
+    if parallel:
+        keywords.append(ast.keyword(arg='parallel', value=ast.Constant(True)))
+    if cache:
+        keywords.append(ast.keyword(arg='cache', value=ast.Constant(True)))
+
+    return [ast_call('numba.jit', args, keywords)]
 
-    return [ast_call('numba.jit', [], keywords)]
 
+def numba_signature(inputs: dict[str, ExcelReference], batch=False) -> str:
+    """
+    Build an explicit numba signature for a function taking the inputs.  Scalars map to the numba type matching the
+    cell data type, ranges map to 2D arrays.
+
+    :param inputs: Inputs of the function.
+    :param batch: Add a leading scenario axis to every input, as taken by the batch function.
+    :return: Signature string (i.e. "(float64, float64[:, :])"), single inputs keep a trailing comma so numba parses
+    the signature as a tuple.
+    """
+    types = []
+    for name, ref in inputs.items():
+        data_type = ref.data_type
+        if data_type not in NUMBA_TYPES:
+            raise UnsupportedException(f"Input {name} of type {data_type} does not support an explicit signature")
+
+        dimensions = (0 if ref.shape.is_scalar else 2) + (1 if batch else 0)
+        if dimensions > 0 and data_type == 's':
+            raise UnsupportedException(f"Input {name} is an array of strings which does not support an explicit "
+                                       f"signature")
+        types.append(NUMBA_TYPES[data_type] + (f"[{', '.join([':'] * dimensions)}]" if dimensions else ""))
+    return f"({', '.join(types)}{',' if len(types) == 1 else ''})"
+
+
+def ast_function_body(graph, output_cells, return_tuple=False, visited: set = None) -> list[ast.AST]:
+    """
+    Given a graph generate the function body for this graph.
 
-def ast_function_body(graph, output_cells) -> list[ast.AST]:
-    """ Given a graph generate the function body for this graph """
-    visited = set()
+    :param graph: Graph of output nodes to generate.
+    :param output_cells: Mapping from output cell to output name.
+    :param return_tuple: Return the outputs as a tuple in graph order rather than a dictionary keyed by name.
+    :param visited: Set the nodes generated are added to, i.e. to find the constants they use (see ast_constants).
+    """
+    visited = set() if visited is None else visited
     statement_list = list()
 
     for cell, ref in graph:
         statement_list.extend(ref.generate_ast_tree(visited))
 
     # Create return statement.
-    output_keys = [ast.Constant(output_cells[k[0]]) for k in graph]
     output_values = [k[1].output_variable for k in graph]
-    ast_dictionary = ast.Dict(keys=output_keys, values=output_values)
-    statement_list.append(ast.Return(ast_dictionary))
+    if return_tuple:
+        statement_list.append(ast.Return(ast.Tuple(elts=output_values, ctx=ast.Load())))
+    else:
+        output_keys = [ast.Constant(output_cells[k[0]]) for k in graph]
+        ast_dictionary = ast.Dict(keys=output_keys, values=output_values)
+        statement_list.append(ast.Return(ast_dictionary))
 
     # This is useful in a very verbose debug mode to determine if there is one invalid
     # AST structure to determine which one it is and help identify what is wrong.
@@ -67,19 +131,23 @@ def ast_function_body(graph, output_cells) -> list[ast.AST]:
     return statement_list
 
 
-def ast_arguments(inputs: dict[str, ExcelReference]):
+def ast_arguments(inputs: dict[str, ExcelReference], include_defaults=True):
     """
     Given a set of inputs generate the AST as input to the function
     :param inputs: List of input objects.
+    :param include_defaults: Use the value in the workbook as the default for each input.  Functions compiled with an
+    explicit signature can't have defaults, as omitted arguments are typed differently from the signature.
     :return: An ast argument object
     """
     args = []
     defaults = []
 
     for name, node in inputs.items():
-        # Todo set annotation to appropriate type for numba.
+        # types are set through the numba signature (see numba_signature) rather than annotations.
         args.append(ast.arg(arg=name, annotation=None))
-        if node.data_type != 'f':
+        if not include_defaults:
+            continue
+        elif node.data_type != 'f':
             defaults.append(ast.Constant(node.value))
         else:
             defaults.append(ast.Constant(0))
@@ -93,6 +161,167 @@ def ast_arguments(inputs: dict[str, ExcelReference]):
                          )
 
 
+def ast_batch_function(name: str, kernel_name: str, inputs: dict[str, ExcelReference], graph, output_cells,
+                       decorator_list, parallel=False) -> ast.FunctionDef:
+    """
+    Generate a function which evaluates the kernel function once for every entry along the leading axis of the
+    inputs.  Each input is an array of scenarios and each output is preallocated once, so the full loop stays
+    within the compiled code.
+
+    The kernel is expected to return its outputs as a tuple in graph order.
+
+    :param name: Name of the batch function.
+    :param kernel_name: Name of the function evaluating a single scenario.
+    :param inputs: Inputs of the kernel function, these become arrays for the batch function.
+    :param graph: Graph of outputs used to determine the shape and type of the output arrays.
+    :param output_cells: Mapping from output cell to output name.
+    :param decorator_list: Decorators for the batch function.
+    :param parallel: Loop over the scenarios with numba.prange so that scenarios are split across cores.
+    :return: Function definition for the batch function.
+    """
+    input_names = list(inputs.keys())
+    batch_size = ast.Name(id=BATCH_SIZE_VAR_NAME, ctx=ast.Load())
+    batch_idx = ast.Name(id=BATCH_INDEX_VAR_NAME, ctx=ast.Load())
+    result = ast.Name(id=BATCH_RESULT_VAR_NAME, ctx=ast.Load())
+
+    size_value = ast.Subscript(
+        value=ast.Attribute(value=ast.Name(id=input_names[0], ctx=ast.Load()), attr='shape', ctx=ast.Load()),
+        slice=ast.Constant(0),
+        ctx=ast.Load()
+    )
+    body = [ast.Assign(targets=[ast.Name(id=BATCH_SIZE_VAR_NAME, ctx=ast.Store())], value=size_value)]
+
+    output_names = []
+    for cell, output_node in graph:
+        output_name = output_argument_name(output_cells[cell])
+        output_names.append(output_name)
+        shape = _batch_output_shape(output_node.shape)
+        dtype = NUMPY_DTYPES.get(output_node.data_type)
+        if dtype is None:
+            raise UnsupportedException(f"Output {output_cells[cell]} of type {output_node.data_type} is not supported "
+                                       f"in batch mode")
+        allocation = ast_call(
+            'numpy.empty',
+            [ast.Tuple(elts=[batch_size] + [ast.Constant(x) for x in shape], ctx=ast.Load())],
+            [ast.keyword(arg='dtype', value=_ast_attribute_path(dtype))]
+        )
+        body.append(ast.Assign(targets=[ast.Name(id=output_name, ctx=ast.Store())], value=allocation))
+
+    kernel_args = [ast.Subscript(value=ast.Name(id=x, ctx=ast.Load()), slice=batch_idx, ctx=ast.Load())
+                   for x in input_names]
+    loop_body = [ast.Assign(targets=[ast.Name(id=BATCH_RESULT_VAR_NAME, ctx=ast.Store())],
+                            value=ast_call(kernel_name, kernel_args))]
+    for idx, output_name in enumerate(output_names):
+        loop_body.append(ast.Assign(
+            targets=[ast.Subscript(value=ast.Name(id=output_name, ctx=ast.Load()), slice=batch_idx, ctx=ast.Store())],
+            value=ast.Subscript(value=result, slice=ast.Constant(idx), ctx=ast.Load())
+        ))
+
+    body.append(ast.For(
+        target=ast.Name(id=BATCH_INDEX_VAR_NAME, ctx=ast.Store()),
+        iter=ast_call('numba.prange' if parallel else 'range', [batch_size]),
+        body=loop_body,
+        orelse=[]
+    ))
+    body.append(ast.Return(ast.Tuple(elts=[ast.Name(id=x, ctx=ast.Load()) for x in output_names], ctx=ast.Load())))
+
+    args = ast.arguments(args=[ast.arg(arg=x, annotation=None) for x in input_names], vararg=None, kwonlyargs=[],
+                         kw_defaults=[], kwarg=None, defaults=[])
+    return ast.FunctionDef(name=name, args=args, body=body, decorator_list=decorator_list)
+
+
+def ast_buffered_function(name: str, inputs: dict[str, ExcelReference], graph, output_cells, outputs, written,
+                          workspace, allocating, decorator_list, visited: set = None) -> list[ast.stmt]:
+    """
+    Generate a function which writes its outputs in to arrays passed by the caller, and the intermediate arrays in to
+    a workspace of arrays also passed by the caller, rather than allocating them and returning a dictionary.  The
+    function returns nothing, the arguments are the output arrays, then the workspace arrays, then the inputs.
+
+    The shape and dtype of each argument is described by a tuple of (name, shape, dtype) assigned alongside the
+    function, as {name}_outputs and {name}_workspace, so that the arrays can be allocated ahead of calling it.  The
+    variables of the arrays the function still creates are listed by {name}_allocating.
+
+    :param name: Name of the function.
+    :param inputs: Inputs of the function, these have the value in the workbook as their default.
+    :param graph: Graph of outputs to generate.
+    :param output_cells: Mapping from output cell to output name.
+    :param outputs: Array argument for each output node of the graph, see ArgumentArrayNode.
+    :param written: Output nodes whose result is written directly in to their argument, the others are copied.
+    :param workspace: Array arguments used by the graph for intermediate results.
+    :param allocating: Nodes which create an array on each call, see plan_workspace.
+    :param decorator_list: Decorators for the function.
+    :param visited: Set the nodes generated are added to, see ast_function_body.
+    :return: Statements for the function and its description.
+    """
+    visited = set() if visited is None else visited
+    body = list()
+    for cell, output_node in graph:
+        body.extend(output_node.generate_ast_tree(visited))
+
+    for cell, output_node in graph:
+        if output_node in written:
+            continue
+        argument = outputs[output_node]
+        if output_node.shape.is_scalar:
+            target, value = ast.Constant(0), output_node.output_variable
+        elif output_node.shape.is_vector:
+            target, value = ast.Slice(None, None), output_node.output_variable
+        else:
+            target, value = ast_tuple(ast.Slice(None, None), ast.Slice(None, None)), output_node.top.ref
+        body.append(ast.Assign(targets=[ast.Subscript(value=argument.ref, slice=target, ctx=ast.Store())],
+                               value=value))
+    body.append(ast.Return(None))
+
+    arguments = ast_arguments(inputs)
+    arguments.args = [ast.arg(arg=x.varname, annotation=None) for x in list(outputs.values()) + workspace] + \
+        arguments.args
+    function = ast.FunctionDef(name=name, args=arguments, body=body, decorator_list=decorator_list)
+
+    descriptions = [
+        (f"{name}_outputs", [(output_cells[cell], _buffered_output_shape(node.shape), outputs[node].dtype)
+                             for cell, node in graph]),
+        (f"{name}_workspace", [(x.varname, tuple(x.shape), x.dtype) for x in workspace]),
+        (f"{name}_allocating", [x.varname for x in allocating]),
+    ]
+    return [function] + [ast.Assign(targets=[ast.Name(id=target, ctx=ast.Store())], value=_ast_literal(value))
+                         for target, value in descriptions]
+
+
+def output_argument_name(name: str) -> str:
+    """ Output arrays are prefixed to avoid clashing with the names of the inputs. """
+    return f"_out_{name}"
+
+
+def _batch_output_shape(shape) -> tuple[int, ...]:
+    """
+    Shape of a single scenario for an output.  This matches what the kernel returns; scalars are a single value and
+    vectors are flattened to 1D arrays (see OutputNode).
+    """
+    if shape.is_scalar:
+        return tuple()
+    elif shape.is_vector:
+        return (shape.size,)
+    else:
+        return tuple(shape)
+
+
+def _buffered_output_shape(shape) -> tuple[int, ...]:
+    """ Shape of the array passed for an output, as _batch_output_shape with scalars held in a single entry. """
+    return _batch_output_shape(shape) or (1,)
+
+
+def _ast_literal(value) -> ast.expr:
+    """ AST for a value made of lists, tuples and constants, lists are converted to tuples. """
+    if isinstance(value, (list, tuple)):
+        return ast.Tuple(elts=[_ast_literal(x) for x in value], ctx=ast.Load())
+    return ast.Constant(value)
+
+
+def _ast_attribute_path(path: str):
+    """ Convert dotted path to an AST attribute chain (i.e. numpy.float64) """
+    return ast_call(path, []).func
+
+
 def _test_each_statement(statements):
     """
     This creates a  verbose dump log for each statement confirming the AST tree statement is valid.
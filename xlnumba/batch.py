@@ -0,0 +1,91 @@
+"""
+Batch functions evaluate many scenarios of the compiled workbook in a single call.  The looping over scenarios happens
+inside the generated function; this module provides the thin Python layer that maps named inputs and outputs onto that
+function.
+"""
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+
+class BatchFunction:
+    """
+    Callable wrapper around a generated batch function.  Inputs are passed as arrays with the scenarios along the
+    leading axis and the result is a dictionary of output name to an array of results, one entry per scenario.
+
+    Inputs that are not passed are filled with the default value from the workbook for every scenario.  Functions
+    compiled eagerly have no defaults, so all inputs must be passed.
+
+    When threads are requested the scenarios are split into one chunk per thread and each chunk is evaluated by the
+    batch function on a thread pool.  Generated functions are compiled with nogil, so the chunks execute concurrently.
+    """
+
+    def __init__(self, batch_fn, kernel_fn, output_names: list[str], threads: int | None = None):
+        """
+        :param batch_fn: Generated function looping over the scenarios and returning a tuple of output arrays.
+        :param kernel_fn: Generated function evaluating a single scenario, used to determine the input defaults.
+        :param output_names: Names of the outputs in the order they are returned by the batch function.
+        :param threads: Number of threads to split the scenarios across, None evaluates on the calling thread.
+        """
+        self.fn = batch_fn
+        self.kernel = kernel_fn
+        self.output_names = list(output_names)
+        self.threads = threads
+
+        py_func = getattr(kernel_fn, 'py_func', kernel_fn)
+        self.input_defaults = {name: param.default for name, param in inspect.signature(py_func).parameters.items()}
+
+    @property
+    def input_names(self) -> list[str]:
+        return list(self.input_defaults.keys())
+
+    def __call__(self, **inputs) -> dict[str, numpy.ndarray]:
+        args = self.prepare_inputs(inputs)
+        if self.threads is not None and self.threads > 1:
+            results = self._run_threaded(args)
+        else:
+            results = self.fn(*args)
+        return dict(zip(self.output_names, results))
+
+    def _run_threaded(self, args: list[numpy.ndarray]) -> list[numpy.ndarray]:
+        """
+        Split the scenarios into one contiguous chunk per thread, evaluate each chunk on the pool and stitch the
+        outputs back together in the original order.
+        """
+        size = len(args[0])
+        chunk_count = max(1, min(self.threads, size))
+        bounds = numpy.linspace(0, size, chunk_count + 1).astype(int)
+        chunks = [[arg[start:end] for arg in args] for start, end in zip(bounds[:-1], bounds[1:])]
+
+        with ThreadPoolExecutor(max_workers=chunk_count) as pool:
+            chunk_results = list(pool.map(lambda chunk: self.fn(*chunk), chunks))
+
+        return [numpy.concatenate([result[idx] for result in chunk_results]) for idx in range(len(self.output_names))]
+
+    def prepare_inputs(self, inputs: dict) -> list[numpy.ndarray]:
+        """
+        Convert the named inputs into the positional arrays expected by the batch function, broadcasting defaults
+        for any input that was not provided.
+        """
+        unknown = set(inputs) - set(self.input_defaults)
+        if unknown:
+            raise TypeError(f"Unknown inputs {sorted(unknown)} for batch function")
+        if not inputs:
+            raise TypeError("At least one input array is required to determine the number of scenarios")
+
+        arrays = {name: numpy.asarray(value) for name, value in inputs.items()}
+        size = len(next(iter(arrays.values())))
+        for name, value in arrays.items():
+            if len(value) != size:
+                raise ValueError(f"Input {name} has {len(value)} scenarios, expected {size}")
+
+        args = []
+        for name, default in self.input_defaults.items():
+            if name in arrays:
+                args.append(arrays[name])
+            elif default is inspect.Parameter.empty:
+                raise TypeError(f"Missing required input {name} for batch function")
+            else:
+                args.append(numpy.full(size, default))
+        return args
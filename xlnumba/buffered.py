@@ -0,0 +1,64 @@
+"""
+Buffered functions write their outputs in to arrays passed by the caller rather than allocating them on each call, so
+that evaluating the compiled workbook repeatedly in a loop doesn't create any arrays.  This module provides the thin
+Python layer describing and allocating the arrays the generated function expects.
+"""
+import inspect
+from collections import namedtuple
+
+import numpy
+
+ArraySpec = namedtuple("ArraySpec", ["shape", "dtype"])
+
+
+class BufferedFunction:
+    """
+    Callable wrapper around a generated buffered function.  The caller passes a dictionary of output name to an array
+    with the shape and dtype given by outputs, usually created once with allocate_outputs, and the results are written
+    in to these arrays.  Scalar outputs are written in to an array of a single entry.
+
+    The intermediate arrays of the calculation are written in to a workspace of arrays described by workspace.  If no
+    workspace is passed the function allocates one on the first call and keeps it for later calls, so a function
+    shared between threads should be passed a workspace per thread.
+
+    Calls create no arrays when allocating is empty, otherwise it lists the variables of the generated code whose
+    arrays are still created on each call (see plan_workspace).
+
+    Inputs are passed by name and default to the value in the workbook, as for the function returned by compile.
+    """
+
+    def __init__(self, fn, outputs: tuple, workspace: tuple, allocating: tuple = ()):
+        """
+        :param fn: Generated function taking the output arrays, then the workspace arrays, then the inputs.
+        :param outputs: Tuple of (name, shape, dtype) for each output in the order they are passed.
+        :param workspace: Tuple of (name, shape, dtype) for each workspace array in the order they are passed.
+        :param allocating: Variables of the arrays the function creates on each call.
+        """
+        self.fn = fn
+        self.outputs = {name: ArraySpec(tuple(shape), numpy.dtype(dtype)) for name, shape, dtype in outputs}
+        self.workspace = [ArraySpec(tuple(shape), numpy.dtype(dtype)) for _, shape, dtype in workspace]
+        self.allocating = list(allocating)
+        self._workspace = None
+
+        py_func = getattr(fn, 'py_func', fn)
+        parameters = list(inspect.signature(py_func).parameters.values())[len(outputs) + len(workspace):]
+        self.input_defaults = {param.name: param.default for param in parameters}
+
+    @property
+    def input_names(self) -> list[str]:
+        return list(self.input_defaults.keys())
+
+    def allocate_outputs(self) -> dict[str, numpy.ndarray]:
+        return {name: numpy.empty(spec.shape, dtype=spec.dtype) for name, spec in self.outputs.items()}
+
+    def allocate_workspace(self) -> list[numpy.ndarray]:
+        return [numpy.empty(spec.shape, dtype=spec.dtype) for spec in self.workspace]
+
+    def __call__(self, outputs: dict[str, numpy.ndarray], workspace: list[numpy.ndarray] | None = None,
+                 **inputs) -> dict[str, numpy.ndarray]:
+        if workspace is None:
+            if self._workspace is None:
+                self._workspace = self.allocate_workspace()
+            workspace = self._workspace
+        self.fn(*[outputs[name] for name in self.outputs], *workspace, **inputs)
+        return outputs
@@ -0,0 +1,228 @@
+"""
+Persistent cache of compiled workbooks.  Generated functions are written as Python modules to a cache directory
+keyed by a hash of everything that can influence the generated code.  The functions are decorated with numba's
+cache option, so on a warm start the module is imported and numba loads the machine code from its own cache without
+the workbook being parsed or the function being recompiled.
+
+The nodes built for a workbook file (see incremental.py) are also stored, keyed by the file rather than its contents,
+so after an edit a new process only rebuilds the nodes of the cells which changed.
+
+Helpers of partitioned functions (see partition.py) are written to modules of their own, named after the hash of their
+code, which are shared by every module using them.  Numba's cache is kept for each source file, so helpers whose code
+is unchanged by an edit to the workbook are loaded from numba's cache rather than recompiled.
+"""
+import ast
+import hashlib
+import importlib.util
+import inspect
+import io
+import os
+import tempfile
+from pathlib import Path
+
+import astor
+import numba
+import openpyxl
+
+from .excel_functions import user_functions
+from .ast import ast_call
+from .execution import ast_module
+from .incremental import ReferenceCache
+from .partition import helper_constants
+from .logger import logger
+
+MODULE_PREFIX = "xlnumba_"
+REFERENCES_PREFIX = "xlnumba_references_"
+CACHE_MODULE = "xlnumba_cache"
+
+# helper modules imported by this process, keyed by path, so modules sharing a helper use the same compiled function.
+_PARTS = {}
+
+
+def workbook_bytes(file) -> bytes:
+    """
+    Raw bytes of the workbook used for hashing.  Workbook objects have no backing file, saving them is not
+    deterministic (timestamps are updated) so their cell contents are serialized instead.
+
+    :param file: File name, binary file like object or openpyxl workbook.
+    """
+    if isinstance(file, openpyxl.Workbook):
+        buffer = io.StringIO()
+        for name, defined_name in file.defined_names.items():
+            buffer.write(f"{name}={defined_name.value}\n")
+        for sheet in file.worksheets:
+            buffer.write(f"[{sheet.title}]\n")
+            for row in sheet.iter_rows():
+                for cell in row:
+                    value = cell.value
+                    if isinstance(value, openpyxl.worksheet.formula.ArrayFormula):
+                        value = (value.ref, value.text)
+                    if value is not None:
+                        buffer.write(f"{cell.coordinate}:{cell.data_type}:{value!r}\n")
+        return buffer.getvalue().encode('utf-8')
+    elif hasattr(file, 'read'):
+        position = file.tell()
+        data = file.read()
+        file.seek(position)
+        return data
+    else:
+        return Path(file).read_bytes()
+
+
+def cache_key(wb_bytes: bytes, inputs: dict[str, str], outputs: dict[str, str], options: dict) -> str:
+    """
+    Generate the key for a compiled function.  The key covers the workbook contents, the inputs and outputs (order is
+    significant as it determines argument and result order), compilation options, any user defined functions and the
+    versions of xlnumba and numba which generated the code.
+    """
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(wb_bytes).digest())
+    details = (
+        tuple(inputs.items()),
+        tuple(outputs.items()),
+        tuple(sorted((k, _option_repr(v)) for k, v in options.items())),
+        *_library_details(),
+    )
+    digest.update(repr(details).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def references_key(file, inputs: dict[str, str]) -> str | None:
+    """
+    Generate the key for the nodes built for a workbook file.  Unlike cache_key the contents of the workbook aren't
+    covered, the nodes are kept across edits and those built from changed cells are dropped when loaded (see
+    ReferenceCache.validate).  Inputs are covered as changing them drops every node.
+
+    :return: None for workbook objects and file like objects, which can't be identified in another process.
+    """
+    if not isinstance(file, (str, os.PathLike)):
+        return None
+    details = (str(Path(file).resolve()), tuple(inputs.items()), *_library_details())
+    return hashlib.sha256(repr(details).encode('utf-8')).hexdigest()
+
+
+class CompilationCache:
+    """
+    Directory of generated modules, one module per cache key.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{MODULE_PREFIX}{key}.py"
+
+    def load(self, key: str):
+        """
+        :return: Previously stored module for this key or None if it has not been generated yet.
+        """
+        path = self.path(key)
+        if not path.exists():
+            logger.debug("Compilation cache miss for %s", key)
+            return None
+        logger.debug("Compilation cache hit for %s", key)
+        return _import_module(path)
+
+    def store(self, key: str, statements: list[ast.stmt]):
+        """
+        Write generated statements as a self-contained module in the cache and import the result.
+        """
+        path = self.path(key)
+        self._write(path, statements)
+        return _import_module(path)
+
+    def store_parts(self, helpers: list[ast.FunctionDef], constants: list[ast.Assign]) -> list[ast.stmt]:
+        """
+        Write the helpers of a partitioned function to modules of their own.  Modules with the same code which have
+        already been written are left as they are, so numba's cache of the helper remains valid.
+
+        :param helpers: Helper functions, named after the hash of their code.
+        :param constants: Constants of the function, those used by a helper are defined by its module.
+        :return: Statements loading the helpers in to the module of the function.
+        """
+        statements = [ast.Import(names=[ast.alias('xlnumba.cache', CACHE_MODULE)])]
+        for helper in helpers:
+            path = self.directory / f"{MODULE_PREFIX}{helper.name}.py"
+            if not path.exists():
+                self._write(path, helper_constants(helper, constants) + [helper])
+            statements.append(ast.Assign(
+                targets=[ast.Name(id=helper.name, ctx=ast.Store())],
+                value=ast_call(f'{CACHE_MODULE}.load_part', [ast.Name(id='__file__', ctx=ast.Load()),
+                                                             ast.Constant(helper.name)])
+            ))
+        return statements
+
+    def load_references(self, key: str, references: ReferenceCache, wb) -> bool:
+        """
+        Load the nodes stored by store_references in to the reference cache, bound to the workbook being compiled.
+
+        :return: False if no nodes have been stored for this key.
+        """
+        path = self.directory / f"{REFERENCES_PREFIX}{key}.pickle"
+        if not path.exists():
+            return False
+        with path.open('rb') as f:
+            references.load(f, wb)
+        logger.debug("Loaded %d cached references from %s", len(references.references), path)
+        return True
+
+    def store_references(self, key: str, references: ReferenceCache, wb):
+        """ Write the nodes of the reference cache, replacing those stored by a previous compilation. """
+        path = self.directory / f"{REFERENCES_PREFIX}{key}.pickle"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            references.dump(f, wb)
+        os.replace(tmp_name, path)
+        logger.debug("Stored %d references in %s", len(references.references), path)
+
+    def _write(self, path: Path, statements: list[ast.stmt]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        code = astor.to_source(ast_module(statements))
+
+        # write then rename so a concurrent process never imports a partially written module.
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(code)
+        os.replace(tmp_name, path)
+        logger.debug("Stored compiled module %s", path)
+
+
+def load_part(module_file: str, name: str):
+    """ Load a helper written by CompilationCache.store_parts, from the directory of the module using it. """
+    path = Path(module_file).parent / f"{MODULE_PREFIX}{name}.py"
+    if path not in _PARTS:
+        _PARTS[path] = getattr(_import_module(path), name)
+    return _PARTS[path]
+
+
+def _import_module(path: Path):
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _library_details() -> tuple:
+    """ Details of the code generating functions; any user defined functions and the versions of xlnumba and numba. """
+    from . import __version__
+
+    return (
+        tuple(sorted((k, _function_source(v)) for k, v in user_functions.INSTALLED_FUNCTIONS.items())),
+        __version__,
+        numba.__version__,
+    )
+
+
+def _option_repr(value) -> str:
+    """ Sets (i.e. disabled optimizations) are sorted so the key does not depend on hash ordering. """
+    if isinstance(value, (set, frozenset)):
+        value = sorted(value)
+    return repr(value)
+
+
+def _function_source(fn) -> str:
+    try:
+        return inspect.getsource(fn)
+    except (OSError, TypeError):
+        return fn.__qualname__
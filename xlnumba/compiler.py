@@ -3,18 +3,32 @@ import ast
 import astor
 import openpyxl
 
-from .ast import numba_decorator, ast_function_body, ast_arguments
+from .ast import numba_decorator, ast_function_body, ast_arguments, ast_batch_function, ast_buffered_function, \
+    numba_signature, output_argument_name, NUMPY_DTYPES
+from .batch import BatchFunction
+from .buffered import BufferedFunction
+from .tuple_function import TupleFunction
+from .cache import CompilationCache, cache_key, references_key, workbook_bytes
 from .compiler_frame import CompilerReference, CompilerFrame, NestedCompilerFrame, FunctionCompilerFrame, \
     create_compiler_frame
 from .excel_functions import find_function_details
 from .excel_reference import ExcelReference
-from .execution import evaluate, get_execution_context
+from .exceptions import UnsupportedException
+from .execution import evaluate, get_execution_context, ast_module
+from .incremental import ReferenceCache
 from .logger import logger
-from .nodes import Node, Graph, FunctionOpNode, wrap_output, wrap_input
+from .nodes import Node, Graph, FunctionOpNode, ArgumentArrayNode, wrap_output, clone_graph, ast_constants
 from .optimizations import optimize_graph
+from .optimizations.buffer_reuse import plan_workspace
+from .partition import ast_partitioned_body
+from .recurrence import RecurrenceIndex
 from .special_functions import SPECIAL_FUNCTION_MAP
+from .windows import WindowIndex
+from .xlsx_reader import load_workbook
 
 FNC_NAME = "compiled_function"
+BATCH_FNC_NAME = "compiled_function_batch"
+BUFFERED_FNC_NAME = "compiled_function_buffered"
 
 
 class Compiler:
@@ -22,23 +36,58 @@ class Compiler:
     Main entry poit for xlnumba controls the compilation inner loop.
     """
 
-    def __init__(self, file):
+    def __init__(self, file, cache_dir=None, fast_loader=False):
         """
         :param file: Either a file name or an openpyxl workbook, workbook must not be readonly.
+        :param cache_dir: Directory to cache compiled functions in.  When the same workbook, inputs, outputs and
+        options are compiled again the function is loaded from the cache without parsing the workbook.
+        :param fast_loader: Read files with xlnumba's own XLSX reader rather than openpyxl.  Sheets are only parsed
+        when referenced and cells are stored compactly, which is much faster and uses far less memory for large
+        workbooks.
 
         Readonly limitation is due to how openpxyl handles the files, array formulas are only available in non-readonly
         mode.  If opened in writable mode the values will be presented instead.
         """
-        if isinstance(file, openpyxl.Workbook):
-            if file.read_only:
-                raise AttributeError("Workbook must be editable for array formulae to be populated by open pyxl")
-            self.wb = file
-        else:
-            self.wb = openpyxl.load_workbook(file, keep_vba=False, keep_links=False, rich_text=True)
+        self._file = file
+        self._wb = None
+        self._cache = CompilationCache(cache_dir) if cache_dir is not None else None
+        self._fast_loader = fast_loader
+        self._input_specs = {}
+        self._output_specs = {}
         self._outputs = {}
         self._output_cells = {}
         self._inputs = {}
         self._input_cells = {}
+        self._reference_cache = ReferenceCache()
+        self._set_file(file)
+
+    def reload(self, file=None):
+        """
+        Reload the workbook after it has been edited.  Nodes built by previous compilations are kept, so the next
+        compilation only rebuilds the cells which changed and the cells which depend on them.
+
+        :param file: Edited workbook, either a file name or an openpyxl workbook.  Defaults to reading the original
+        file again.
+        """
+        self._wb = None
+        self._set_file(self._file if file is None else file)
+        return self
+
+    def _set_file(self, file):
+        if isinstance(file, openpyxl.Workbook) and file.read_only:
+            raise AttributeError("Workbook must be editable for array formulae to be populated by open pyxl")
+        self._file = file
+
+        if isinstance(file, openpyxl.Workbook) or self._cache is None:
+            # without a cache the workbook is always needed so load straight away, otherwise defer until we know
+            # if the cache can satisfy the compilation.
+            self._load_workbook()
+
+    @property
+    def wb(self) -> openpyxl.Workbook:
+        if self._wb is None:
+            self._load_workbook()
+        return self._wb
 
     def add_output(self, name: str, cell_ref: str):
         """
@@ -48,9 +97,9 @@ class Compiler:
         :param name:     Output variable name to use.
         :param cell_ref: Reference to the cell in the Excel sheet.
         """
-        output = ExcelReference(self.wb, cell_ref)
-        self._outputs[name] = output
-        self._output_cells[output] = name
+        self._output_specs[name] = cell_ref
+        if self._wb is not None:
+            self._resolve_output(name, cell_ref)
         return self
 
     def add_input(self, name: str, cell_ref: str):
@@ -61,9 +110,9 @@ class Compiler:
         :param name: Variable name for this input
         :param cell_ref: Reference to a cell or range of cells that the input would fill.  
         """
-        input_ref = ExcelReference(self.wb, cell_ref)
-        self._inputs[name] = input_ref
-        self._input_cells[input_ref] = name
+        self._input_specs[name] = cell_ref
+        if self._wb is not None:
+            self._resolve_input(name, cell_ref)
         return self
 
     def generate_code(self, disable_numba=False, disable_optimizations=False):
@@ -75,54 +124,273 @@ class Compiler:
         to disable
         :return: Source code to generated function.
         """
-        fn = self._gen_ast(disable_numba, disable_optimizations)
-        code = astor.to_source(fn)
+        statements = self._gen_ast(disable_numba, disable_optimizations)
+        code = astor.to_source(ast.Module(body=statements, type_ignores=[]))
         logger.debug(code)
         return code
 
-    def compile(self, disable_numba=False, disable_optimizations=False):
+    def export_module(self, path, disable_numba=False, disable_optimizations=False, cache=True):
+        """
+        Write the compiled function as a self-contained Python module.  The module contains the required imports,
+        any user defined functions used by the workbook and the generated function (named compiled_function), so it
+        can be imported without the workbook or re-running the compiler.
+
+        :param path: File to write the module to.
+        :param disable_numba: Disable all numba decorator on the function.
+        :param disable_optimizations: Set to True to disable all optimizations or a list of optimizations specifically
+        to disable.
+        :param cache: Enable numba's on-disk cache for the function so only the first import pays the JIT cost.
+        :return: Source code of the module.
+        """
+        code = astor.to_source(ast_module(self._gen_ast(disable_numba, disable_optimizations, cache)))
+        with open(path, 'w') as f:
+            f.write(code)
+        logger.debug("Exported module to %s", path)
+        return code
+
+    def compile(self, disable_numba=False, disable_optimizations=False, eager=False, return_tuple=False,
+                partition: int = None):
         """
         Return a compiled function which equates to the evaluated worksheet.
 
         :param disable_numba: Disable all numba decorator on the function.
         :param disable_optimizations: Set to True to disable all optimizations or a list of optimizations specifically
         to disable.
+        :param eager: Compile with an explicit signature derived from the type and shape of the inputs.  Compilation
+        happens within this call rather than on the first call, all inputs must be passed and calls with other types
+        raise a TypeError rather than triggering a recompile.
+        :param return_tuple: Return the outputs as a named tuple rather than a dictionary.  The compiled function
+        returns a plain tuple, which is cheaper to build than a dictionary and can mix scalar and array outputs, and is
+        wrapped to give access to the outputs by name (see TupleFunction).
+        :param partition: Split the function in to helper functions of about this many statements, which numba
+        compiles separately (see partition.py).  With a cache_dir each helper is cached on its own, so after an edit
+        to the workbook only the helpers whose code changed are recompiled.
         :return: a compiled function.
         """
-        fn = self._gen_ast(disable_numba, disable_optimizations)
+        eager = eager and not disable_numba
+        options = {'mode': 'compile', 'disable_numba': disable_numba, 'disable_optimizations': disable_optimizations,
+                   'eager': eager, 'return_tuple': return_tuple, 'partition': partition}
+        namespace = self._build("CORE", options, lambda cache: self._gen_ast(
+            disable_numba, disable_optimizations, cache, eager, return_tuple, partition
+        ))
+        if return_tuple:
+            return TupleFunction(namespace[FNC_NAME], list(self._output_specs.keys()))
+        return namespace[FNC_NAME]
+
+    def compile_batch(self, disable_numba=False, disable_optimizations=False, parallel=False,
+                      threads=None, eager=False) -> BatchFunction:
+        """
+        Return a compiled function which evaluates the worksheet for many scenarios in a single call.  Each input is
+        passed as an array with one entry per scenario, and each output is returned as an array with one entry per
+        scenario.  The loop over the scenarios is part of the compiled code, avoiding the per call overhead of
+        repeatedly calling the function returned by compile.
+
+        :param disable_numba: Disable all numba decorator on the function.
+        :param disable_optimizations: Set to True to disable all optimizations or a list of optimizations specifically
+        to disable.
+        :param parallel: Use numba.prange to evaluate the scenarios across all cores.
+        :param threads: Number of threads to split the scenarios across.  The compiled functions release the GIL so
+        this provides multicore evaluation for models which numba cannot parallelize.
+        :param eager: Compile with explicit signatures, see compile.  All inputs must then be passed to the batch
+        function.
+        :return: a batch function, called with keyword arrays and returning a dictionary of output arrays.
+        """
+        parallel = parallel and not disable_numba
+        eager = eager and not disable_numba
+        options = {'mode': 'batch', 'disable_numba': disable_numba, 'disable_optimizations': disable_optimizations,
+                   'parallel': parallel, 'eager': eager}
+        namespace = self._build("BATCH", options, lambda cache: self._gen_batch_ast(
+            disable_numba, disable_optimizations, parallel, cache, eager
+        ))
+        return BatchFunction(namespace[BATCH_FNC_NAME], namespace[FNC_NAME], list(self._output_specs.keys()), threads)
+
+    def compile_buffered(self, disable_numba=False, disable_optimizations=False) -> BufferedFunction:
+        """
+        Return a compiled function which writes its outputs in to arrays passed by the caller, rather than returning a
+        new dictionary of results on each call.  The intermediate arrays are written in to a workspace of arrays
+        sized by the compiler, so repeatedly calling the function creates no arrays where the calculation consists of
+        operations on arrays (see plan_workspace).  The shapes and dtypes of the arrays are given by the outputs and
+        workspace attributes of the result, and the arrays still created on each call by its allocating attribute.
+
+        :param disable_numba: Disable all numba decorator on the function.
+        :param disable_optimizations: Set to True to disable all optimizations or a list of optimizations specifically
+        to disable.
+        :return: a buffered function, called with a dictionary of output arrays and keyword inputs.
+        """
+        options = {'mode': 'buffered', 'disable_numba': disable_numba, 'disable_optimizations': disable_optimizations}
+        namespace = self._build("BUFFERED", options, lambda cache: self._gen_buffered_ast(
+            disable_numba, disable_optimizations, cache
+        ))
+        return BufferedFunction(namespace[BUFFERED_FNC_NAME], namespace[f"{BUFFERED_FNC_NAME}_outputs"],
+                                namespace[f"{BUFFERED_FNC_NAME}_workspace"],
+                                namespace[f"{BUFFERED_FNC_NAME}_allocating"])
+
+    def _build(self, logging_name: str, options: dict, generator) -> dict:
+        """
+        Build the generated functions and return the namespace they are defined in.  If caching is enabled the
+        functions are loaded from the cache when available and otherwise generated and stored in the cache.
+
+        :param logging_name: Name used for logging the compilation.
+        :param options: Options which influence the generated code, used as part of the cache key.
+        :param generator: Callable taking the cache flag and returning the list of function definitions.
+        :return: Namespace containing the generated functions.
+        """
+        if self._cache is None:
+            logger.debug("Starting AST compilation")
+            exec_ctx = get_execution_context()
+            evaluate(generator(False), exec_ctx, logging_name)
+            logger.debug("Completed AST compilation")
+            return exec_ctx
+
+        key = cache_key(workbook_bytes(self._file), self._input_specs, self._output_specs, options)
+        module = self._cache.load(key)
+        if module is None:
+            module = self._cache.store(key, generator(not options['disable_numba']))
+        return vars(module)
+
+    def _load_workbook(self):
+        if isinstance(self._file, openpyxl.Workbook):
+            self._wb = self._file
+        elif self._fast_loader:
+            self._wb = load_workbook(self._file)
+        else:
+            self._wb = openpyxl.load_workbook(self._file, keep_vba=False, keep_links=False, rich_text=True)
+
+        self._inputs, self._input_cells, self._outputs, self._output_cells = {}, {}, {}, {}
+        for name, cell_ref in self._input_specs.items():
+            self._resolve_input(name, cell_ref)
+        for name, cell_ref in self._output_specs.items():
+            self._resolve_output(name, cell_ref)
+
+    def _resolve_output(self, name: str, cell_ref: str):
+        output = ExcelReference(self._wb, cell_ref)
+        self._outputs[name] = output
+        self._output_cells[output] = name
+
+    def _resolve_input(self, name: str, cell_ref: str):
+        input_ref = ExcelReference(self._wb, cell_ref)
+        self._inputs[name] = input_ref
+        self._input_cells[input_ref] = name
+
+    def _gen_ast(self, disable_numba: bool, disable_optimizations: bool, cache: bool = False, eager: bool = False,
+                 return_tuple: bool = False, partition: int = None) -> list[ast.stmt]:
+        """
+        Generate the function, preceded by the constant arrays it uses which are globals of the module, and the
+        helpers it calls if partitioned.  Helpers are written to modules of their own when compiling with a cache_dir.
+        """
+        graph = self._gen_graph(disable_numba, disable_optimizations)
+        signature = numba_signature(self._inputs) if eager else None
 
-        logger.debug("Starting AST compilation")
-        exec_ctx = get_execution_context()
-        evaluate([fn], exec_ctx, "CORE")
-        logger.debug("Completed AST compilation")
-        return exec_ctx[FNC_NAME]
+        # build function body
+        visited = set()
+        body = ast_function_body(graph, self._output_cells, return_tuple, visited)
+        statements = ast_constants(visited)
+        if partition:
+            decorators = numba_decorator(cache=cache) if not disable_numba else []
+            helpers, body = ast_partitioned_body(FNC_NAME, body, list(self._inputs), partition, decorators, statements)
+            logger.info(f"Partitioned {FNC_NAME} in to {len(helpers)} helpers")
+            statements += self._cache.store_parts(helpers, statements) if self._cache is not None else helpers
+
+        function_body = ast.FunctionDef(
+            name=FNC_NAME,
+            args=ast_arguments(self._inputs, include_defaults=not eager),
+            body=body,
+            decorator_list=numba_decorator(cache=cache, signature=signature) if not disable_numba else []
+        )
+
+        return statements + [function_body]
+
+    def _gen_batch_ast(self, disable_numba: bool, disable_optimizations: bool, parallel: bool = False,
+                       cache: bool = False, eager: bool = False) -> list[ast.FunctionDef]:
+        """
+        Batch mode generates two functions; the kernel which evaluates a single scenario returning a tuple of outputs
+        and the batch function which loops over all the scenarios calling the kernel.
+        """
+        graph = self._gen_graph(disable_numba, disable_optimizations)
+        kernel_signature = numba_signature(self._inputs) if eager else None
+        batch_signature = numba_signature(self._inputs, batch=True) if eager else None
+
+        visited = set()
+        kernel = ast.FunctionDef(
+            name=FNC_NAME,
+            args=ast_arguments(self._inputs, include_defaults=not eager),
+            body=ast_function_body(graph, self._output_cells, return_tuple=True, visited=visited),
+            decorator_list=numba_decorator(cache=cache, signature=kernel_signature) if not disable_numba else []
+        )
+        batch = ast_batch_function(BATCH_FNC_NAME, FNC_NAME, self._inputs, graph, self._output_cells,
+                                   numba_decorator(parallel, cache, batch_signature) if not disable_numba else [],
+                                   parallel)
+        return ast_constants(visited) + [kernel, batch]
+
+    def _gen_buffered_ast(self, disable_numba: bool, disable_optimizations: bool,
+                          cache: bool = False) -> list[ast.stmt]:
+        graph = self._gen_graph(disable_numba, disable_optimizations)
+
+        outputs = {}
+        for cell, output_node in graph:
+            dtype = NUMPY_DTYPES.get(output_node.data_type)
+            if dtype is None:
+                raise UnsupportedException(f"Output {self._output_cells[cell]} of type {output_node.data_type} is not "
+                                           f"supported in buffered mode")
+            outputs[output_node] = ArgumentArrayNode(output_argument_name(self._output_cells[cell]), output_node.shape,
+                                                     dtype.split(".")[-1])
+        workspace, written, allocating = plan_workspace(graph, outputs)
+
+        visited = set()
+        decorators = numba_decorator(cache=cache) if not disable_numba else []
+        statements = ast_buffered_function(BUFFERED_FNC_NAME, self._inputs, graph, self._output_cells, outputs,
+                                           written, workspace, allocating, decorators, visited)
+        return ast_constants(visited) + statements
+
+    def _gen_graph(self, disable_numba: bool, disable_optimizations: bool) -> Graph:
+        if self._wb is None:
+            self._load_workbook()
 
-    def _gen_ast(self, disable_numba: bool, disable_optimizations: bool):
         if len(self._outputs) == 0 or len(self._inputs) == 0:
             raise AttributeError("Must have at least one output and one input for compilation")
 
+        # nodes from previous compilations are reused unless the cells they were built from have changed.  A new
+        # compiler starts from the nodes stored by the last compilation of the file when caching.
+        reference_cache = self._reference_cache
+        stored_key = references_key(self._file, self._input_specs) if self._cache is not None else None
+        if stored_key is not None and not reference_cache.references:
+            self._cache.load_references(stored_key, reference_cache, self._wb)
+        reference_cache.validate(self._wb, self._inputs)
+        references = reference_cache.references
+
         # all input nodes are automatically references overriding any formulas that may be in those cells.
-        references: dict[CompilerReference, Node] = {}
-        for name, ref in self._inputs.items():
-            compiler_ref = CompilerReference(mode=CompilerReference.Mode.range, active_cell=ref)
-            references[compiler_ref] = wrap_input(ref, name)
+        input_references = reference_cache.seed_inputs(self._inputs)
 
-        # start the algorithm based on all the output cells.
+        # recurrences and window blocks are found as their cells are used, cells computed by a recurrence are built
+        # by a single loop and cells of a window block by a single pass over the windows.
+        signatures = {}
+        recurrences = RecurrenceIndex(self._wb, self._inputs.values(), signatures)
+        windows = WindowIndex(self._wb, self._inputs.values(), signatures)
+
+        # start the algorithm based on all the output cells which haven't already been built.
         stack: list[CompilerFrame] = []
         for ref in self._outputs.values():
             compiler_ref = CompilerReference(mode=CompilerReference.Mode.range, active_cell=ref)
-            stack.append(create_compiler_frame(compiler_ref))
+            if compiler_ref not in references or compiler_ref in input_references:
+                stack.append(create_compiler_frame(compiler_ref, references, recurrences, windows))
 
         #########################################################
         # MAIN LOOP
         ##########################################################
-        _compiler_loop(references, stack)
+        _compiler_loop(references, stack, reference_cache.dependents, recurrences, windows)
+        reference_cache.update_fingerprints(input_references)
+        if stored_key is not None:
+            self._cache.store_references(stored_key, reference_cache, self._wb)
+
+        # build the outputs based on a copy of the generated graph, optimizations modify the graph in place and
+        # the cached nodes must remain unchanged for the next compilation.
+        output_references = [CompilerReference(mode=CompilerReference.Mode.range, active_cell=ref)
+                             for ref in self._outputs.values()]
+        output_nodes = clone_graph([references[x] for x in output_references])
 
-        # build the outputs based on the generated graph.
         graph = Graph()
-        for name, ref in self._outputs.items():
-            compiler_ref = CompilerReference(mode=CompilerReference.Mode.range, active_cell=ref)
-            output_node = wrap_output(name, references[compiler_ref], ref.shape)
+        for (name, ref), node in zip(self._outputs.items(), output_nodes):
+            output_node = wrap_output(name, node, ref.shape)
             graph.append((ref, output_node))
 
         optimize_graph(graph, disable_optimizations)
@@ -130,15 +398,7 @@ class Compiler:
         if disable_numba:
             disable_numba_recursive(x[1] for x in graph)
 
-        # build function body
-        function_body = ast.FunctionDef(
-            name=FNC_NAME,
-            args=ast_arguments(self._inputs),
-            body=ast_function_body(graph, self._output_cells),
-            decorator_list=numba_decorator() if not disable_numba else []
-        )
-
-        return function_body
+        return graph
 
 
 def disable_numba_recursive(outputs):
@@ -159,7 +419,9 @@ def disable_numba_recursive(outputs):
         stack.extend(top.children)
 
 
-def _compiler_loop(references: {CompilerReference, Node}, stack: list[CompilerFrame]):
+def _compiler_loop(references: {CompilerReference, Node}, stack: list[CompilerFrame],
+                   dependents: dict[CompilerReference, set[CompilerReference]] = None,
+                   recurrences: RecurrenceIndex = None, windows: WindowIndex = None):
     """
     Main compilation function which generates the overall AST graph for the Excel sheet.
 
@@ -180,9 +442,20 @@ def _compiler_loop(references: {CompilerReference, Node}, stack: list[CompilerFr
 
     The best way to think of this is that  each Frame is a recursive call, with each reference being a
     single iteration of handling the expression within that call.
+
+    If dependents is provided, for each reference it is populated with the references of the frames which used it.
+    This allows reused references to be invalidated when the workbook changes (see ReferenceCache).
+
+    If recurrences is provided, cells computed by recurrences are built from the recurrence's loop (see
+    recurrence.py), and likewise if windows is provided cells of window blocks are built from the whole block (see
+    windows.py).  A frame requesting a reference which is still being built further down the stack is replaced by
+    its circular fallback; this happens when a recurrence or window block uses one of its own cells.
     """
+    # references of the frames which have started, outputs further down the stack may not have started yet.
+    building = set()
     while stack:
         frame = stack[-1]
+        building.add(frame.referenced_object)
         next_reference = frame.next_reference()
 
         if next_reference is None:
@@ -191,14 +464,24 @@ def _compiler_loop(references: {CompilerReference, Node}, stack: list[CompilerFr
             logger.debug(f"Creating reference for {frame.referenced_object}")
             references[frame.referenced_object] = node
             stack.pop()
+            building.discard(frame.referenced_object)
         elif next_reference in references:
             # Compilerframe requesting link to node that has already been computed; push that result back into
             # the frame as an input.
+            if dependents is not None:
+                dependents.setdefault(next_reference, set()).add(frame.referenced_object)
             frame.push_node(references[next_reference])
+        elif next_reference in building:
+            stack[-1] = frame.circular_fallback()
         else:
             # This is a reference we haven't seen before; so we need to determine how to handle it
             # in most cases this will create a new Compiler Reference Frame.
-            new_obj = _process_next_reference(frame, next_reference)
+            new_obj = _process_next_reference(frame, next_reference, references, recurrences, windows)
+            if dependents is not None and _function_name(next_reference) in SPECIAL_FUNCTION_MAP:
+                # special functions depend on the cell they are used in (i.e. its position or array size) rather
+                # than their arguments.
+                cell_reference = CompilerReference(mode=CompilerReference.Mode.range, active_cell=frame.active_cell)
+                dependents.setdefault(cell_reference, set()).add(next_reference)
             # special case. This object is the result of the special funciton the next iteration of the loop
             # will pick it up and return it to parent context.
             if isinstance(new_obj, Node):
@@ -207,7 +490,10 @@ def _compiler_loop(references: {CompilerReference, Node}, stack: list[CompilerFr
                 stack.append(new_obj)
 
 
-def _process_next_reference(frame: CompilerFrame, next_reference: CompilerReference) -> Node | CompilerFrame:
+def _process_next_reference(frame: CompilerFrame, next_reference: CompilerReference,
+                            references: dict[CompilerReference, Node] = None,
+                            recurrences: RecurrenceIndex = None,
+                            windows: WindowIndex = None) -> Node | CompilerFrame:
     """
     Depending on the mode for the next reference different actions need to be taken. This function determines the
     correct next action and then produces either a "node" if the next action can be converted to a node or a
@@ -215,19 +501,19 @@ def _process_next_reference(frame: CompilerFrame, next_reference: CompilerRefere
 
     :param frame:  Current frame being processed
     :param next_reference: Next reference we are returning.
+    :param references: Nodes that have already been built.
+    :param recurrences: Recurrences found in the workbook.
+    :param windows: Window blocks found in the workbook.
     :return:  The next object or frame to be evaluated.
     """
     match next_reference.mode:
-        case CompilerReference.Mode.range:
+        case CompilerReference.Mode.range | CompilerReference.Mode.recurrence:
             # Compiler frame looking for a new range that has not been previously compiled, we need to find the frame
             # and push the link back to current frame.
-            result = create_compiler_frame(next_reference)
+            result = create_compiler_frame(next_reference, references, recurrences, windows)
         case CompilerReference.Mode.function:
-            fn_name_full = next_reference.func_data.name
             args = next_reference.func_data.args
-
-            # token includes opening bracket so drop last character, as well as new xl namespace XLFN
-            fn_name = fn_name_full[:-1].upper().replace("_XLFN.", "").replace(".", "_x_")
+            fn_name = _function_name(next_reference)
             if fn_name in SPECIAL_FUNCTION_MAP:
                 logger.debug(f"Special function {frame.active_cell} with name {fn_name} and values {args}")
                 result = SPECIAL_FUNCTION_MAP[fn_name](frame, args)
@@ -240,3 +526,11 @@ def _process_next_reference(frame: CompilerFrame, next_reference: CompilerRefere
         case _:
             raise NotImplementedError()
     return result
+
+
+def _function_name(reference: CompilerReference) -> str | None:
+    """ Normalized name of the function called by a function reference, or None for other references. """
+    if reference.mode != CompilerReference.Mode.function:
+        return None
+    # token includes opening bracket so drop last character, as well as new xl namespace XLFN
+    return reference.func_data.name[:-1].upper().replace("_XLFN.", "").replace(".", "_x_")
@@ -3,12 +3,20 @@ from collections import deque
 from dataclasses import dataclass
 from enum import Enum
 
+import numpy
 from openpyxl.formula import Tokenizer
+from openpyxl.formula.tokenizer import Token
 
-from .excel_reference import ExcelReference, BIN_OP_MAP
+from .excel_reference import ExcelReference, BIN_OP_MAP, DataType
 from .logger import logger
-from .nodes import FunctionOpNode, Node, LiteralNode, ComparisonNode, BinOpNode, ExcelArrayNode, IndexNode
+from .exceptions import UnsupportedException
+from .nodes import FunctionOpNode, Node, LiteralNode, ComparisonNode, BinOpNode, ExcelArrayNode, IndexNode, InputNode, \
+    RecurrenceNode, RecurrenceElementNode
+from .r1c1 import MAX_ROW, MAX_COLUMN, parse_cell_token, relative_signature, range_address
+from .recurrence import Recurrence, RecurrenceIndex, ELEMENT, MOVING
+from .shape import Shape
 from .shunting_yards import ShuntingYardsOperator
+from .windows import Window, WindowIndex
 
 TokenType = type(Tokenizer('').token)
 
@@ -16,10 +24,11 @@ TokenType = type(Tokenizer('').token)
 class CompilerReference:
     """
     CompilerReferences represent a request that the main loop needs to satisfy by providing a Node which matches this
-    reference.  There are 3 types of references which take different data packages.
+    reference.  There are 4 types of references which take different data packages.
         1) Range - these are excel ranges
         2) Function - represents a function call
         3) Paraen - A bracketted statement
+        4) Recurrence - a block of cells computed by a loop, see recurrence.py
     """
 
     @dataclass
@@ -33,6 +42,7 @@ class CompilerReference:
         range = 1
         function = 2
         paren = 3
+        recurrence = 4
 
     def __init__(self,
                  mode: Mode,
@@ -51,17 +61,34 @@ class CompilerReference:
         elif mode == CompilerReference.Mode.function:
             assert isinstance(data, self.__class__.FunctionCallData)
             self.func_data = data
+        elif mode == CompilerReference.Mode.recurrence:
+            assert isinstance(data, tuple)
         else:
             raise NotImplementedError(f"Mode {mode} has not be implemented")
+        # range references are identified by the interned key of their cells, so the compiler loop compares keys
+        # rather than reference objects.
+        if mode == CompilerReference.Mode.range:
+            self._identity = (mode, active_cell.key)
+        else:
+            self._identity = (mode, active_cell.key.sheet, self.data)
+        # references are looked up repeatedly in the compiler loop, so only compute the hash once.
+        self._hash = hash(self._identity)
 
     def __repr__(self) -> str:
         return f"{self.mode} : {self.active_cell.sheet} : {self.data}"
 
     def __eq__(self, other):
-        return self.active_cell.sheet == other.active_cell.sheet and self.data == other.data
+        if not isinstance(other, CompilerReference):
+            return NotImplemented
+        return self is other or (self._hash == other._hash and self._identity == other._identity)
 
     def __hash__(self):
-        return hash(self.active_cell.sheet) ^ hash(self.data)
+        return self._hash
+
+    def __setstate__(self, state):
+        # hashes of strings differ between processes, so the hash of a pickled reference is computed again.
+        self.__dict__.update(state)
+        self._hash = hash(self._identity)
 
 
 class CompilerFrame(metaclass=ABCMeta):
@@ -126,12 +153,28 @@ class CompilerFrame(metaclass=ABCMeta):
     def finalize(self) -> Node:
         raise NotImplementedError()
 
+    def circular_fallback(self) -> 'CompilerFrame':
+        """
+        Frame to use instead of this frame when it requests a reference which is still being built further down the
+        stack.  Only frames which have another way of building their reference can recover, otherwise the workbook
+        has a circular reference.
+        """
+        raise UnsupportedException(f"Circular reference found while building {self.referenced_object}")
+
     def consume(self):
         # shouldn't happen unless enters START state which is only on _Token frames.  Added here to avoid
         # alerts in IDE messages in compiler.py, however, if ever called should error.
         raise NotImplementedError()
 
 
+class NodeToken(Token):
+    """ Operand standing in for a node which has already been built, used to substitute references in formulas. """
+
+    def __init__(self, node: Node):
+        super().__init__(node.varname, Token.OPERAND, Token.RANGE)
+        self.node = node
+
+
 class _TokenFrame(CompilerFrame):
     """
     Token frame is the root processor for tokenized expressions.  It takes a string of tokens
@@ -154,7 +197,9 @@ class _TokenFrame(CompilerFrame):
 
             match token.type:
                 case token.OPERAND:
-                    if token.subtype == token.RANGE:
+                    if isinstance(token, NodeToken):
+                        self._operator.push_output(token.node)
+                    elif token.subtype == token.RANGE:
                         new_reference = self.active_cell.create_relative(token.value)
                         assert new_reference
                         self._next_reference = CompilerReference(mode=CompilerReference.Mode.range,
@@ -274,13 +319,20 @@ class FunctionCompilerFrame(CompilerFrame):
 
 
 class RangeBuildFrame(CompilerFrame):
-    def __init__(self, range_ref: CompilerReference, parent: CompilerFrame = None):
+    """
+    Builds a range from the nodes of each of its cells.  Ranges made up only of numeric constants are built directly
+    as a single array literal, without creating a node for each cell.
+    """
+
+    def __init__(self, range_ref: CompilerReference, parent: CompilerFrame = None,
+                 references: dict[CompilerReference, Node] = None):
         super().__init__(ref=range_ref, parent=parent)
         self._cells = list(range_ref.data.get_cells())
         self._args: list[Node] = []
+        self._constant = _constant_range(self._cells, range_ref.data.shape, references)
 
     def next_reference(self):
-        if len(self._cells) == len(self._args):
+        if self._constant is not None or len(self._cells) == len(self._args):
             return None
         else:
             return CompilerReference(mode=CompilerReference.Mode.range, active_cell=self._cells[len(self._args)])
@@ -289,20 +341,169 @@ class RangeBuildFrame(CompilerFrame):
         self._args.append(node)
 
     def finalize(self):
+        if self._constant is not None:
+            logger.debug(f"Range {self._ref.data} built as constant array")
+            return LiteralNode(self.next_idx(), self._constant)
         return ExcelArrayNode(self.next_idx(), self._ref.data.shape, self._args)
 
 
+def _constant_range(cells: list[ExcelReference], shape, references: dict[CompilerReference, Node] | None):
+    """
+    Values of a range as an array if every cell is a number or blank, otherwise None.  Cells that have been
+    overridden by another node (i.e. inputs) can't be constant.  The array type is deduced from the values the same
+    way as for the array built by ExcelArrayNode.
+    """
+    values = []
+    for cell in cells:
+        if cell.is_array:
+            return None
+        if references is not None:
+            node = references.get(CompilerReference(mode=CompilerReference.Mode.range, active_cell=cell))
+            if node is not None and not isinstance(node, LiteralNode):
+                return None
+
+        match cell.data_type:
+            case 'n':
+                values.append(cell.value)
+            case 'X':
+                values.append(None)
+            case _:
+                return None
+
+    if all(value is None for value in values):
+        return None  # nothing to deduce the type from, leave to ExcelArrayNode to report.
+    values = [0 if value is None else value for value in values]
+    return numpy.array(values).reshape(shape)
+
+
+class FormulaBlockFrame(_TokenFrame):
+    """
+    Builds a vertical or horizontal range in which every cell has the same formula relative to its position (i.e. a
+    formula filled down a column) as a single array expression, rather than building each of its cells.  The tokens are
+    the formula with its relative references replaced by the ranges they refer to across the block, see
+    formula_block_tokens.
+    """
+
+    def __init__(self, range_ref: CompilerReference, tokens: deque, parent: CompilerFrame = None):
+        super().__init__(ref=range_ref, tokens=tokens, parent=parent)
+
+    def finalize(self):
+        logger.debug(f"Range {self._ref.data} built as formula block")
+        return super().finalize()
+
+
+def formula_block_tokens(block: ExcelReference, references: dict[CompilerReference, Node] = None) -> deque | None:
+    """
+    Tokens computing every cell of a range at once, if the range is a vertical or horizontal block of the same formula,
+    otherwise None.
+
+    Formulas are compared in relative (R1C1) form, so a formula filled down a column is the same in every cell.  Each
+    reference which moves along the block is replaced by the range it covers, e.g. =B1*2 filled down C1:C100 becomes
+    =B1:B100*2, while references which are fixed along the block (i.e. $B$1) are left as is.  Only formulas made of
+    operators and functions which apply elementwise can be built this way, and they must not refer to the block
+    itself.
+    """
+    shape = block.shape
+    if not block.is_range or not shape.is_vector:
+        return None
+
+    cells = block.get_cells()
+    signature = None
+    tokens = None
+    for cell in cells:
+        if cell.is_array or cell.data_type != 'f':
+            return None
+        if references is not None and isinstance(
+                references.get(CompilerReference(mode=CompilerReference.Mode.range, active_cell=cell)), InputNode):
+            return None
+
+        cell_tokens = Tokenizer(cell.value).items
+        cell_signature = relative_signature(cell.key.min_row, cell.key.min_col, cell_tokens)
+        if signature is None:
+            signature, tokens = cell_signature, cell_tokens
+        elif cell_signature != signature:
+            return None
+
+    if signature is None or not all(_elementwise_token(token) for token in tokens):
+        return None
+
+    key = block.key
+    vertical = shape.vertical
+    block_tokens = deque()
+    moving = False
+    for token in tokens:
+        cell = parse_cell_token(token.value) if token.type == token.OPERAND else None
+        if cell is None:
+            block_tokens.append(token)
+            continue
+
+        if vertical and not cell.row_abs:
+            last_col, last_row = cell.col, cell.row + key.max_row - key.min_row
+        elif not vertical and not cell.col_abs:
+            last_col, last_row = cell.col + key.max_col - key.min_col, cell.row
+        else:
+            block_tokens.append(token)
+            continue
+
+        if last_row > MAX_ROW or last_col > MAX_COLUMN:
+            return None
+        address = range_address(cell.sheet, cell.col, cell.row, last_col, last_row)
+        moving_ref = block.create_relative(address)
+        moving_key = moving_ref.key
+        if moving_ref.sheet == block.sheet and moving_key.min_row <= key.max_row and \
+                moving_key.max_row >= key.min_row and moving_key.min_col <= key.max_col and \
+                moving_key.max_col >= key.min_col:
+            return None  # refers to the block itself, cells depend on the previous cells of the block.
+        block_tokens.append(Token(address, Token.OPERAND, Token.RANGE))
+        moving = True
+
+    # a formula with no moving references is the same value for every cell, which isn't an array expression.
+    return block_tokens if moving else None
+
+
+def _elementwise_token(token: TokenType) -> bool:
+    """ Whether the token applies elementwise to arrays, giving the same result as applying it to each cell. """
+    match token.type:
+        case token.OPERAND if token.subtype == token.RANGE:
+            return parse_cell_token(token.value) is not None  # ranges don't apply elementwise
+        case token.OPERAND:
+            return token.subtype in (token.NUMBER, token.LOGICAL)
+        case token.OP_IN:
+            return token.value in BIN_OP_MAP and token.value != '&'
+        case token.OP_PRE | token.OP_POST | token.PAREN | token.WSPACE:
+            return True
+        case token.FUNC if token.subtype == token.CLOSE:
+            return True
+        case token.FUNC:
+            from . import excel_functions as exl
+
+            # function arguments are separated by SEP tokens which aren't supported, so only single argument calls.
+            fn_name = token.value[:-1].upper().replace("_XLFN.", "").replace(".", "_x_")
+            try:
+                return isinstance(exl.find_function_details(fn_name), exl.NumpyUFunction)
+            except (NotImplementedError, UnsupportedException):
+                return False
+        case _:
+            return False
+
+
 class IndexExtractFrame(CompilerFrame):
-    def __init__(self, ref: CompilerReference, offsets, parent: CompilerFrame = None):
+    def __init__(self, ref: CompilerReference, offsets, parent: CompilerFrame = None,
+                 array_ref: CompilerReference = None):
+        """
+        :param array_ref: Reference to the array the offsets are within, defaults to the array formula the referenced
+        cell is part of.
+        """
         super().__init__(ref=ref, parent=parent)
-        self._array_ref = ref.data.array_src
+        if array_ref is None:
+            array_ref = CompilerReference(mode=CompilerReference.Mode.range, active_cell=ref.data.array_src)
+        self._array_ref = array_ref
         self._offset = offsets
         self._array_node = None
 
     def next_reference(self):
         if self._array_node is None:
-            assert self._array_ref
-            return CompilerReference(mode=CompilerReference.Mode.range, active_cell=self._array_ref)
+            return self._array_ref
         else:
             return None
 
@@ -313,6 +514,158 @@ class IndexExtractFrame(CompilerFrame):
         return IndexNode(self.next_idx(), self._array_node, self._offset)
 
 
+class RecurrenceSliceFrame(IndexExtractFrame):
+    """
+    Extracts a cell or range computed by a recurrence from the array holding the recurrence.  If the recurrence uses
+    the reference itself (i.e. through a fixed reference in to the loop) the reference is built from the workbook
+    instead.
+    """
+
+    def __init__(self, ref: CompilerReference, recurrence: Recurrence, offsets,
+                 references: dict[CompilerReference, Node] = None):
+        array_ref = CompilerReference(mode=CompilerReference.Mode.recurrence, active_cell=recurrence.box,
+                                      data=recurrence.key)
+        super().__init__(ref=ref, offsets=offsets, array_ref=array_ref)
+        self._references = references
+
+    def circular_fallback(self) -> CompilerFrame:
+        logger.debug(f"{self._ref} is used by its own recurrence, building from the workbook")
+        return _workbook_frame(self._ref, self._references)
+
+
+class RecurrenceFrame(CompilerFrame):
+    """
+    Builds a recurrence as a single loop (see RecurrenceNode).  The seeds and the references used by the templates
+    are built first, then each template is built from its formula with its cell references replaced by nodes reading
+    the loop's array or the references.
+    """
+
+    def __init__(self, ref: CompilerReference, recurrence: Recurrence, parent: CompilerFrame = None):
+        super().__init__(ref=ref, parent=parent)
+        self._recurrence = recurrence
+        self._buffer = self.next_idx()
+        self._counter = self.next_idx()
+        self._seeds = recurrence.seed_cells()
+
+        # references used by the templates, those moving along with the loop are read through an alias.
+        self._externals: dict[tuple[str, ExcelReference], str | None] = {}
+        for template in recurrence.templates:
+            for template_ref in template.refs.values():
+                key = (template_ref.kind, template_ref.reference)
+                if template_ref.kind != ELEMENT and key not in self._externals:
+                    self._externals[key] = self.next_idx() if template_ref.kind == MOVING else None
+
+        cells = [cell for cell, _ in self._seeds] + [reference for _, reference in self._externals]
+        self._requests = [CompilerReference(mode=CompilerReference.Mode.range, active_cell=x) for x in cells]
+        self._template_refs: list[CompilerReference] = []
+        self._nodes: list[Node] = []
+
+    def next_idx(self) -> str:
+        self._idx += 1
+        return f"{self.active_cell.encode_name()}_rec_{self._idx}"
+
+    def next_reference(self) -> CompilerReference | None:
+        built = len(self._nodes)
+        if built < len(self._requests):
+            return self._requests[built]
+
+        idx = built - len(self._requests)
+        if idx == len(self._recurrence.templates):
+            return None
+        if idx == len(self._template_refs):
+            template = self._recurrence.templates[idx]
+            self._template_refs.append(CompilerReference(mode=CompilerReference.Mode.paren, active_cell=template.cell,
+                                                         data=self._template_tokens(template)))
+        return self._template_refs[idx]
+
+    def push_node(self, node: Node):
+        self._nodes.append(node)
+
+    def _template_tokens(self, template) -> tuple[TokenType, ...]:
+        recurrence = self._recurrence
+        externals = dict(zip(self._externals, self._nodes[len(self._seeds):]))
+        tokens = list(template.tokens)
+        for position, template_ref in template.refs.items():
+            if template_ref.kind == ELEMENT:
+                node = RecurrenceElementNode(self.next_idx(), self._buffer, self._counter, template_ref.offset,
+                                             recurrence.column(template_ref.line), recurrence.vertical)
+            elif template_ref.kind == MOVING:
+                # moving ranges start at the start of the loop rather than the start of the array.
+                alias = self._externals[(MOVING, template_ref.reference)]
+                node = RecurrenceElementNode(self.next_idx(), alias, self._counter,
+                                             recurrence.first - recurrence.start, 0, recurrence.vertical)
+            else:
+                node = externals[(template_ref.kind, template_ref.reference)]
+            tokens[position] = NodeToken(node)
+        return tuple(tokens)
+
+    def finalize(self):
+        recurrence = self._recurrence
+        seed_nodes = self._nodes[:len(self._seeds)]
+        external_nodes = self._nodes[len(self._seeds):len(self._requests)]
+        template_nodes = self._nodes[len(self._requests):]
+
+        # blank seeds are left as zero.
+        seeds = [(node, offsets) for node, (_, offsets) in zip(seed_nodes, self._seeds)
+                 if node.data_type != DataType.Blank]
+        externals = list(zip(external_nodes, self._externals.values()))
+        templates = []
+        for node, template in zip(template_nodes, recurrence.templates):
+            if node.data_type == DataType.String:
+                raise UnsupportedException(f"Recurrence {recurrence.box} computes strings, only numbers are supported")
+            templates.append((node, recurrence.column(template.line)))
+
+        size = recurrence.last - recurrence.first + 1
+        shape = Shape(size, len(templates)) if recurrence.vertical else Shape(len(templates), size)
+        loop = (recurrence.start - recurrence.first, size)
+        logger.debug(f"Recurrence {recurrence.box} built as a loop over {loop}")
+        return RecurrenceNode(self._buffer, shape, recurrence.vertical, self._counter, loop, seeds, externals,
+                              templates)
+
+
+class WindowSliceFrame(IndexExtractFrame):
+    """
+    Extracts a cell or range of a window block (see windows.py) from the result of the whole block.  If the block uses
+    the reference itself (i.e. the source of the windows depends on the block) the reference is built from the
+    workbook instead.
+    """
+
+    def __init__(self, ref: CompilerReference, window: Window, offsets,
+                 references: dict[CompilerReference, Node] = None):
+        array_ref = CompilerReference(mode=CompilerReference.Mode.range, active_cell=window.box)
+        super().__init__(ref=ref, offsets=offsets, array_ref=array_ref)
+        self._references = references
+
+    def circular_fallback(self) -> CompilerFrame:
+        logger.debug(f"{self._ref} is used by its own window block, building from the workbook")
+        return _workbook_frame(self._ref, self._references)
+
+
+class WindowFrame(CompilerFrame):
+    """ Builds a window block (see windows.py) with a single pass over the source of its windows. """
+
+    def __init__(self, ref: CompilerReference, window: Window, parent: CompilerFrame = None):
+        super().__init__(ref=ref, parent=parent)
+        self._window = window
+        self._source = None
+
+    def next_reference(self) -> CompilerReference | None:
+        if self._source is None:
+            return CompilerReference(mode=CompilerReference.Mode.range, active_cell=self._window.source)
+        return None
+
+    def push_node(self, node: Node):
+        self._source = node
+
+    def finalize(self):
+        window = self._window
+        if self._source.data_type != DataType.Number:
+            raise UnsupportedException(f"Windows of {window.box} are over {window.source} which isn't numeric")
+        logger.debug(f"Range {window.box} built as {window.function} of windows over {window.source}")
+        size = LiteralNode(self.next_idx(), window.size)
+        return FunctionOpNode(self.next_idx(), window.function_details, [self._source, size])
+
+
 def consume_until_matching_paren(tokens: deque) -> tuple[tuple[TokenType, ...], ...]:
     """
     Consume elements from the token stack storing them on a list of children stacks until we have
@@ -347,13 +700,47 @@ def consume_until_matching_paren(tokens: deque) -> tuple[tuple[TokenType, ...],
     return tuple(tuple(x for x in sublist) for sublist in children)
 
 
-def create_compiler_frame(ref: CompilerReference) -> CompilerFrame:
+def create_compiler_frame(ref: CompilerReference, references: dict[CompilerReference, Node] = None,
+                          recurrences: RecurrenceIndex = None, windows: WindowIndex = None) -> CompilerFrame:
     """
     Create compiler frame to build and return a specific reference.
+
+    :param ref: Reference to build.
+    :param references: Nodes already built, cells which are already built (i.e. inputs) are not read from the
+    workbook.
+    :param recurrences: Recurrences found in the workbook, cells computed by a recurrence are extracted from its loop.
+    Recurrences aren't detected if not provided.
+    :param windows: Window blocks found in the workbook, cells of a block are extracted from the whole block.  Windows
+    aren't detected if not provided.
     """
     logger.debug(f"Starting on creation of data for {ref}")
+    if ref.mode == CompilerReference.Mode.recurrence:
+        return RecurrenceFrame(ref, recurrences[ref.data])
+
+    found = recurrences.find(ref.data) if recurrences is not None else None
+    if found is not None:
+        recurrence, offsets = found
+        logger.debug(f"Building {ref.data} from recurrence {recurrence.box} with offsets {offsets}")
+        return RecurrenceSliceFrame(ref, recurrence, offsets, references)
+
+    found = windows.find(ref.data) if windows is not None else None
+    if found is not None:
+        window, offsets = found
+        if ref.data.key == window.box.key:
+            return WindowFrame(ref, window)
+        logger.debug(f"Building {ref.data} from window block {window.box} with offsets {offsets}")
+        return WindowSliceFrame(ref, window, offsets, references)
+    return _workbook_frame(ref, references)
+
+
+def _workbook_frame(ref: CompilerReference, references: dict[CompilerReference, Node] = None) -> CompilerFrame:
+    """ Frame building a reference from the contents of its cells. """
     if ref.active_cell.is_range:
-        new_frame = RangeBuildFrame(ref)
+        tokens = formula_block_tokens(ref.data, references)
+        if tokens is not None:
+            new_frame = FormulaBlockFrame(ref, tokens)
+        else:
+            new_frame = RangeBuildFrame(ref, references=references)
     elif ref.active_cell.is_array:
         logger.debug(f"Building index frame for reference {ref.data} with offsets {ref.data.offsets}")
         new_frame = IndexExtractFrame(ref, ref.data.offsets)
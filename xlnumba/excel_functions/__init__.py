@@ -4,13 +4,16 @@ import math
 import numpy as np
 import scipy as scipy
 
-from . import information, text, statistical, logical, special, mathematical, lookup, user_functions
+from . import information, user_functions
 from .function_details import Function, ConstantFunction, NumpyUFunction, ScalarFunction, AggregatingFunction, \
-    UnsupportedFunction, numba_disabled, xjit
+    UnsupportedFunction, WindowFunction, numba_disabled
 from .logical import IfsFunction, SwitchFunction
 from .lookup import Lookup
 from ..exceptions import UnsupportedException
 from ..logger import logger
+from ..runtime import text, statistical, special, mathematical, window, xjit
+from ..runtime.logical import excel_xor, ifs_impl, switch_impl
+from ..runtime.lookup import choose
 from ..shape import SCALAR_SHAPE
 
 # Helpful listing of Excel functions
@@ -21,6 +24,17 @@ from ..shape import SCALAR_SHAPE
 ######################################
 INTERNAL_CONCAT = ScalarFunction(text.bin_op_concat)
 RECIPROCAL = NumpyUFunction(np.reciprocal)
+INTERNAL_SQRT = Function(np.sqrt)
+
+# aggregates over every window along a vector, see windows.py
+INTERNAL_EXPANDING_SUM = WindowFunction(window.expanding_sum)
+INTERNAL_EXPANDING_AVERAGE = WindowFunction(window.expanding_average)
+INTERNAL_EXPANDING_MAX = WindowFunction(window.expanding_max)
+INTERNAL_EXPANDING_MIN = WindowFunction(window.expanding_min)
+INTERNAL_SLIDING_SUM = WindowFunction(window.sliding_sum)
+INTERNAL_SLIDING_AVERAGE = WindowFunction(window.sliding_average)
+INTERNAL_SLIDING_MAX = WindowFunction(window.sliding_max)
+INTERNAL_SLIDING_MIN = WindowFunction(window.sliding_min)
 
 ######################################
 #       Aggregation Operators
@@ -61,7 +75,7 @@ OCT2HEX = numba_disabled(ScalarFunction(np.base_repr).chain(OCT2DEC).append(16))
 AND = AggregatingFunction(np.all, return_type=bool)
 OR = AggregatingFunction(np.any, return_type=bool)
 NOT = AggregatingFunction(np.logical_not, return_type=bool)
-XOR = AggregatingFunction(logical.excel_xor, return_type=bool)
+XOR = AggregatingFunction(excel_xor, return_type=bool)
 
 ######################################
 #           CONDITIONAL OPERATORS
@@ -69,8 +83,8 @@ XOR = AggregatingFunction(logical.excel_xor, return_type=bool)
 IF = Function(np.where)
 IFERROR = UnsupportedFunction(UnsupportedFunction.ERROR_CODE)
 IFNA = UnsupportedFunction(UnsupportedFunction.ERROR_CODE)
-IFS = IfsFunction(logical.ifs_impl)
-SWITCH = SwitchFunction(logical.switch_impl)
+IFS = IfsFunction(ifs_impl)
+SWITCH = SwitchFunction(switch_impl)
 
 ######################################
 #           Constant Value
@@ -93,7 +107,7 @@ TYPE = information.DataTypeFunction("TYPE")
 ######################################
 #       Lookup Operators
 ######################################
-CHOOSE = AggregatingFunction(lookup.choose, 1)
+CHOOSE = AggregatingFunction(choose, 1)
 HLOOKUP = Lookup(Lookup.Mode.HORIZONTAL)
 VLOOKUP = Lookup(Lookup.Mode.VERTICAL)
 LOOKUP = Lookup(Lookup.Mode.DETECT)
@@ -266,6 +280,7 @@ def xlnumba_function(name):
 
         assert not hasattr(user_functions, fn.__name__)
         setattr(user_functions, fn.__name__, cmp_fn)
+        user_functions.INSTALLED_FUNCTIONS[name] = fn
         globals()[name] = Function(cmp_fn)
         return fn
 
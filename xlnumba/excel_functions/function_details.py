@@ -4,14 +4,12 @@ import functools
 from typing import Iterable
 
 import numpy as np
-from numba import jit
 
 from ..excel_reference import DataType
 from ..exceptions import UnsupportedException
 from ..nodes import Node, LiteralNode, FlatArrayNode, FunctionOpNode
-from ..shape import SCALAR_SHAPE
-
-xjit = jit(nopython=True, fastmath=True)
+from ..runtime import xjit  # noqa: F401, defined by the runtime.
+from ..shape import Shape, SCALAR_SHAPE
 
 
 class UnsupportedFunction:
@@ -180,6 +178,19 @@ class AggregatingFunction(Function):
         self._add_prep(_aggregate_op, aggregation_idx)
 
 
+class WindowFunction(Function):
+    """
+    Window functions compute an aggregate over every window along a vector (see window.py).  The second argument is
+    the length of the first window, and the result has an element for each window in the same orientation as the
+    vector.
+    """
+
+    def compute_shape(self, children):
+        shape = children[0].shape
+        count = shape.size - children[1].value + 1
+        return Shape(count, 1) if shape.vertical else Shape(1, count)
+
+
 class ScalarFunction(Function):
     """
     Scalar functions apply to asingle element at a time and require a looping algorithm to apply them to all the
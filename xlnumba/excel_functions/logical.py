@@ -1,23 +1,9 @@
-import numpy as np
-
-from .function_details import Function, xjit
+from .function_details import Function
+from ..runtime.logical import excel_xor, ifs_impl, switch_impl, excel_if  # noqa: F401, kernels are in the runtime.
 from ..nodes import Node, FlatArrayNode
 from ..shape import SCALAR_SHAPE
 
 
-@xjit
-def excel_xor(arr):  # xor is defined as number of true values is odd
-    return np.count_nonzero(arr) % 2 == 1
-
-
-@xjit
-def ifs_impl(conds, values):
-    for c, vals in zip(conds, values):
-        if c:
-            return vals
-    raise NotImplementedError("Ifs must return valid entry")
-
-
 class IfsFunction(Function):
     """
     Excel makes use of alternating arguments, in the case of IFs a boolean and then a value.  Numba can't support that
@@ -42,14 +28,6 @@ class IfsFunction(Function):
             return SCALAR_SHAPE
 
 
-@xjit
-def switch_impl(expr, conds, values):
-    for c, vals in zip(conds, values):
-        if c == expr:
-            return vals
-    raise NotImplementedError("Invalid switch function")
-
-
 class SwitchFunction(Function):
     """
     See IFS above for idea.
@@ -67,8 +45,3 @@ class SwitchFunction(Function):
         else:
             # this could also be an array if we are copresing literal.
             return SCALAR_SHAPE
-
-
-@xjit
-def excel_if(test, true_val, false_val):
-    return true_val if test else false_val
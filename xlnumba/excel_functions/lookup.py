@@ -2,21 +2,9 @@ from enum import StrEnum
 
 import numpy as np
 
-from .function_details import xjit, Function
+from .function_details import Function
 from ..nodes import IndexNode, FunctionOpNode
-
-
-@xjit
-def choose(idx, arr):
-    return arr[idx - 1]
-
-
-@xjit
-def lookup(target, target_vector, value_vector, _approx=False):
-    for t, v in zip(target_vector[0], value_vector[0]):
-        if target == t:
-            return v
-    raise NotImplementedError("Lookups must find match to execute correctly")
+from ..runtime.lookup import choose, lookup  # noqa: F401, kernels are in the runtime.
 
 
 class Lookup(Function):
@@ -1,8 +1,9 @@
 import numpy as np
 
-from .function_details import BaseFunction, xjit
+from .function_details import BaseFunction
 from ..excel_reference import DataType
 from ..nodes import RandBetweenNode
+from ..runtime import xjit
 from ..shape import Shape
 
 
@@ -37,10 +37,15 @@ BIN_OP_MAP = {
 
 RangeBoundaries = namedtuple("RangeBoundaries", ["min_col", "min_row", "max_col", "max_row"])
 
+# Number of rows and columns in each block of the array index.
+ARRAY_INDEX_BLOCK_SIZE = 64
+
 
 class SheetDetails:
     def __init__(self, sheet):
-        self._arrays = {}
+        # arrays are indexed by the square blocks of the sheet they overlap, so that looking up the arrays around a
+        # cell only checks the few arrays in its block rather than every array on the sheet.
+        self._arrays: dict[tuple[int, int], list[tuple[RangeBoundaries, str]]] = {}
         for src_ref, array_ref in sheet.array_formulae.items():
             a_range = get_cell_range(array_ref)
             shape = Shape(a_range.max_row - a_range.min_row + 1, a_range.max_col - a_range.min_col + 1)
@@ -53,17 +58,19 @@ class SheetDetails:
                 # https://foss.heptapod.net/openpyxl/openpyxl/-/merge_requests/439
                 # eventually should integrate here to have proper behvaiour for rand, row functions
                 # when used in array context.
-                self._arrays[a_range] = src_ref
+                for block in _array_index_blocks(a_range):
+                    self._arrays.setdefault(block, []).append((a_range, src_ref))
 
     def get_array_src(self, cell_range):
         """
-        Determien if this cell range is a portion of an array;
-        Todo - this in O(n) so might be a problem if a sheet has a lot of array formulas
+        Determien if this cell range is a portion of an array; an array containing the range must contain its top left
+        cell so only the arrays in the block of that cell are checked.
         Todo - if the cell refernece _partially_ overlaps with arrays it is more complex; and not currently supported.
         but that seems unlikely.
         """
         result = None
-        for array_range, array_src in self._arrays.items():
+        block = (cell_range.min_row // ARRAY_INDEX_BLOCK_SIZE, cell_range.min_col // ARRAY_INDEX_BLOCK_SIZE)
+        for array_range, array_src in self._arrays.get(block, ()):
             # Todo figure out non-overlapping region.
             if cell_range.min_col >= array_range.min_col and cell_range.max_col <= array_range.max_col and \
                     cell_range.min_row >= array_range.min_row and cell_range.max_row <= array_range.max_row:
@@ -71,6 +78,45 @@ class SheetDetails:
         return result
 
 
+class CellKey:
+    """
+    Compact identity of a reference used for hashing and comparison in the compiler.  Keys are interned per workbook
+    (see _cell_key), so equal references share the same key and compare by identity with a precomputed hash.
+
+    The compiler loop identifies references by their key (see CompilerReference), while ExcelReference wraps a key
+    with access to the workbook.  Frames need the wrapper anyway to read the formula or value of the cell they build,
+    so the loop isn't written in terms of keys alone.
+    """
+    __slots__ = ('sheet_id', 'sheet', 'min_row', 'min_col', 'max_row', 'max_col', 'ref_type', '_hash')
+
+    def __init__(self, sheet_id: int, sheet: str, bounds: RangeBoundaries, ref_type: str):
+        self.sheet_id = sheet_id
+        self.sheet = sheet
+        self.min_col, self.min_row, self.max_col, self.max_row = bounds
+        self.ref_type = ref_type
+        self._hash = hash((sheet, *bounds, ref_type))
+
+    def _details(self):
+        return self.sheet, self.min_row, self.min_col, self.max_row, self.max_col, self.ref_type
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, CellKey):
+            return NotImplemented
+        # keys from the same workbook are interned, only keys from different workbooks need comparing.
+        return self is other or (self._hash == other._hash and self._details() == other._details())
+
+    def __repr__(self):
+        return f"CellKey{self._details()}"
+
+    def __reduce__(self):
+        # hashes of strings differ between processes, so pickled keys are built again rather than keeping their hash.
+        bounds = self.min_col, self.min_row, self.max_col, self.max_row
+        return CellKey, (self.sheet_id, self.sheet, bounds, self.ref_type)
+
+
 class ExcelReference:
     class ReferenceType(StrEnum):
         CELL = 'cell'
@@ -83,12 +129,6 @@ class ExcelReference:
         if active_sheet is None:
             active_sheet = wb.active.title
 
-        if not hasattr(self._wb[active_sheet], '__xlnumba'):
-            wb_details = SheetDetails(self._wb[active_sheet])
-            setattr(self._wb[active_sheet], '__xlnumba', wb_details)
-        else:
-            wb_details = getattr(self._wb[active_sheet], '__xlnumba')
-
         self._sheet, self._cell_ref = _split_cell_address(address, active_sheet)
 
         if re.match(COLUMN_FORMAT_EXPRESSION, self._cell_ref):
@@ -115,18 +155,42 @@ class ExcelReference:
 
         self._array_src = None
         if self._ref_type != self.ReferenceType.ARRAY_REF:
-            cell_range = get_cell_range(self._cell_ref)
-            src_ref = wb_details.get_array_src(cell_range)
-            if src_ref is not None:
-                array_range = self._wb[self._sheet].array_formulae.get(src_ref)
-                self._array_src = src_ref + '#'
-
-                if cell_range == array_range:
-                    logger.debug(f"Found range array reference {src_ref}# for range {self._cell_ref}")
-                    assert self._ref_type != self.ReferenceType.CELL
-                    self._ref_type = self.ReferenceType.ARRAY_REF
-                else:
-                    self._ref_type = self.ReferenceType.ARRAY
+            self._resolve_array(get_cell_range(self._cell_ref))
+            self._key = _cell_key(self._wb, self._sheet, get_cell_range(self._cell_ref), self._ref_type)
+        else:
+            self._key = _cell_key(self._wb, self._sheet, get_cell_range(self._cell_ref[:-1]), self._ref_type)
+
+    @classmethod
+    def _from_cell(cls, wb, sheet: str, row: int, column: int) -> 'ExcelReference':
+        """
+        Create a reference to a single cell from its coordinates, avoiding parsing an address.  Used when expanding
+        ranges in to their cells.
+        """
+        ref = cls.__new__(cls)
+        ref._wb = wb
+        ref._sheet = sheet
+        ref._cell_ref = f"{openpyxl.utils.cell.get_column_letter(column)}{row}"
+        ref.range_name = None
+        ref._ref_type = cls.ReferenceType.CELL
+        ref._array_src = None
+        cell_range = RangeBoundaries(column, row, column, row)
+        ref._resolve_array(cell_range)
+        ref._key = _cell_key(wb, sheet, cell_range, ref._ref_type)
+        return ref
+
+    def _resolve_array(self, cell_range: RangeBoundaries):
+        """ Determine if the reference is part of an array formula """
+        src_ref = _sheet_details(self._wb[self._sheet]).get_array_src(cell_range)
+        if src_ref is not None:
+            array_range = self._wb[self._sheet].array_formulae.get(src_ref)
+            self._array_src = src_ref + '#'
+
+            if cell_range == array_range:
+                logger.debug(f"Found range array reference {src_ref}# for range {self._cell_ref}")
+                assert self._ref_type != self.ReferenceType.CELL
+                self._ref_type = self.ReferenceType.ARRAY_REF
+            else:
+                self._ref_type = self.ReferenceType.ARRAY
 
     def create_relative(self, coord):
         """ Create an Excel reference on the same sheet as current reference (if sheet not specified)"""
@@ -193,20 +257,48 @@ class ExcelReference:
         For range and aray type objects return the cells that underly this object.
         """
         if self._ref_type == self.ReferenceType.RANGE:
-            # todo fill this in!
-            min_col, min_row, max_col, max_row = openpyxl.utils.cell.range_boundaries(self._cell_ref)
-
+            key = self._key
             vals = []
-            for i in range(min_row, max_row + 1):
-                for j in range(min_col, max_col + 1):
-                    vals.append(
-                        ExcelReference(self._wb,
-                                       f"{self._sheet}!{openpyxl.utils.cell.get_column_letter(j)}{i}",
-                                       self._sheet))
+            for i in range(key.min_row, key.max_row + 1):
+                for j in range(key.min_col, key.max_col + 1):
+                    vals.append(ExcelReference._from_cell(self._wb, self._sheet, i, j))
             return vals
         else:
             raise NotImplementedError()
 
+    def fingerprint(self) -> tuple:
+        """
+        Summary of the workbook contents the node compiled from this reference depends on, excluding any other
+        references it uses.  If the fingerprint is unchanged after the workbook is edited the node can be reused.
+
+        Ranges include their cells, as constant ranges are built directly from the cells.  Ranges spanning a full row
+        or column of the sheet were likely expanded from a column (A:A) or row (1:1) reference and also depend on the
+        dimensions of the sheet.
+        """
+        sheet = self._wb[self._sheet]
+        details = (self._ref_type, self._array_src)
+        match self._ref_type:
+            case self.ReferenceType.CELL:
+                details += (self.data_type, self.value)
+            case self.ReferenceType.ARRAY_REF:
+                if self._cell_ref[:-1] in sheet.array_formulae:
+                    details += (self.shape, self.value)
+            case self.ReferenceType.ARRAY:
+                details += (self.offsets,)
+            case self.ReferenceType.RANGE:
+                bounds = get_cell_range(self._cell_ref)
+                for row in range(bounds.min_row, bounds.max_row + 1):
+                    for col in range(bounds.min_col, bounds.max_col + 1):
+                        cell = sheet.cell(row, col)
+                        value = cell.value
+                        if isinstance(value, openpyxl.worksheet.formula.ArrayFormula):
+                            value = (value.ref, value.text)
+                        details += (cell.data_type, value)
+                if (bounds.min_row == 1 and bounds.max_row == sheet.max_row) or \
+                        (bounds.min_col == 1 and bounds.max_col == sheet.max_column):
+                    details += (sheet.max_row, sheet.max_column)
+        return details
+
     def encode_name(self):
         """ Craete a string usable as a variable name from this Excel reference. """
         return (self._sheet + "_" + self._cell_ref.replace(":", "x")).replace("#", "_xx").lower()
@@ -257,15 +349,50 @@ class ExcelReference:
             else:
                 return self._wb[self._sheet][self._cell_ref].data_type
 
+    @property
+    def key(self) -> CellKey:
+        return self._key
+
     def __eq__(self, other):
-        assert isinstance(other, ExcelReference)
-        return self._cell_ref == other._cell_ref and self._sheet == other._sheet
+        if not isinstance(other, ExcelReference):
+            return NotImplemented
+        return self._key == other._key
 
     def __repr__(self):
         return f"{self._sheet}!{self._cell_ref}"
 
     def __hash__(self):
-        return hash(str(self))
+        return self._key._hash
+
+
+def _cell_key(wb, sheet: str, bounds: RangeBoundaries, ref_type: str) -> CellKey:
+    """ Interned key for the reference; the table of keys is built once per workbook and stored on the workbook. """
+    if not hasattr(wb, '__xlnumba_keys'):
+        setattr(wb, '__xlnumba_keys', ({}, {}))
+    sheet_ids, keys = getattr(wb, '__xlnumba_keys')
+
+    details = (sheet, bounds, ref_type)
+    key = keys.get(details)
+    if key is None:
+        sheet_id = sheet_ids.setdefault(sheet, len(sheet_ids))
+        key = keys[details] = CellKey(sheet_id, sheet, bounds, ref_type)
+    return key
+
+
+def _sheet_details(sheet) -> SheetDetails:
+    """ Sheet details are built once per sheet and stored on the sheet. """
+    if not hasattr(sheet, '__xlnumba'):
+        setattr(sheet, '__xlnumba', SheetDetails(sheet))
+    return getattr(sheet, '__xlnumba')
+
+
+def _array_index_blocks(cell_range: RangeBoundaries):
+    """ Blocks of the array index which overlap the range. """
+    for block_row in range(cell_range.min_row // ARRAY_INDEX_BLOCK_SIZE,
+                           cell_range.max_row // ARRAY_INDEX_BLOCK_SIZE + 1):
+        for block_col in range(cell_range.min_col // ARRAY_INDEX_BLOCK_SIZE,
+                               cell_range.max_col // ARRAY_INDEX_BLOCK_SIZE + 1):
+            yield block_row, block_col
 
 
 def _split_cell_address(address: str, default_sheet=None):
@@ -1,9 +1,15 @@
 import ast
+import inspect
+import textwrap
 
 import astor
 
+from .ast import NUMBA_FLAGS, ast_call
+from .excel_functions import user_functions
 from .logger import logger
 
+USER_FUNCTIONS_MODULE = 'user_functions'
+
 
 def evaluate(statements, exec_ctx, logging_name):
     """
@@ -33,22 +39,89 @@ def get_execution_context():
     """
     exec_ctx = {}
     # import required modules to the execution context in order to build the function
-    import_list = [ast.Import(names=[
+    import_mod = ast.Module(ast_imports())
+    ast.fix_missing_locations(import_mod)
+    exec(compile(import_mod, '<string>', 'exec'), exec_ctx, exec_ctx)
+    return exec_ctx
+
+
+def ast_module(statements: list[ast.stmt]) -> ast.Module:
+    """
+    Build a self-contained module around generated statements.  Rather than importing the user functions registry,
+    which is only populated once the user's code has registered its functions, the source of every user function
+    referenced by the statements is copied into the module.
+
+    :param statements: Generated statements, usually function definitions.
+    :return: Module with imports, user functions and the statements.
+    """
+    body = ast_imports(include_user_functions=False)
+    body.append(ast.Import(names=[ast.alias('types', 'types')]))
+
+    names = _referenced_user_functions(statements)
+    for name in names:
+        body.append(_user_function_def(name))
+
+    # generated code references user functions as attributes of the user_functions module so recreate it here.
+    body.append(ast.Assign(
+        targets=[ast.Name(id=USER_FUNCTIONS_MODULE, ctx=ast.Store())],
+        value=ast_call('types.ModuleType', [ast.Constant(USER_FUNCTIONS_MODULE)])
+    ))
+    for name in names:
+        body.append(ast.Assign(
+            targets=[ast.Attribute(value=ast.Name(id=USER_FUNCTIONS_MODULE, ctx=ast.Load()), attr=name,
+                                   ctx=ast.Store())],
+            value=ast.Name(id=name, ctx=ast.Load())
+        ))
+
+    module = ast.Module(body=body + statements, type_ignores=[])
+    ast.fix_missing_locations(module)
+    return module
+
+
+def ast_imports(include_user_functions=True) -> list[ast.stmt]:
+    """
+    :param include_user_functions: Import the module containing registered user functions.
+    :return: The import statements required by generated code, shared between the execution context and generated
+    modules.
+    """
+    names = [
         ast.alias('numpy', 'numpy'),
         ast.alias('numba', 'numba'),
         ast.alias('logging', 'logging'),
-        ast.alias('xlnumba.excel_functions.mathematical', 'mathematical'),
-        ast.alias('xlnumba.excel_functions.logical', 'logical'),
-        ast.alias('xlnumba.excel_functions.statistical', 'statistical'),
-        ast.alias('xlnumba.excel_functions.text', 'text'),
-        ast.alias('xlnumba.excel_functions.lookup', 'lookup'),
-        ast.alias('xlnumba.excel_functions.special', 'special'),
-        ast.alias('xlnumba.excel_functions.user_functions', 'user_functions'),
+        ast.alias('xlnumba.runtime.mathematical', 'mathematical'),
+        ast.alias('xlnumba.runtime.logical', 'logical'),
+        ast.alias('xlnumba.runtime.statistical', 'statistical'),
+        ast.alias('xlnumba.runtime.text', 'text'),
+        ast.alias('xlnumba.runtime.lookup', 'lookup'),
+        ast.alias('xlnumba.runtime.special', 'special'),
+        ast.alias('xlnumba.runtime.window', 'window'),
         ast.alias('scipy', 'scipy'),
         ast.alias('builtins', 'builtins')
-    ])]
+    ]
+    if include_user_functions:
+        names.append(ast.alias('xlnumba.excel_functions.user_functions', USER_FUNCTIONS_MODULE))
+    return [ast.Import(names=names)]
 
-    import_mod = ast.Module(import_list)
-    ast.fix_missing_locations(import_mod)
-    exec(compile(import_mod, '<string>', 'exec'), exec_ctx, exec_ctx)
-    return exec_ctx
+
+def _referenced_user_functions(statements: list[ast.stmt]) -> list[str]:
+    """ Names of user functions called by the statements, in order of first use. """
+    names = {}
+    for stmt in statements:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and \
+                    node.value.id == USER_FUNCTIONS_MODULE:
+                names[node.attr] = None
+    return list(names)
+
+
+def _user_function_def(name: str) -> ast.FunctionDef:
+    """
+    Recreate the definition of a registered user function from its source, replacing the registration decorator
+    with the numba decorator applied when it was registered.
+    """
+    fn = next(x for x in user_functions.INSTALLED_FUNCTIONS.values() if x.__name__ == name)
+    fn_def = ast.parse(textwrap.dedent(inspect.getsource(fn))).body[0]
+    assert isinstance(fn_def, ast.FunctionDef)
+    keywords = [ast.keyword(arg=key, value=ast.Constant(NUMBA_FLAGS[key])) for key in ('nopython', 'fastmath')]
+    fn_def.decorator_list = [ast_call('numba.jit', [], keywords)]
+    return fn_def
@@ -0,0 +1,216 @@
+"""
+Incremental compilation keeps the nodes built for each compiler reference between compilations.  When the workbook is
+edited only the references whose cells changed, along with everything which transitively depends on them, are rebuilt;
+the rest of the graph is reused as is.
+
+The cache lives on the Compiler and, when compiling a file with a cache_dir, is also written next to the compiled
+modules (see CompilationCache.store_references) so a compiler in a new process starts from the nodes of the last
+compilation.  Nodes are pickled one at a time, referring to each other by index, as chains of them run deeper than
+pickle can recurse.  The workbook is not pickled, references are bound to the workbook being compiled when loaded.
+"""
+import importlib
+import pickle
+from functools import reduce
+
+import numba
+import openpyxl
+
+from .compiler_frame import CompilerReference
+from .excel_reference import ExcelReference
+from .logger import logger
+from .nodes import Node, InputNode, wrap_input
+
+# references built from the cells they refer to, rather than from the references they use.
+FINGERPRINT_MODES = (CompilerReference.Mode.range, CompilerReference.Mode.recurrence)
+
+# persistent id of the workbook in a pickled cache, see ReferenceCache.dump.
+WORKBOOK_ID = 'workbook'
+
+
+class ReferenceCache:
+    """
+    Nodes built by previous compilations keyed by compiler reference, along with the dependencies between references
+    and a fingerprint of the cells each range reference was built from.
+
+    Nodes in the cache must never be modified, optimizations are run on a copy of the graph (see clone_graph).
+    """
+
+    def __init__(self):
+        self.references: dict[CompilerReference, Node] = {}
+        # reverse dependencies; reference to the set of references which were built using it.
+        self.dependents: dict[CompilerReference, set[CompilerReference]] = {}
+        self.fingerprints: dict[CompilerReference, tuple] = {}
+        self._input_nodes: dict[CompilerReference, InputNode] = {}
+        self._workbook_signature = None
+        self._input_signature = None
+
+    def clear(self):
+        self.references.clear()
+        self.dependents.clear()
+        self.fingerprints.clear()
+        self._input_nodes.clear()
+
+    def validate(self, wb: openpyxl.Workbook, inputs: dict[str, ExcelReference]) -> None:
+        """
+        Drop any cached nodes which are no longer valid for the workbook.  Changes to the sheets, defined names or
+        inputs can change how any formula is interpreted, so invalidate everything.  Otherwise only references whose
+        fingerprint changed and their dependents are removed.
+        """
+        workbook_signature = (tuple(wb.sheetnames), tuple((k, v.value) for k, v in wb.defined_names.items()))
+        input_signature = tuple((name, repr(ref), ref.shape, ref.data_type) for name, ref in inputs.items())
+        if workbook_signature != self._workbook_signature or input_signature != self._input_signature:
+            if self.references:
+                logger.debug("Workbook structure or inputs changed, discarding %d cached references",
+                             len(self.references))
+            self.clear()
+        else:
+            self._rebind(wb)
+
+        self._workbook_signature = workbook_signature
+        self._input_signature = input_signature
+
+        changed = [key for key, fingerprint in self.fingerprints.items()
+                   if key.active_cell.fingerprint() != fingerprint]
+        if changed:
+            self._invalidate(changed)
+
+    def seed_inputs(self, inputs: dict[str, ExcelReference]) -> set[CompilerReference]:
+        """
+        Input nodes override any formula in the input cells, the same nodes are used across compilations so cached
+        nodes continue to refer to them.
+
+        :return: References for the inputs.
+        """
+        for name, ref in inputs.items():
+            key = CompilerReference(mode=CompilerReference.Mode.range, active_cell=ref)
+            if key not in self._input_nodes:
+                self._input_nodes[key] = wrap_input(ref, name)
+            self.references[key] = self._input_nodes[key]
+        return set(self._input_nodes)
+
+    def update_fingerprints(self, excluded: set[CompilerReference]) -> None:
+        """
+        Record the fingerprint of every range and recurrence reference built since the last update.
+
+        :param excluded: References which were not built from the workbook (i.e. inputs).
+        """
+        for key in self.references:
+            if key.mode in FINGERPRINT_MODES and key not in self.fingerprints and key not in excluded:
+                self.fingerprints[key] = key.active_cell.fingerprint()
+
+    def dump(self, file, wb) -> None:
+        """
+        Pickle the cache to a binary file.  The state of the cache is written first, followed by the state of each node
+        in the order the nodes were first referred to.
+        """
+        pickler = _GraphPickler(file, wb)
+        pickler.dump((self.references, self.dependents, self.fingerprints, self._input_nodes,
+                      self._workbook_signature, self._input_signature))
+        # nodes are appended as they are referred to by the states being written.
+        for node in pickler.nodes:
+            pickler.dump(node.__dict__)
+
+    def load(self, file, wb) -> None:
+        """
+        Replace the contents of the cache with a cache written by dump.  References are bound to the workbook given,
+        validate then drops the nodes whose cells differ from those they were built from.
+        """
+        unpickler = _GraphUnpickler(file, wb)
+        (self.references, self.dependents, self.fingerprints, self._input_nodes,
+         self._workbook_signature, self._input_signature) = unpickler.load()
+        for node in unpickler.nodes:
+            node.__dict__.update(unpickler.load())
+
+    def _invalidate(self, changed: list[CompilerReference]) -> None:
+        stack = list(changed)
+        removed = set()
+        while stack:
+            key = stack.pop()
+            if key in removed:
+                continue
+            removed.add(key)
+            stack.extend(self.dependents.get(key, ()))
+
+        for key in removed:
+            node = self.references.pop(key, None)
+            self.dependents.pop(key, None)
+            self.fingerprints.pop(key, None)
+            if node is not None:
+                # invalidated nodes must not count towards the parents of the nodes that are still cached.
+                for child in node.children:
+                    if node in child.parents_set():
+                        child.remove_parent(node)
+        for parents in self.dependents.values():
+            parents -= removed
+
+        logger.debug("Invalidated %d of %d cached references from %d changed cells", len(removed),
+                     len(removed) + len(self.references), len(changed))
+
+    def _rebind(self, wb: openpyxl.Workbook) -> None:
+        """
+        References refer to the workbook they were built from.  Re-create them against the current workbook so
+        fingerprints are computed on the current contents and a previous workbook is not kept alive.
+        """
+        rebound = {key: _rebind_reference(key, wb) for key in self.references}
+
+        def lookup(key):
+            return rebound[key] if key in rebound else _rebind_reference(key, wb)
+
+        self.references = {rebound[key]: node for key, node in self.references.items()}
+        self.fingerprints = {rebound[key]: value for key, value in self.fingerprints.items()}
+        self._input_nodes = {lookup(key): node for key, node in self._input_nodes.items()}
+        self.dependents = {lookup(key): {lookup(x) for x in parents} for key, parents in self.dependents.items()}
+
+
+def _rebind_reference(key: CompilerReference, wb: openpyxl.Workbook) -> CompilerReference:
+    active_cell = ExcelReference(wb, repr(key.active_cell), key.active_cell.sheet)
+    if key.mode == CompilerReference.Mode.range:
+        return CompilerReference(mode=key.mode, active_cell=active_cell)
+    else:
+        return CompilerReference(mode=key.mode, active_cell=active_cell, data=key.data)
+
+
+class _GraphPickler(pickle.Pickler):
+    """
+    Pickler writing nodes and the workbook as persistent ids.  Nodes are given an index the first time they are referred
+    to and their state is written separately (see ReferenceCache.dump), so the depth pickle recurses to is limited to
+    a single node.  Numba functions are written by name, as pickle otherwise copies the function.
+    """
+
+    def __init__(self, file, wb):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.wb = wb
+        self.nodes: list[Node] = []
+        self._index: dict[Node, int] = {}
+
+    def persistent_id(self, obj):
+        if obj is self.wb:
+            return WORKBOOK_ID
+        elif isinstance(obj, Node):
+            if obj not in self._index:
+                self._index[obj] = len(self.nodes)
+                self.nodes.append(obj)
+            return self._index[obj], type(obj)
+        elif isinstance(obj, numba.core.dispatcher.Dispatcher):
+            return obj.__module__, obj.__qualname__
+        return None
+
+
+class _GraphUnpickler(pickle.Unpickler):
+    """ Unpickler for _GraphPickler, nodes are created empty when first referred to and their state loaded later. """
+
+    def __init__(self, file, wb):
+        super().__init__(file)
+        self.wb = wb
+        self.nodes: list[Node] = []
+
+    def persistent_load(self, pid):
+        if pid == WORKBOOK_ID:
+            return self.wb
+        elif isinstance(pid[0], int):
+            idx, cls = pid
+            if idx == len(self.nodes):
+                self.nodes.append(cls.__new__(cls))
+            return self.nodes[idx]
+        module, name = pid
+        return reduce(getattr, name.split('.'), importlib.import_module(module))
@@ -1,10 +1,14 @@
+import ast
+import copy
+
 from .array import FlatArrayNode, ExcelArrayNode, IndexNode
 from .binary_ops import ComparisonNode, BinOpNode
 from .function import FunctionOpNode
-from .io import InputNode, OutputNode, Graph
+from .io import InputNode, OutputNode, ArgumentArrayNode, Graph
 from .literal import LiteralNode
 from .node import Node
 from .random import RandomValueNode, RandBetweenNode
+from .recurrence import RecurrenceNode, RecurrenceElementNode
 from ..excel_reference import ExcelReference
 from ..shape import SCALAR_SHAPE
 
@@ -16,3 +20,67 @@ def wrap_output(output_name: str, output_node: Node, shape=SCALAR_SHAPE) -> Outp
 
 def wrap_input(input_cell: ExcelReference, input_name: str) -> InputNode:
     return InputNode(input_name, input_cell.shape, input_cell.data_type)
+
+
+def clone_graph(nodes: list[Node]) -> list[Node]:
+    """
+    Copy the graph below the nodes, so it can be modified (i.e. by optimizations) without changing the original nodes.
+    Each node is shallow copied with its children replaced by their copies, and parents only include parents from
+    within the copied graph.
+
+    Uses a stack rather than recursion as graphs can be deeper than the Python recursion limit.
+
+    :return: copies of the nodes, in the same order.
+    """
+    clones: dict[Node, Node] = {}
+    stack = [(node, False) for node in reversed(nodes)]
+    while stack:
+        node, expanded = stack.pop()
+        if node in clones:
+            continue
+        elif not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children if child not in clones)
+        else:
+            clone = copy.copy(node)
+            clone._children = [clones[child] for child in node.children]
+            clone._parents = []
+            clone._annotations = dict(node._annotations)
+            for child in clone._children:
+                child.append_parent(clone)
+            clones[node] = clone
+    return [clones[node] for node in nodes]
+
+
+def ast_constants(nodes) -> list[ast.stmt]:
+    """
+    Module level assignments of the constants used by the nodes (see Node.constant), usually the nodes visited while
+    generating the statements of a function.  Copies of a node share its variable name, so are only assigned once.
+    """
+    constants = {}
+    for node in nodes:
+        if node.varname not in constants and (value := node.constant) is not None:
+            constants[node.varname] = value
+    return [ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=value)
+            for name, value in sorted(constants.items())]
+
+
+def post_order(nodes: list[Node]) -> list[Node]:
+    """
+    The nodes and every node below them, with children always before their parents.  Children are visited in the order
+    of Node.scheduled_children, so this is the order statements are generated in (see Node.generate_ast_tree), other
+    than below nodes generating their own statements.  Uses a stack rather than recursion as graphs can be deeper than
+    the Python recursion limit.
+    """
+    order = []
+    visited = set()
+    stack = [(node, False) for node in reversed(nodes)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+        elif node not in visited:
+            visited.add(node)
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.scheduled_children()) if child not in visited)
+    return order
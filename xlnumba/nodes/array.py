@@ -60,6 +60,9 @@ class FlatArrayNode(BaseArrayNode):
     def shape(self):
         return Shape(sum([x.shape.size for x in self._children]), 1)
 
+    def structural_key(self):
+        return type(self),
+
     @property
     def ast(self):
         if self.data_type == DataType.String:
@@ -110,8 +113,23 @@ class ExcelArrayNode(BaseArrayNode):
     def shape(self):
         return self._shape
 
+    def structural_key(self):
+        return type(self), self._shape
+
+    @property
+    def constant(self):
+        """ Ranges of numbers or booleans which aren't computed, i.e. lookup tables, are constants of the module. """
+        if all(isinstance(x, LiteralNode) and type(x.value) in (int, float, bool) for x in self._children):
+            return self._ast_array()
+        return None
+
     @property
     def ast(self):
+        if self.constant is not None:
+            return None
+        return self._ast_wrap(self._ast_array())
+
+    def _ast_array(self):
         if self.data_type == DataType.String:
             array_arg = ast_call('numpy.empty', [ast.Constant(self.shape.size)], [STR_DTYPE])
             children_ref = [child.ref for child in self._children]
@@ -120,8 +138,7 @@ class ExcelArrayNode(BaseArrayNode):
             args = [ast.List(elts=[child.ref for child in self._children], ctx=ast.Load())]
             call = ast_call('numpy.array', args)
 
-        reshape_call = ast_call(ast.Attribute(call, 'reshape', ctx=ast.Load()), [self.shape.ast])
-        return self._ast_wrap(reshape_call)
+        return ast_call(ast.Attribute(call, 'reshape', ctx=ast.Load()), [self.shape.ast])
 
 
 class IndexNode(Node):
@@ -146,6 +163,9 @@ class IndexNode(Node):
     def data_type(self):
         return self.array.data_type
 
+    def structural_key(self):
+        return type(self), tuple(tuple(x) for x in self._idx)
+
     @property
     def ref(self):
         """
@@ -177,7 +197,7 @@ class IndexNode(Node):
                 else:
                     return ast.Slice(ast.Constant(sub_idx[0]), ast.Constant(sub_idx[1]))
 
-            col_slice = helper(idx[0], self.array.shape.width)
-            row_slice = helper(idx[1], self.array.shape.height)
+            row_slice = helper(idx[0], self.array.shape.height)
+            col_slice = helper(idx[1], self.array.shape.width)
 
-            return ast_tuple(col_slice, row_slice)
+            return ast_tuple(row_slice, col_slice)
@@ -2,9 +2,25 @@ import abc
 import ast
 
 from .node import Node
+from ..ast import ast_call
 from ..excel_reference import DataType
 from ..shape import Shape
 
+# numpy ufuncs computing each operator, used when the result is written in to an existing array.
+NUMPY_OPERATORS = {
+    ast.Add: 'numpy.add',
+    ast.Sub: 'numpy.subtract',
+    ast.Mult: 'numpy.multiply',
+    ast.Div: 'numpy.true_divide',
+    ast.Pow: 'numpy.power',
+    ast.Eq: 'numpy.equal',
+    ast.NotEq: 'numpy.not_equal',
+    ast.Lt: 'numpy.less',
+    ast.LtE: 'numpy.less_equal',
+    ast.Gt: 'numpy.greater',
+    ast.GtE: 'numpy.greater_equal',
+}
+
 
 class _BinaryHelperNode(Node, metaclass=abc.ABCMeta):
     """
@@ -17,6 +33,8 @@ class _BinaryHelperNode(Node, metaclass=abc.ABCMeta):
     def __init__(self, variable_name: str, operator, left_child: Node, right_child: Node):
         super().__init__(variable_name, [left_child, right_child])
         self.operator = operator
+        # node whose array is no longer needed and holds the result rather than a new array, see buffer_reuse.
+        self.buffer = None
 
     @property
     def left(self) -> Node: return self._children[0]
@@ -27,6 +45,12 @@ class _BinaryHelperNode(Node, metaclass=abc.ABCMeta):
     @property
     def shape(self) -> Shape: return self.left.shape.merge(self.right.shape)
 
+    def structural_key(self): return type(self), self.operator
+
+    def _ast_buffer(self):
+        call = ast_call(NUMPY_OPERATORS[self.operator], [self.left.ref, self.right.ref, self.buffer.ref])
+        return self._ast_wrap(call)
+
 
 class ComparisonNode(_BinaryHelperNode):
     @property
@@ -34,6 +58,8 @@ class ComparisonNode(_BinaryHelperNode):
 
     @property
     def ast(self):
+        if self.buffer is not None:
+            return self._ast_buffer()
         return self._ast_wrap(
             ast.Compare(
                 left=self.left.ref,
@@ -42,7 +68,7 @@ class ComparisonNode(_BinaryHelperNode):
             )
         )
 
-    def __repr__(self): return f"{self.varname} = ON:{self.ast.value.ops.__class__.__name__}"
+    def __repr__(self): return f"{self.varname} = ON:{self.operator.__name__}"
 
 
 class BinOpNode(_BinaryHelperNode):
@@ -51,6 +77,8 @@ class BinOpNode(_BinaryHelperNode):
 
     @property
     def ast(self):
+        if self.buffer is not None:
+            return self._ast_buffer()
         return self._ast_wrap(
             ast.BinOp(
                 left=self.left.ref,
@@ -58,4 +86,4 @@ class BinOpNode(_BinaryHelperNode):
                 right=self.right.ref)
         )
 
-    def __repr__(self): return f"{self.varname} = ON:{self.ast.value.op.__class__.__name__}"
+    def __repr__(self): return f"{self.varname} = ON:{self.operator.__name__}"
@@ -9,12 +9,18 @@ class FunctionOpNode(Node):
         super().__init__(variable_name, children)
         self.in_place = False
         self.disable_numba = False
+        # node whose array is no longer needed and holds the result rather than a new array, see buffer_reuse.
+        self.buffer = None
         self._function_details = function_details
 
     @property
     def excel_name(self):
         return self._function_details.excel_name
 
+    @property
+    def function_details(self):
+        return self._function_details
+
     @property
     def shape(self):
         return self._function_details.compute_shape(self.children)
@@ -30,6 +36,10 @@ class FunctionOpNode(Node):
         else:
             return super().ref
 
+    def structural_key(self):
+        # function details are shared by every call of the function, so identity is enough to compare them
+        return FunctionOpNode, id(self._function_details), self.in_place, self.disable_numba
+
     @property
     def data_type(self):
         return self._function_details.compute_resulting_type(self.children)
@@ -37,9 +47,10 @@ class FunctionOpNode(Node):
     @property
     def in_place_supported(self):
         return len(self.children) == 1 and \
-            not self._function_details.compute_shape(self.children).is_scalar and \
+            not self.shape.is_scalar and \
             self.children[0].data_type == self.data_type and \
             len(self.children[0]._parents) == 1 and \
+            self.children[0].constant is None and \
             self._function_details.in_place_supported()
 
     @property
@@ -50,6 +61,9 @@ class FunctionOpNode(Node):
             assert self._function_details.in_place_supported()
             call = ast_call(fnc_name, [x.ref for x in self.children] + [self.children[0].ref])
             return ast.Expr(call)
+        elif self.buffer is not None:
+            call = ast_call(fnc_name, [x.ref for x in self.children] + [self.buffer.ref])
+            return self._ast_wrap(call)
         else:
             call = ast_call(fnc_name, [x.ref for x in self.children])
             return self._ast_wrap(call)
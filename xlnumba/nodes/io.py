@@ -1,7 +1,7 @@
 import ast
 
 from .node import Node
-from ..ast import ast_tuple
+from ..ast import ast_tuple, ast_call
 from ..excel_reference import ExcelReference
 
 
@@ -71,4 +71,35 @@ class InputNode(Node):
         return f"IN:{self._var}"
 
 
+class ArgumentArrayNode(Node):
+    """
+    Array passed in to the generated function by the caller for results to be written in to, see plan_workspace.  The
+    array is viewed with the shape of the node writing in to it when this differs from the shape it is passed with,
+    i.e. vector outputs are passed as 1D arrays.
+    """
+
+    def __init__(self, arg_name, shape, dtype: str, view_shape=None):
+        super().__init__(arg_name, children=[])
+        self._shape = shape
+        self.dtype = dtype
+        self.view_shape = view_shape
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def ref(self):
+        if self.view_shape is None:
+            return super().ref
+        return ast_call(f"{self._var}.reshape", [self.view_shape.ast])
+
+    @property
+    def ast(self):
+        return None
+
+    def __repr__(self):
+        return f"ARG:{self._var}"
+
+
 Graph = list[tuple[ExcelReference, OutputNode]]
@@ -53,6 +53,12 @@ class LiteralNode(Node):
         else:
             return DataType.Number
 
+    def structural_key(self):
+        if isinstance(self.value, ndarray):
+            return LiteralNode, self.value.dtype.str, self.value.shape, self.value.tobytes()
+        # type is included as 1, 1.0 and True are equal in Python but not in Excel
+        return LiteralNode, type(self.value), self.value
+
     @property
     def ref(self):
         """
@@ -64,23 +70,31 @@ class LiteralNode(Node):
         else:
             return ast.Constant(value=self.value)
 
+    @property
+    def constant(self):
+        if isinstance(self.value, ndarray) and self.value.dtype.kind in 'biuf':
+            return self._ast_array()
+        return None
+
     @property
     def ast(self):
         """
         If this is an array literal then we create a variable otherwise the ref is the constant itself, and
-        we don't require a statement for it.
+        we don't require a statement for it.  Numeric arrays are constants of the module, see constant.
         """
-        if isinstance(self.value, ndarray):
-            vals = self.value.tolist()
-            if self.value.ndim == 2:
-                elts = [ast.List([ast.Constant(v) for v in row], ctx=ast.Load()) for row in vals]
-            else:
-                assert self.value.ndim == 1
-                elts = [ast.Constant(v) for v in vals]
-            ast_value = ast_call('numpy.array', [ast.List(elts=elts, ctx=ast.Load())])
-            return self._ast_wrap(ast_value)
+        if isinstance(self.value, ndarray) and self.constant is None:
+            return self._ast_wrap(self._ast_array())
         else:
             return None
 
+    def _ast_array(self):
+        vals = self.value.tolist()
+        if self.value.ndim == 2:
+            elts = [ast.List([ast.Constant(v) for v in row], ctx=ast.Load()) for row in vals]
+        else:
+            assert self.value.ndim == 1
+            elts = [ast.Constant(v) for v in vals]
+        return ast_call('numpy.array', [ast.List(elts=elts, ctx=ast.Load())])
+
     def __repr__(self):
         return f"LN:{self.value}"
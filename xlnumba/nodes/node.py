@@ -9,15 +9,46 @@ class Node:
     Nodes represent high higher level graph then the base AST graph .  They are a layer of abstraction on top of the
     Python AST library grouping the library together to better match the Excel structure and provide a level of
     abstraction which allows easier manipulation of the concepts at Excel's level.
+
+    The shape and data type of nodes are annotations computed once and cached, as computing them can walk every node
+    below.  The cache is cleared when a child is replaced, along with the caches of every node above (see invalidate).
     """
 
+    # properties of subclasses which are cached, see __init_subclass__.
+    ANNOTATIONS = ('shape', 'data_type')
+
     def __init__(self, variable_name, children):
         self._children = children
         self._parents = []
         self._var = variable_name
+        self._annotations = {}
         for child in self._children:
             child.append_parent(self)
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in Node.ANNOTATIONS:
+            attr = cls.__dict__.get(name)
+            if isinstance(attr, property):
+                setattr(cls, name, _annotation(name, attr.fget))
+
+    def invalidate(self):
+        """
+        Clear the cached annotations of this node and the nodes above it, after the children of the node have changed.
+
+        Nodes with nothing cached are skipped along with the nodes above them.  A node only caches a value once the
+        values it is computed from have been cached by the nodes below, as annotations and temporaries are computed
+        from the bottom up, and clearing a node clears every node above it.  So no node above a node with nothing
+        cached can hold a value computed through it.  Clones copy the annotations of every node (see clone_graph) so
+        this holds for them as well.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._annotations:
+                node._annotations = {}
+                stack.extend(node._parents)
+
     def append_parent(self, parent):
         self._parents.append(parent)
 
@@ -29,27 +60,126 @@ class Node:
         return self._children
 
     def generate_ast_tree(self, visited) -> list[ast.stmt]:
+        """
+        Statements computing the node and every node below it which isn't in visited.  Statements are ordered by
+        walking the graph with a stack, the statements of the preceding nodes of each node (see preceding_nodes) ahead
+        of its own statements, rather than by recursion, as chains of dependencies (i.e. a balance carried forward down
+        20k rows) can be deeper than the Python recursion limit.
+
+        Nodes generating statements of the nodes below them within their own statements, the branches of conditionals
+        and the loop bodies of recurrences, walk those nodes separately.  Only the nesting of these blocks, which is
+        limited by the nesting Python can compile anyway, adds to the depth of recursion.
+        """
         stmts = []
-        if self in visited:
-            return stmts
-        visited.add(self)
-
-        for child in self._children:
-            stmts += child.generate_ast_tree(visited)
-        if self.ast:
-            stmts.append(self.ast)
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                stmts.extend(node.statements(visited))
+            elif node not in visited:
+                visited.add(node)
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.preceding_nodes()) if child not in visited)
         return stmts
 
+    def preceding_nodes(self) -> list['Node']:
+        """ Nodes whose statements are generated ahead of the statements of the node, see generate_ast_tree. """
+        return self.scheduled_children()
+
+    def statements(self, visited: set) -> list[ast.stmt]:
+        """ Statements of the node itself, generated once the statements of its preceding nodes have been. """
+        return [self.ast] if self.ast else []
+
+    @property
+    def generates_statements(self) -> bool:
+        """
+        Whether the node generates the statements of some of the nodes below it within its own statements (see
+        generate_ast_tree), so where those nodes are computed is decided by the node.
+        """
+        return False
+
+    def scheduled_children(self) -> list['Node']:
+        """
+        Children in the order their statements are generated in.  Children needing the most arrays alive at once to
+        compute, less the array of their own result, are computed first so the peak number of arrays alive at once is
+        kept low (Sethi-Ullman ordering).  Children needing the same number keep their order in the formula, so uses
+        of the same range stay together.  Nodes generating their own statements keep their children in order.
+        """
+        if self.generates_statements or len(self._children) < 2:
+            return self._children
+        return sorted(self._children, key=lambda x: x.temporaries - x._array_result, reverse=True)
+
+    @property
+    def temporaries(self) -> int:
+        """
+        Number of arrays alive at once while computing the node, in the order of scheduled_children, when nothing
+        below it has been computed.  Cached with the annotations of the node.
+        """
+        if 'temporaries' not in self._annotations:
+            # computed bottom up so deep graphs don't recurse.
+            stack = [(self, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if 'temporaries' in node._annotations:
+                    continue
+                elif expanded:
+                    alive = needed = 0
+                    for child in node.scheduled_children():
+                        needed = max(needed, alive + child.temporaries)
+                        alive += child._array_result
+                    node._annotations['temporaries'] = max(needed, node._array_result)
+                else:
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in node._children if 'temporaries' not in child._annotations)
+        return self._annotations['temporaries']
+
+    @property
+    def _array_result(self) -> int:
+        """ One if the result of the node is an array, otherwise zero. """
+        try:
+            shape = self.shape
+        except Exception:  # noqa, shapes aren't defined for every node, i.e. assignments in to merged arrays.
+            return 0
+        return int(shape is not None and not shape.is_scalar)
+
     def depends_on(self, targets: list['Node']) -> bool:
         """
-        Check if any of the elements in the target list are a parent of the current element.
+        Check if any of the elements in the target list are a parent of the current element.  Passes checking many
+        nodes should use a ReachabilityIndex rather than walking the parents for each node.
+        """
+        targets = set(targets)
+        visited = set()
+        stack = list(self._parents)
+        while stack:
+            parent = stack.pop()
+            if parent in targets:
+                return True
+            if parent not in visited:
+                visited.add(parent)
+                stack.extend(parent._parents)
+        return False
+
+    def structural_key(self):
         """
-        return any(filter(lambda parent: parent in targets or parent.depends_on(targets), self._parents))
+        Key identifying the calculation done by this node, excluding its children, used to find nodes computing the
+        same value (see common_subexpressions).  Nodes are only equal if their keys and children are the same, None
+        means the node is never merged with another.
+        """
+        return None
 
     @property
     def ref(self):
         return ast.Name(id=self._var, ctx=ast.Load())
 
+    @property
+    def constant(self) -> ast.expr | None:
+        """
+        Expression for the value of the node if it is an array known ahead of running the function.  Constants are
+        assigned to a global of the module (see ast_constants) rather than rebuilt on every call, which numba freezes
+        in to the compiled function, so the node generates no statement and its array must never be written to.
+        """
+        return None
+
     @property
     def varname(self) -> str:
         return self._var
@@ -87,6 +217,7 @@ class Node:
         self._children[idx] = new
         new.append_parent(self)
         old.remove_parent(self)
+        self.invalidate()
 
     def _ast_wrap(self, value):
         """ Helper to assign the value to this objects variable """
@@ -103,3 +234,16 @@ class Node:
 
     def parents_set(self) -> set["Node"]:
         return set(self._parents)
+
+
+def _annotation(name: str, fget) -> property:
+    """ Property caching the value of fget in the annotations of the node, see Node.invalidate. """
+
+    def cached(self):
+        annotations = self._annotations
+        if name not in annotations:
+            annotations[name] = fget(self)
+        return annotations[name]
+
+    cached.__doc__ = fget.__doc__
+    return property(cached)
@@ -0,0 +1,211 @@
+import ast
+
+from .binary_ops import BinOpNode
+from .literal import LiteralNode
+from .node import Node
+from ..ast import ast_call, ast_tuple
+from ..excel_reference import DataType
+from ..shape import Shape, SCALAR_SHAPE
+
+
+class RecurrenceNode(Node):
+    """
+    Recurrence nodes compute a block of cells where each cell depends on the cells before it (see recurrence.py) with
+    a single loop.  The block is held in a 2D array with a column for each line of the recurrence (a row for
+    horizontal recurrences), which generalizes the 1D BufferNode used when merging arrays.
+
+    The array is filled with the seeds, and then each iteration of the loop evaluates the template of each line and
+    writes the result in to the array.  Templates read the array, and ranges moving along with the loop, through
+    RecurrenceElementNodes.  Any part of the templates which doesn't depend on the loop is evaluated ahead of it.
+
+    Children are the seeds, followed by the externals (nodes used by the templates) and the templates.
+
+    The array holds integers when the seeds are integers and the templates only add, subtract and multiply integers,
+    so integer recurrences give the same result as computing their cells one by one.
+    """
+
+    def __init__(self, variable_name: str, shape: Shape, vertical: bool, counter: str, loop: tuple[int, int],
+                 seeds: list[tuple[Node, tuple[int, int]]], externals: list[tuple[Node, str | None]],
+                 templates: list[tuple[Node, int]]):
+        """
+        :param shape: Shape of the array holding the recurrence.
+        :param vertical: Whether the loop runs down the rows of the array, otherwise along the columns.
+        :param counter: Name of the loop counter.
+        :param loop: Range of the loop counter.
+        :param seeds: Seed nodes along with their position in the array.
+        :param externals: Nodes used by the templates, along with the name they are read through inside the loop if
+        they move along with the loop.
+        :param templates: Template of each line along with the index of the line in the array, in the order they are
+        computed.
+        """
+        super().__init__(variable_name, [x[0] for x in seeds] + [x[0] for x in externals] + [x[0] for x in templates])
+        self._shape = shape
+        self.vertical = vertical
+        self.counter = counter
+        self.loop = loop
+        self._seed_positions = tuple(x[1] for x in seeds)
+        self._aliases = tuple(x[1] for x in externals)
+        self._lines = tuple(x[1] for x in templates)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def data_type(self):
+        return DataType.Number
+
+    @property
+    def seeds(self) -> list[Node]:
+        return self._children[:len(self._seed_positions)]
+
+    @property
+    def externals(self) -> list[Node]:
+        start = len(self._seed_positions)
+        return self._children[start:start + len(self._aliases)]
+
+    @property
+    def templates(self) -> list[Node]:
+        return self._children[len(self._children) - len(self._lines):]
+
+    @property
+    def generates_statements(self) -> bool:
+        return True
+
+    def preceding_nodes(self) -> list[Node]:
+        """ Seeds and externals, along with the parts of the templates which don't depend on the loop. """
+        return self.seeds + self.externals + self._loop_invariant()
+
+    def statements(self, visited: set) -> list[ast.stmt]:
+        dtype = [ast.keyword(arg='dtype', value=ast_call('numpy.int64', []).func)] if self.integral else []
+        stmts = [self._ast_wrap(ast_call('numpy.zeros', [self.shape.ast], dtype))]
+        for seed, (row, col) in zip(self.seeds, self._seed_positions):
+            stmts.append(self._ast_store(ast_tuple(row, col), seed.ref))
+        for external, alias in zip(self.externals, self._aliases):
+            if alias is not None:
+                stmts.append(ast.Assign(targets=[ast.Name(id=alias, ctx=ast.Store())], value=external.ref))
+
+        body = []
+        counter = ast.Name(id=self.counter, ctx=ast.Load())
+        for template, line in zip(self.templates, self._lines):
+            body += template.generate_ast_tree(visited)
+            idx = ast_tuple(counter, ast.Constant(line)) if self.vertical else ast_tuple(ast.Constant(line), counter)
+            body.append(self._ast_store(idx, template.ref))
+
+        stmts.append(ast.For(
+            target=ast.Name(id=self.counter, ctx=ast.Store()),
+            iter=ast_call('range', [ast.Constant(self.loop[0]), ast.Constant(self.loop[1])]),
+            body=body,
+            orelse=[]
+        ))
+        return stmts
+
+    @property
+    def integral(self) -> bool:
+        """ Whether every element of the recurrence is an integer. """
+        if not all(isinstance(x, LiteralNode) and type(x.value) is int for x in self.seeds):
+            return False
+        stack = list(self.templates)
+        while stack:
+            node = stack.pop()
+            match node:
+                case RecurrenceElementNode():
+                    if node.array != self.varname:
+                        return False
+                case LiteralNode():
+                    if type(node.value) is not int:
+                        return False
+                case BinOpNode() if node.operator in (ast.Add, ast.Sub, ast.Mult):
+                    stack.extend(node.children)
+                case _:
+                    return False
+        return True
+
+    def _ast_store(self, idx, value) -> ast.Assign:
+        target = ast.Subscript(value=ast.Name(id=self.varname, ctx=ast.Load()), slice=idx, ctx=ast.Store())
+        return ast.Assign(targets=[target], value=value)
+
+    def _loop_invariant(self) -> list[Node]:
+        """
+        Nodes used by the templates which don't depend on the loop counter.  Nodes which generate their own statements
+        (i.e. conditionals) decide where their children are evaluated, so nothing below them is moved.
+        """
+        variant = {node: False for node in self.externals}
+
+        def is_variant(node: Node) -> bool:
+            if node not in variant:
+                variant[node] = isinstance(node, RecurrenceElementNode)
+                variant[node] = any([is_variant(x) for x in node.children]) or variant[node]
+            return variant[node]
+
+        invariant = []
+        seen = set()
+        stack = list(self.templates)
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            if not is_variant(node):
+                invariant.append(node)
+            elif not node.generates_statements:
+                stack.extend(node.children)
+        return invariant
+
+    @property
+    def ast(self):
+        raise NotImplementedError("Cannot directly generate AST - only can rebuild tree")
+
+    def __repr__(self):
+        return f"REC:{self.varname}"
+
+
+class RecurrenceElementNode(Node):
+    """
+    Element of an array read inside the loop of a RecurrenceNode, at an offset from the loop counter.  Like index
+    nodes the reference is the subscript itself, so no statement is needed.
+    """
+
+    def __init__(self, variable_name: str, array: str, counter: str, offset: int, line: int, vertical: bool,
+                 data_type: DataType = DataType.Number):
+        super().__init__(variable_name, [])
+        self._array = array
+        self._counter = counter
+        self._offset = offset
+        self._line = line
+        self._vertical = vertical
+        self._data_type = data_type
+
+    @property
+    def shape(self):
+        return SCALAR_SHAPE
+
+    @property
+    def data_type(self):
+        return self._data_type
+
+    @property
+    def array(self) -> str:
+        """ Name of the array the element is read from. """
+        return self._array
+
+    def structural_key(self):
+        return (RecurrenceElementNode, self._array, self._counter, self._offset, self._line, self._vertical,
+                self._data_type)
+
+    @property
+    def ref(self):
+        position = ast.Name(id=self._counter, ctx=ast.Load())
+        if self._offset:
+            op = ast.Add() if self._offset > 0 else ast.Sub()
+            position = ast.BinOp(left=position, op=op, right=ast.Constant(abs(self._offset)))
+        line = ast.Constant(self._line)
+        idx = ast_tuple(position, line) if self._vertical else ast_tuple(line, position)
+        return ast.Subscript(value=ast.Name(id=self._array, ctx=ast.Load()), slice=idx, ctx=ast.Load())
+
+    @property
+    def ast(self):
+        return None
+
+    def __repr__(self):
+        return f"{self.varname} = ELEM:{self._array}[{self._counter}{self._offset:+d}, {self._line}]"
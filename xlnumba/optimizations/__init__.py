@@ -1,14 +1,22 @@
 from .array_inplace import array_inplace
+from .buffer_reuse import buffer_reuse
 from .collapse_literals import collapse_literals
+from .common_subexpressions import common_subexpressions
+from .fuse_elementwise import fuse_elementwise
 from .lazy_conditional import lazy_conditional
 from .merge_array import merge_array
+from .simplify_arithmetic import simplify_arithmetic
 from ..logger import logger
 from ..nodes import Graph
 
 OPTIMIZATION_LIST = {
     'collapse_literals': collapse_literals,
+    'simplify_arithmetic': simplify_arithmetic,
+    'common_subexpressions': common_subexpressions,
     'merge_array': merge_array,
+    'fuse_elementwise': fuse_elementwise,
     'array_inplace': array_inplace,
+    'buffer_reuse': buffer_reuse,
 
     # lazy conditional needs to be towards end as it pulls nodes out of the normal graph and
     # into subgraphs; or support more broadly for subgraphs needs to be added.
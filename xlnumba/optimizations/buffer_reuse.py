@@ -0,0 +1,246 @@
+"""
+Buffer reuse writes the result of an operation on arrays in to the array of one of its operands, when nothing needs
+that array after the operation, rather than allocating a new array.  array_inplace covers functions of a single
+argument used by nothing else, this covers operators, comparisons, ufuncs of several arguments and fused loops (see
+fuse_elementwise), and operands used by several operations.
+
+An operand is dead after an operation if the operation depends on every other user of the operand, as they must all
+be computed ahead of the operation whatever order the statements are generated in.  Its array is only reused if it
+was created by an operation (inputs, literals and slices of other arrays are never written to), has the same shape and
+dtype as the result, and no other user may hold a view of it.
+
+Once the buffers are chosen the peak working set, the largest total size of the arrays alive at any one time, is logged
+along with the peak without reusing buffers.
+"""
+import heapq
+
+import numpy as np
+
+from .elementwise import elementwise_shape, array_dtype, creates_array, writes_buffer
+from .lazy_conditional import ConditionalNode
+from ..excel_functions.function_details import AggregatingFunction
+from ..logger import logger
+from ..nodes import Graph, Node, ArgumentArrayNode, ExcelArrayNode, FunctionOpNode, IndexNode, InputNode, \
+    LiteralNode, OutputNode, RecurrenceNode, RecurrenceElementNode, post_order
+from ..shape import Shape
+
+
+def buffer_reuse(graph: Graph) -> Graph:
+    nodes = post_order([child for _, root in graph for child in root.children])
+    shapes, dtypes = {}, {}
+    looped = _looped(nodes)
+
+    reused = 0
+    for node in nodes:
+        if not writes_buffer(node, shapes):
+            continue
+        for child in node.children:
+            if _reusable(child, node, shapes, dtypes, looped):
+                logger.debug(f"{node} will reuse the array of {child}")
+                node.buffer = child
+                reused += 1
+                break
+
+    logger.debug(f"Reused {reused} arrays")
+    logger.info(f"Peak working set of {working_set(graph)} bytes, {working_set(graph, False)} bytes without reusing "
+                f"arrays")
+    return graph
+
+
+def working_set(graph: Graph, reuse=True) -> int:
+    """
+    Peak total size in bytes of the arrays created by operations, ranges and literals, in the order the statements are
+    generated in.  Arrays are alive from the statement creating them until their last use, or the end of the function
+    for outputs.
+
+    :param reuse: Whether to count the arrays reused (see buffer_reuse) as part of the array they are written in to.
+    """
+    nodes = post_order([child for _, root in graph for child in root.children])
+    position = {node: idx for idx, node in enumerate(nodes)}
+    sizes, ends = _lifetimes(nodes, {}, {}, reuse)
+
+    changes = [0] * (len(nodes) + 2)
+    for array, size in sizes.items():
+        changes[position[array]] += size
+        changes[ends[array] + 1] -= size
+    peak = total = 0
+    for change in changes:
+        total += change
+        peak = max(peak, total)
+    return peak
+
+
+def plan_workspace(graph: Graph, outputs: dict[OutputNode, ArgumentArrayNode]) \
+        -> tuple[list[ArgumentArrayNode], set[OutputNode], list[Node]]:
+    """
+    Plan the arrays passed in by the caller of a function which creates no arrays of its own (see compile_buffered).
+    Outputs computed by an operation write directly in to the array passed for the output, and every other array
+    created by an operation is written in to an array of the workspace.  Results which aren't alive at the same time
+    share an array of the workspace, as buffer_reuse does within the graph.
+
+    Arrays which aren't created by operations, such as ranges of the workbook and the results of recurrences, and
+    arrays computed within conditionals and recurrences are still created by the function.  These are returned so
+    the caller can tell whether calls are free of allocations.
+
+    :param outputs: Array argument of each output.
+    :return: Arrays of the workspace in the order they are passed, the outputs written directly in to their argument
+    rather than copied in to it, and the nodes which still create an array on each call.
+    """
+    nodes = post_order([child for _, root in graph for child in root.children])
+    shapes, dtypes = {}, {}
+    position, deferred = _deferred(nodes)
+
+    written = {}
+    for output, argument in outputs.items():
+        top = output.top
+        if top in written or top in deferred or array_dtype(top, dtypes) != argument.dtype:
+            continue
+        if getattr(top, 'buffer', None) is not None or writes_buffer(top, shapes):
+            logger.debug(f"{top} will be written in to the output {argument}")
+            top.buffer = ArgumentArrayNode(argument.varname, argument.shape, argument.dtype,
+                                           elementwise_shape(top, shapes))
+            written[top] = output
+
+    _, ends = _lifetimes(nodes, shapes, dtypes, position=position)
+    candidates = [x for x in nodes if x not in deferred and writes_buffer(x, shapes) and array_dtype(x, dtypes)]
+
+    # arrays of the workspace are released once the last user of the result written in to them has been computed.
+    workspace, free, alive = [], {}, []
+    for node in candidates:
+        while alive and alive[0][0] < position[node]:
+            _, _, released = heapq.heappop(alive)
+            free.setdefault((released.shape, released.dtype), []).append(released)
+
+        key = (elementwise_shape(node, shapes), array_dtype(node, dtypes))
+        if free.get(key):
+            array = free[key].pop()
+        else:
+            array = ArgumentArrayNode(f"_ws{len(workspace)}", *key)
+            workspace.append(array)
+        logger.debug(f"{node} will be written in to the workspace array {array}")
+        node.buffer = array
+        heapq.heappush(alive, (ends[node], position[node], array))
+
+    allocating = [x for x in nodes if _allocates(x, shapes)]
+    if allocating:
+        logger.info(f"{len(allocating)} arrays are still created on each call: {allocating}")
+    return workspace, set(written.values()), allocating
+
+
+def _allocates(node: Node, shapes: dict) -> bool:
+    """ Whether the node creates a new array each time the function is called. """
+    if node.constant is not None or getattr(node, 'buffer', None) is not None:
+        return False
+    if isinstance(node, FunctionOpNode) and node.in_place:
+        return False
+    if isinstance(node, (IndexNode, InputNode, ArgumentArrayNode, OutputNode, RecurrenceElementNode)):
+        return False  # views of other arrays, arguments of the function and elements of a recurrence.
+    try:
+        shape = elementwise_shape(node, shapes)
+    except NotImplementedError:  # shapes aren't defined for every node, i.e. assignments in to merged arrays.
+        return False
+    return shape is not None and not shape.is_scalar
+
+
+def _deferred(nodes: list[Node]) -> tuple[dict[Node, int], set[Node]]:
+    """
+    Nodes below conditionals and recurrences, which generate the statements of the nodes below them (see
+    ConditionalNode and RecurrenceNode) so these may be computed later than their position, or on each pass of a loop.
+    These nodes are treated as being used at the position of the conditional or recurrence above them.
+
+    :return: Position each node is treated as being used at, and the nodes below conditionals and recurrences.
+    """
+    position = {node: idx for idx, node in enumerate(nodes)}
+    deferred = set()
+    for node in reversed(nodes):
+        if node in deferred or isinstance(node, (ConditionalNode, RecurrenceNode)):
+            for child in node.children:
+                deferred.add(child)
+                position[child] = max(position[child], position[node])
+    return position, deferred
+
+
+def _lifetimes(nodes: list[Node], shapes: dict, dtypes: dict, reuse=True, position: dict[Node, int] = None) \
+        -> tuple[dict[Node, int], dict[Node, int]]:
+    """
+    Size in bytes of the arrays created, and the position of their last use, keyed by the node creating each array.
+    Arrays are identified by the node creating them, nodes writing in to an array extend its life.
+    """
+    if position is None:
+        position = {node: idx for idx, node in enumerate(nodes)}
+    arrays, sizes, ends = {}, {}, {}
+    for node in nodes:
+        buffer = getattr(node, 'buffer', None) if reuse else None
+        if isinstance(node, FunctionOpNode) and node.in_place:
+            arrays[node] = arrays.get(node.children[0])
+        elif buffer is not None:
+            arrays[node] = arrays.get(buffer)
+        elif size := _nbytes(node, shapes, dtypes):
+            arrays[node] = node
+            sizes[node] = size
+        array = arrays.get(node)
+        if array is not None:
+            last = max(position.get(parent, len(nodes)) for parent in node.parents_set())
+            ends[array] = max(ends.get(array, position[node]), last)
+    return sizes, ends
+
+
+def _reusable(operand: Node, node: Node, shapes: dict, dtypes: dict, looped: set[Node]) -> bool:
+    """ Whether the array of the operand is dead after the node, and can hold the result of the node. """
+    if not creates_array(operand) or elementwise_shape(operand, shapes) != elementwise_shape(node, shapes):
+        return False
+    dtype = array_dtype(node, dtypes)
+    if dtype is None or array_dtype(operand, dtypes) != dtype:
+        return False
+    if node in looped and operand not in looped:
+        return False  # the node is computed on each pass of a loop, and the operand only once ahead of the loop.
+
+    others = operand.parents_set() - {node}
+    if any(not creates_array(x) and not _scalar_function(x) for x in others):
+        return False  # users which could be holding a view of the array.
+    return _depends_on(node, others)
+
+
+def _scalar_function(node: Node) -> bool:
+    return isinstance(node, FunctionOpNode) and type(node.function_details) is AggregatingFunction
+
+
+def _depends_on(node: Node, targets: set[Node]) -> bool:
+    """ Whether all the targets are below the node. """
+    remaining = set(targets)
+    visited = set()
+    stack = list(node.children)
+    while stack and remaining:
+        current = stack.pop()
+        if current in visited:
+            continue
+        visited.add(current)
+        remaining.discard(current)
+        stack.extend(current.children)
+    return not remaining
+
+
+def _looped(nodes: list[Node]) -> set[Node]:
+    """ Nodes computed on each pass of the loop of a recurrence, i.e. which depend on the element of a recurrence. """
+    looped = set()
+    for node in nodes:
+        if isinstance(node, RecurrenceElementNode) or \
+                (not isinstance(node, RecurrenceNode) and any(x in looped for x in node.children)):
+            looped.add(node)
+    return looped
+
+
+def _nbytes(node: Node, shapes: dict, dtypes: dict) -> int:
+    """ Size of the array created by the node, zero if the node doesn't create an array. """
+    if node.constant is not None:
+        return 0  # constants are globals of the module rather than created by the function.
+    elif isinstance(node, LiteralNode):
+        return node.value.nbytes if isinstance(node.value, np.ndarray) else 0
+    elif not creates_array(node) and not isinstance(node, ExcelArrayNode):
+        return 0
+    shape: Shape = elementwise_shape(node, shapes)
+    if shape is None or shape.is_scalar:
+        return 0
+    dtype = array_dtype(node, dtypes)
+    itemsize = np.dtype(dtype).itemsize if dtype is not None else 8
+    return shape.size * itemsize
@@ -1,11 +1,10 @@
 import ast
 
-import astor
 import numpy as np
 
 from ..execution import evaluate, get_execution_context
 from ..logger import logger
-from ..nodes import Graph, LiteralNode, IndexNode, Node
+from ..nodes import Graph, LiteralNode, IndexNode, Node, ast_constants, post_order
 
 
 def collapse_literals(graph: Graph):
@@ -16,48 +15,40 @@ def collapse_literals(graph: Graph):
     For simple math nodes this likely does not serve a purpose, as the numba compiler will likely be able to do the
     same, however, in cases where multiple python function are called this enables collapsing of that logic if the
     inputs are not part of the compilers input function.
-    """
-    visited = set()
-    for name, root in graph:
-        children = list(root.children)
-        for child in children:  # output nodes can't be collapsed so skip them to start the recursion.
-            _exec_recursive(child, visited)
-    return graph
-
-
-def _exec_recursive(node: Node, visited):
-    if node in visited or isinstance(node, LiteralNode) or len(node.children) == 0:
-        return node
-    visited.add(node)
 
-    # Step 1 -- depth first search to see if all children of this node are literals.
-    all_literal_children = True
-    for child in node.children:
-        child = _exec_recursive(child, visited)  # this will replace the child if it is a literal node
-        if not isinstance(child, LiteralNode):
-            all_literal_children = False
+    Nodes are static if everything below them is a literal, i.e. they don't depend on an input.  The static nodes used
+    by the rest of the graph are evaluated together, with the static nodes below them, by a single evaluation in one
+    execution context and each is replaced with a literal of its value.  Arrays are folded as well as scalars, and are
+    then constants of the generated module (see Node.constant).
+    """
+    nodes = post_order([child for _, root in graph for child in root.children])
+    static = _static(nodes)
 
-    # Step 2 - if all children are literals execute Python operation and return result.
-    if all_literal_children:
-        logger.debug("Preparing for static calculation of %s", node)
-        visited = set()
-        ast_list = node.generate_ast_tree(visited)
+    # output nodes are never static so the nodes they use are always part of the frontier.
+    frontier = [node for node in nodes if node in static and not isinstance(node, LiteralNode) and
+                any(parent not in static for parent in node.parents_set())]
+    if not frontier:
+        return graph
 
+    logger.debug("Preparing for static calculation of %d nodes", len(frontier))
+    visited = set()
+    ast_list = []
+    for node in frontier:
+        ast_list.extend(node.generate_ast_tree(visited))
         if isinstance(node, IndexNode):
             # IndexNodes mean that this is assigning to a single cell within the array in that
             # situation we need to put into another variable to store it.
-            new_stmt = ast.Assign(
+            ast_list.append(ast.Assign(
                 targets=[ast.Name(node.varname, ctx=ast.Store())],
                 value=node.ref
-            )
-            ast_list.append(new_stmt)
+            ))
 
-        logger.debug("About to evaluate: %s", astor.to_source(ast_list[0]))
-        # always disable numba in this context.  We are only calling functions once, there is no reason to use
-        # numba here.
-        exec_ctx = get_execution_context()
-        evaluate(ast_list, exec_ctx, __name__)
+    # always disable numba in this context.  We are only calling functions once, there is no reason to use
+    # numba here.
+    exec_ctx = get_execution_context()
+    evaluate(ast_constants(visited) + ast_list, exec_ctx, __name__)
 
+    for node in frontier:
         value = exec_ctx[node.varname]
         logger.debug("Static calculation for %s produced result of %s", node, value)
 
@@ -65,12 +56,16 @@ def _exec_recursive(node: Node, visited):
         if hasattr(value, 'item') and not isinstance(value, np.ndarray):
             value = value.item()
 
-        new_node = LiteralNode(node.varname, value)
-
         # replace child will update the parents list; if we don't cache it first then can't
         # do the interations.
-        node.replace_self(new_node)
+        node.replace_self(LiteralNode(node.varname, value))
+    return graph
+
 
-        return new_node
-    else:
-        return node
+def _static(nodes: list[Node]) -> set[Node]:
+    """ Nodes which don't depend on an input, where every node below them is a literal. """
+    static = set()
+    for node in nodes:  # children are always ahead of their parents.
+        if isinstance(node, LiteralNode) or (node.children and all(x in static for x in node.children)):
+            static.add(node)
+    return static
@@ -0,0 +1,30 @@
+"""
+Common subexpression elimination merges nodes computing the same value, so the calculation only happens once.  Excel
+models often repeat the same expression in many cells (i.e. SUM($A$1:$A$500) in every row of a table), and as each
+cell is compiled separately each copy builds its own nodes.
+
+Nodes are compared structurally (hash consing): two nodes are the same if they do the same calculation (see
+Node.structural_key) on the same children.  Walking the graph from the leaves up means children have already been
+merged by the time their parents are compared, so comparing children by identity is enough.
+"""
+from ..logger import logger
+from ..nodes import Graph, Node, post_order
+
+
+def common_subexpressions(graph: Graph) -> Graph:
+    canonical: dict[tuple, Node] = {}
+    merged = 0
+    # output nodes are never merged, so start from their children
+    for node in post_order([child for _, root in graph for child in root.children]):
+        key = node.structural_key()
+        if key is None:
+            continue
+        key = (key, tuple(id(child) for child in node.children))
+        existing = canonical.setdefault(key, node)
+        if existing is not node:
+            node.replace_in_graph(existing)
+            for child in node.children:
+                child.remove_parent(node)
+            merged += 1
+    logger.debug(f"Merged {merged} common subexpressions")
+    return graph
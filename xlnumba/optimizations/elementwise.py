@@ -0,0 +1,88 @@
+"""
+Helpers shared by the optimizations working on elementwise operations over arrays (see fuse_elementwise and
+buffer_reuse).
+"""
+import ast
+
+import numpy as np
+
+from ..excel_functions.function_details import NumpyUFunction
+from ..excel_reference import DataType
+from ..exceptions import UnsupportedBroadcastException
+from ..nodes import Node, BinOpNode, ComparisonNode, FunctionOpNode, LiteralNode
+from ..nodes.binary_ops import NUMPY_OPERATORS
+from ..shape import Shape
+
+
+def is_ufunc(node: Node) -> bool:
+    """ Whether the node calls a numpy ufunc, only these are known to work the same on single elements as arrays. """
+    if not isinstance(node, FunctionOpNode) or node.in_place:
+        return False
+    details = node.function_details
+    return type(details) is NumpyUFunction and details.shape is None and isinstance(details.func, np.ufunc)
+
+
+def is_conditional(node: Node) -> bool:
+    return isinstance(node, FunctionOpNode) and not node.in_place and node.excel_name == 'IF' and \
+        len(node.children) == 3
+
+
+def elementwise_shape(node: Node, shapes: dict[Node, Shape | None]) -> Shape | None:
+    """
+    Shape of the node, or None if its children can't be broadcast together.  Shapes of operations are remembered and
+    built from the shapes of their children, as the shape property walks the whole graph below the node each time.
+    """
+    if node not in shapes:
+        if isinstance(node, (BinOpNode, ComparisonNode)):
+            left, right = elementwise_shape(node.left, shapes), elementwise_shape(node.right, shapes)
+            try:
+                shapes[node] = left.merge(right) if left is not None and right is not None else None
+            except UnsupportedBroadcastException:
+                shapes[node] = None
+        elif is_ufunc(node) or is_conditional(node):
+            shapes[node] = elementwise_shape(node.children[0], shapes)
+        else:
+            shapes[node] = node.shape
+    return shapes[node]
+
+
+def creates_array(node: Node) -> bool:
+    """ Whether the node creates a new array for its result, rather than using an array from elsewhere. """
+    from .fuse_elementwise import FusedNode
+
+    return isinstance(node, (BinOpNode, ComparisonNode, FusedNode)) or is_ufunc(node)
+
+
+def writes_buffer(node: Node, shapes: dict[Node, Shape | None]) -> bool:
+    """ Whether the node can write its result in to an existing array, see the buffer attribute of the nodes. """
+    if isinstance(node, (BinOpNode, ComparisonNode)):
+        supported = node.operator in NUMPY_OPERATORS and \
+            all(x.data_type in (DataType.Number, DataType.Boolean) for x in node.children)
+    else:
+        supported = creates_array(node)
+    if not supported or node.buffer is not None:
+        return False
+    shape = elementwise_shape(node, shapes)
+    return shape is not None and not shape.is_scalar
+
+
+def array_dtype(node: Node, dtypes: dict[Node, str | None]) -> str | None:
+    """ Name of the numpy dtype of the node's value, if it is known ahead of running the code. """
+    from .fuse_elementwise import FusedNode
+
+    if node not in dtypes:
+        if isinstance(node, ComparisonNode):
+            dtypes[node] = 'bool_'
+        elif isinstance(node, FusedNode):
+            dtypes[node] = node.dtype
+        elif isinstance(node, BinOpNode) and node.operator in NUMPY_OPERATORS or is_ufunc(node):
+            # arithmetic on floats gives floats, integers and booleans give their own types.
+            floats = any(array_dtype(x, dtypes) == 'float64' for x in node.children)
+            division = isinstance(node, BinOpNode) and node.operator is ast.Div
+            dtypes[node] = 'float64' if floats or division else None
+        elif isinstance(node, LiteralNode) and isinstance(node.value, (float, np.ndarray)):
+            dtype = np.asarray(node.value).dtype
+            dtypes[node] = 'float64' if dtype == np.float64 else None
+        else:
+            dtypes[node] = None
+    return dtypes[node]
@@ -0,0 +1,260 @@
+"""
+Fuse elementwise optimization merges chains of elementwise operations on arrays into a single loop.  Without it an
+expression such as ABS(SIN(A1:A1000) * 2 + B1:B1000) creates a full temporary array for every operation, and each
+operation reads and writes the whole array again.  With it each element is computed in one go in a loop over the
+array, so the inputs are only read once and only the result is written.
+
+Groups are grown down from a root elementwise operation through children which are also elementwise operations with
+the same shape, and are only used by the group (values used elsewhere are needed as arrays anyway).  Anything else
+the group uses is an input of the loop.  Only operations whose shapes are inferred from the nodes below them are
+fused, as functions declare shapes which may not match the arrays they return (see _inferred).
+"""
+import ast
+
+from .elementwise import is_ufunc, is_conditional, elementwise_shape, array_dtype
+from ..ast import NUMPY_DTYPES, ast_call, ast_tuple
+from ..excel_reference import DataType
+from ..logger import logger
+from ..nodes import Graph, Node, BinOpNode, ComparisonNode, FunctionOpNode, post_order
+from ..shape import Shape
+
+# expression kinds, see FusedNode.
+INPUT = 'input'
+BINOP = 'binop'
+COMPARE = 'compare'
+CALL = 'call'
+CONDITION = 'condition'
+
+# operators which raise on single numbers where numpy gives inf or nan for arrays, i.e. dividing by zero, so are
+# computed by a function giving the same result as numpy within the loop.
+UFUNC_OPERATORS = {
+    ast.Div: 'mathematical.true_divide',
+    ast.Pow: 'mathematical.power',
+}
+
+
+class FusedNode(Node):
+    """
+    Fused nodes compute a group of elementwise operations (see module description) with a single loop over the
+    elements of the result.  The children are the inputs of the group.
+
+    The operations are held as an expression tree of tuples, the first element is the kind of expression:
+        (INPUT, idx) the element of the idx'th child, or the child itself if it is a scalar.
+        (BINOP, operator, left, right) and (COMPARE, operator, left, right) with an ast operator class.
+        (CALL, function name, *args) calls a numpy ufunc on the elements.
+        (CONDITION, test, true, false) for IF.
+
+    The dtype is the numpy dtype the operations give when computed on arrays (see array_dtype), or None if it depends
+    on the dtype of the inputs, i.e. operations on integers give integers.  The result then takes the dtype of its
+    first element.
+    """
+
+    def __init__(self, variable_name: str, shape: Shape, data_type: DataType, inputs: list[Node],
+                 input_shapes: list[Shape], expression: tuple, dtype: str | None):
+        super().__init__(variable_name, inputs)
+        self._shape = shape
+        self._data_type = data_type
+        self._input_shapes = input_shapes
+        self.expression = expression
+        self.dtype = dtype
+        self.buffer = None
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def data_type(self):
+        return self._data_type
+
+    def statements(self, visited: set) -> list[ast.stmt]:
+        """ Loop computing the elements of the result, the inputs are generated ahead of it (see generate_ast_tree). """
+        stmts = []
+
+        # inputs which aren't variables (i.e. slices of other arrays) are only evaluated once, ahead of the loop.
+        inputs = []
+        for idx, child in enumerate(self.children):
+            ref = child.ref
+            if not isinstance(ref, (ast.Name, ast.Constant)):
+                name = f"{self.varname}_in{idx}"
+                stmts.append(ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=ref))
+                ref = ast.Name(id=name, ctx=ast.Load())
+            inputs.append(ref)
+
+        if self.buffer is not None:
+            # elements are only read from the position they are written to, so a dead input can hold the result.
+            stmts.append(self._ast_wrap(self.buffer.ref))
+        else:
+            if self.dtype is not None:
+                dtype = ast_call(f'numpy.{self.dtype}', []).func
+            else:
+                first = f"{self.varname}_first"
+                value = self._element_ast(self.expression, inputs, ast.Constant(0), ast.Constant(0), first=True)
+                stmts.append(ast.Assign(targets=[ast.Name(id=first, ctx=ast.Store())], value=value))
+                dtype = ast.Attribute(value=ast_call('numpy.asarray', [ast.Name(id=first, ctx=ast.Load())]),
+                                      attr='dtype', ctx=ast.Load())
+            keywords = [ast.keyword(arg='dtype', value=dtype)]
+            stmts.append(self._ast_wrap(ast_call('numpy.empty', [self.shape.ast], keywords)))
+
+        row, col = f"{self.varname}_i", f"{self.varname}_j"
+        row_ast, col_ast = ast.Name(id=row, ctx=ast.Load()), ast.Name(id=col, ctx=ast.Load())
+        target = ast.Subscript(value=ast.Name(id=self.varname, ctx=ast.Load()), ctx=ast.Store(),
+                               slice=ast_tuple(row_ast, col_ast))
+        value = self._element_ast(self.expression, inputs, row_ast, col_ast)
+        inner = _ast_for(col, self.shape.width, [ast.Assign(targets=[target], value=value)])
+        stmts.append(_ast_for(row, self.shape.height, [inner]))
+        return stmts
+
+    def _element_ast(self, expression: tuple, inputs: list[ast.expr], row: ast.expr, col: ast.expr,
+                     first: bool = False) -> ast.expr:
+        """
+        Expression computing a single element of the result.  For the first element, used for the dtype of the
+        result, IF gives the common type of both values as numpy.where does for arrays.
+        """
+        kind = expression[0]
+        if kind == INPUT:
+            idx = expression[1]
+            shape = self._input_shapes[idx]
+            if shape.is_scalar:
+                return inputs[idx]
+            # inputs with a single row or column are broadcast across the other dimension.
+            row_idx = ast.Constant(0) if shape.height == 1 else row
+            col_idx = ast.Constant(0) if shape.width == 1 else col
+            return ast.Subscript(value=inputs[idx], slice=ast_tuple(row_idx, col_idx), ctx=ast.Load())
+
+        if kind == CONDITION:
+            test, body, orelse = [self._element_ast(x, inputs, row, col, first) for x in expression[1:]]
+            if first:
+                return ast_call('numpy.where', [ast.Constant(True), body, orelse])
+            return ast.IfExp(test=test, body=body, orelse=orelse)
+
+        args = [self._element_ast(x, inputs, row, col, first) for x in expression[2:]]
+        if kind == BINOP and expression[1] in UFUNC_OPERATORS:
+            return ast_call(UFUNC_OPERATORS[expression[1]], args)
+        elif kind == BINOP:
+            return ast.BinOp(left=args[0], op=expression[1](), right=args[1])
+        elif kind == COMPARE:
+            return ast.Compare(left=args[0], ops=[expression[1]()], comparators=[args[1]])
+        return ast_call(expression[1], args)
+
+    @property
+    def ast(self):
+        raise NotImplementedError("Cannot directly generate AST - only can rebuild tree")
+
+    def __repr__(self):
+        return f"FUSED:{self.varname}"
+
+
+def fuse_elementwise(graph: Graph) -> Graph:
+    # output nodes can't be fused, so start from their children
+    nodes = post_order([child for _, root in graph for child in root.children])
+    shapes, dtypes = {}, {}
+    inferred = _inferred(nodes)
+    absorbed = {node for node in nodes if _absorbed(node, shapes, inferred)}
+
+    # children are fused before their parents, so a group can use the result of a fused group below it.
+    for root in nodes:
+        if root in absorbed or not _elementwise(root, shapes, inferred):
+            continue
+        members, inputs = set(), []
+        expression = _expression(root, absorbed, members, inputs)
+        if len(members) < 2:
+            continue
+
+        logger.debug(f"Fusing {len(members)} elementwise operations below {root}")
+        input_shapes = [elementwise_shape(x, shapes) for x in inputs]
+        fused = FusedNode(root.varname, shapes[root], root.data_type, inputs, input_shapes, expression,
+                          array_dtype(root, dtypes))
+        root.replace_in_graph(fused)
+        for member in members:
+            for child in member.children:
+                if child not in members:
+                    child.remove_parent(member)
+    return graph
+
+
+def _elementwise(node: Node, shapes: dict[Node, Shape | None], inferred: set[Node]) -> bool:
+    """
+    Whether the node is an operation on arrays computing each element independently.  Arithmetic is only fused on
+    numbers, as operations on boolean arrays give booleans (True + True is True) where single booleans give integers.
+    """
+    if node not in inferred:
+        return False
+    elif isinstance(node, ComparisonNode):
+        supported = True
+    elif isinstance(node, BinOpNode) or is_ufunc(node):
+        supported = _numbers(node.children)
+    elif is_conditional(node):
+        # the result of IF is a number, so its values must be numbers as well.
+        supported = _numbers(node.children[1:])
+    else:
+        supported = False
+    if not supported or node.data_type not in NUMPY_DTYPES or \
+            any(child.data_type not in NUMPY_DTYPES for child in node.children):
+        return False
+    shape = elementwise_shape(node, shapes)
+    if shape is None or shape.is_scalar:
+        return False
+
+    # children are broadcast by using their first row or column, so they can't be larger than the result.
+    children = [elementwise_shape(x, shapes) for x in node.children]
+    return all(x is not None and x.height in (1, shape.height) and x.width in (1, shape.width) for x in children)
+
+
+def _numbers(nodes: list[Node]) -> bool:
+    return all(x.data_type == DataType.Number for x in nodes)
+
+
+def _inferred(nodes: list[Node]) -> set[Node]:
+    """
+    Nodes whose shape is the shape of their result.  Functions other than ufuncs and IF declare a shape which may not
+    match the array they return (i.e. SQRT is declared a single number but returns an array for a range), and a
+    group reads inputs declared as single numbers without an index, so these functions and the operations using them
+    are left out of groups.  Other nodes, such as ranges and literals, hold values of a known shape.
+    """
+    inferred = set()
+    for node in nodes:  # children are always ahead of their parents.
+        if isinstance(node, (BinOpNode, ComparisonNode)) or is_ufunc(node) or is_conditional(node):
+            known = all(x in inferred for x in node.children)
+        else:
+            known = not isinstance(node, FunctionOpNode)
+        if known:
+            inferred.add(node)
+    return inferred
+
+
+def _absorbed(node: Node, shapes: dict[Node, Shape | None], inferred: set[Node]) -> bool:
+    """ Whether the node is computed as part of the group of its parent rather than as an array of its own. """
+    parents = node.parents_set()
+    if len(parents) != 1 or not _elementwise(node, shapes, inferred):
+        return False
+    parent = next(iter(parents))
+    # a node used twice by its parent, such as x * x, is computed once ahead of the group.
+    return parent.children.count(node) == 1 and _elementwise(parent, shapes, inferred) and \
+        elementwise_shape(parent, shapes) == elementwise_shape(node, shapes)
+
+
+def _expression(node: Node, absorbed: set[Node], members: set[Node], inputs: list[Node]) -> tuple:
+    """
+    Expression tree (see FusedNode) computing the node, collecting the nodes of the group and its inputs.  Nodes only
+    have a single parent within the group, so each node is visited once.
+    """
+    if node in members or (members and node not in absorbed):
+        if node not in inputs:
+            inputs.append(node)
+        return INPUT, inputs.index(node)
+    members.add(node)
+
+    args = [_expression(child, absorbed, members, inputs) for child in node.children]
+    if isinstance(node, BinOpNode):
+        return BINOP, node.operator, *args
+    elif isinstance(node, ComparisonNode):
+        return COMPARE, node.operator, *args
+    elif node.excel_name == 'IF':
+        return CONDITION, *args
+    return CALL, node.function_details.fnc_str(False), *args
+
+
+def _ast_for(counter: str, stop: int, body: list[ast.stmt]) -> ast.For:
+    return ast.For(target=ast.Name(id=counter, ctx=ast.Store()), iter=ast_call('range', [ast.Constant(stop)]),
+                   body=body, orelse=[])
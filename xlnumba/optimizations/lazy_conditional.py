@@ -1,5 +1,7 @@
 import ast as astlib
+import heapq
 
+from .reachability import ReachabilityIndex
 from ..nodes import Node, Graph, FunctionOpNode
 from ..shape import SCALAR_SHAPE
 
@@ -23,6 +25,9 @@ class ConditionalNode(Node):
         for child in node.children:
             child.remove_parent(node)
 
+        # topological numbering of the graph, see lazy_conditional.
+        self.position: dict[Node, int] = {}
+
     @property
     def shape(self):
         return SCALAR_SHAPE
@@ -40,27 +45,24 @@ class ConditionalNode(Node):
     def false_node(self):
         return self.children[2]
 
-    def generate_ast_tree(self, visited: set):
-        """
-        Generate AST if statement.
+    @property
+    def generates_statements(self) -> bool:
+        return True
 
-        First deetermine if there are any statements that can be moved into the if/block
-        for those that can move them into the if block, otehrwise follow normal pattern
-        to generate ast statements.
+    def preceding_nodes(self) -> list[Node]:
         """
-        stmts = []
-        if self in visited:
-            return
-        visited.add(self)
-
-        # the following will generate all statements needed ahead of the if statement
-        _split_branch(self.true_node, stmts, visited)
-        _split_branch(self.false_node, stmts, visited)
-
-        # generate the condition logic
-        stmts.extend(self.children[0].generate_ast_tree(visited))
+        Nodes below the branches which can't be moved in to the if block, followed by the condition.
+        """
+        ahead = []
+        _split_branch(self.true_node, ahead, self.position)
+        _split_branch(self.false_node, ahead, self.position)
+        return ahead + [self.children[0]]
 
-        # generate both the True and False blocks
+    def statements(self, visited: set) -> list[astlib.stmt]:
+        """
+        Generate AST if statement, the nodes of each branch which aren't needed elsewhere are generated within the
+        branch.
+        """
         true_statements = self.true_node.generate_ast_tree(visited)
         false_statements = self.false_node.generate_ast_tree(visited)
 
@@ -69,8 +71,7 @@ class ConditionalNode(Node):
             body=true_statements + [self._ast_wrap(self.true_node.ref)],
             orelse=false_statements + [self._ast_wrap(self.false_node.ref)]
         )
-        stmts.append(if_stmt)
-        return stmts
+        return [if_stmt]
 
     @property
     def ast(self):
@@ -82,14 +83,21 @@ def lazy_conditional(graph: Graph) -> Graph:
     Entry point for optimziation.
     """
     visited = set()
+    conditionals = []
     for name, root in graph:
         children = list(root.children)
         for child in children:  # output nodes can't be collapsed so skip them to start the recursion.
-            _exec_recursive(child, visited)
+            _exec_recursive(child, visited, conditionals)
+
+    # the branches are split using a numbering of the nodes computed once for the whole graph.
+    if conditionals:
+        position = ReachabilityIndex([root for _, root in graph]).position
+        for conditional in conditionals:
+            conditional.position = position
     return graph
 
 
-def _exec_recursive(node: Node, visited):
+def _exec_recursive(node: Node, visited, conditionals: list[ConditionalNode]):
     """
     Depth first search recursively for functions that use the "IF" function.
     Todo: Extend to other if (IFS/SWITCH) statements in the future.
@@ -100,15 +108,16 @@ def _exec_recursive(node: Node, visited):
 
     # Depth first seach
     for child in node.children:
-        _exec_recursive(child, visited)  # this may replace child.
+        _exec_recursive(child, visited, conditionals)  # this may replace child.
 
     # process statements and replace if it matches items we have support for.
     if isinstance(node, FunctionOpNode) and node.excel_name == 'IF' and node.shape == SCALAR_SHAPE:
         new_node = ConditionalNode(node)
         node.replace_in_graph(new_node)
+        conditionals.append(new_node)
 
 
-def _split_branch(node: Node, stmts: list, visited: set):
+def _split_branch(node: Node, ahead: list[Node], position: dict[Node, int]):
     """
     Algorithm to split the graph below an if branch into the dependnecies that need to
     be executed ahead of the if block.
@@ -116,34 +125,27 @@ def _split_branch(node: Node, stmts: list, visited: set):
     High-level the alrogithm looks for the subgraph that starts from node which has no dependencies
     outside that subgraph.
 
-    Approach is the following:
-        1. Determine all the nodes which descend form the top node and sort based on the
-        maximum depth.
-        2. Check each node in sorted order to make sure all the parent nodes are within the
-        sub-graph.
+    Nodes below the branch are checked in topological order, parents before their children, so each node is checked
+    after all of its parents below the branch.  A node is part of the subgraph if all of its parents are, otherwise it
+    is generated ahead of the if block along with everything below it.
     """
     included = node.parents_set()
     if len(included) > 1:
-        parent_stmts = node.generate_ast_tree(visited)
-        stmts.extend(parent_stmts)
-    else:
-        assert len(included) == 1
-
-        # pass 1 find maximum distance from node to each part of the subtree
-        depth_dict = {}
-        stack = [(node, 0)]
-        while stack:
-            top_node, depth = stack.pop()
-            if top_node not in depth_dict or depth > depth_dict[top_node]:
-                depth_dict[top_node] = depth
-                stack.extend([(x, depth + 1) for x in top_node.children])
-        ordered_nodes = sorted(depth_dict.items(), key=lambda x: x[1])
-
-        for (top_node, _) in ordered_nodes:
-            top_node_parent_set = top_node.parents_set()
-            all_included = len(top_node_parent_set - included) == 0
-            if all_included:
-                included.add(top_node)
-            else:
-                new_stmts = top_node.generate_ast_tree(visited)
-                stmts.extend(new_stmts)
+        ahead.append(node)
+        return
+
+    assert len(included) == 1
+    seen = {node}
+    heap = [(-position.get(node, 0), 0, node)]
+    counter = 1
+    while heap:
+        _, _, top_node = heapq.heappop(heap)
+        if top_node.parents_set() <= included:
+            included.add(top_node)
+            for child in top_node.children:
+                if child not in seen:
+                    seen.add(child)
+                    heapq.heappush(heap, (-position.get(child, 0), counter, child))
+                    counter += 1
+        else:
+            ahead.append(top_node)
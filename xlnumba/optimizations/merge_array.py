@@ -15,6 +15,7 @@ There are two different modes this works in:
 import ast
 from math import prod
 
+from .reachability import ReachabilityIndex
 from ..ast import ast_tuple, ast_call
 from ..excel_reference import DataType
 from ..logger import logger
@@ -124,11 +125,12 @@ def merge_array(graph: Graph):
     sorted_arrays = sorted(array_nodes, key=lambda x: x[0].shape.size, reverse=True)
 
     clusters = cluster_ranges(sorted_arrays)
+    index = ReachabilityIndex([root for _, root in graph], [node for node, _ in array_nodes])
 
     for cluster in clusters:
         # two cases if there are dependencies between the cells of the cluster we built up the larger
         # arrays from smaller arrays.  If not we can just use index to create view.
-        if has_dependencies(cluster):
+        if has_dependencies(cluster, index):
             # case 2 we have dependencies, and so we build incrementally
             logger.debug("Can't merge array due to dependencies for cluster %s", cluster)
             build_array_from_cluster(cluster)
@@ -136,6 +138,11 @@ def merge_array(graph: Graph):
             # no dependnecies so just view of the existing cluster.
             replace_array_node_with_index_node(cluster)
 
+        # users of the merged arrays now use every cell of the covering array, which can add dependencies between the
+        # arrays of later clusters.
+        for node in cluster[1:]:
+            index.add_dependents(cluster[0], node)
+
     return graph
 
 
@@ -168,7 +175,7 @@ def cluster_ranges(array_nodes):
         for other_idx in range(0, idx):
             _, other_details = array_nodes[other_idx]
             cluster_idx = None
-            if details.issubset(other_details):
+            if details.issubset(other_details) and find_offset(node, array_nodes[other_idx][0]) is not None:
                 cluster_idx = other_idx
                 break
 
@@ -181,10 +188,10 @@ def cluster_ranges(array_nodes):
     return clusters
 
 
-def has_dependencies(cluster):
+def has_dependencies(cluster, index: ReachabilityIndex):
+    """ Whether any array of the cluster is used to compute a larger array of the cluster. """
     for idx in range(1, len(cluster)):
-        current_node = cluster[idx]
-        if current_node.depends_on(cluster[:idx]):
+        if index.below(cluster[idx], cluster[:idx]):
             return True
     return False
 
@@ -206,39 +213,48 @@ def build_array_from_cluster(cluster: list[Node]):
     covering_node = cluster[0]
     covering_children = covering_node.children
     bf = BufferNode(cluster[0].varname + "_buffer", prod(cluster[0].shape), covering_node.data_type)
-    current_set = set()
+    assigned = set()
     last_idx_node = bf
 
     for node in reversed(cluster):
-        new_children = set(node.children) - current_set
-        current_set = current_set.union(new_children)
-
-        for child in new_children:
-            idx = covering_children.index(child)
-            idx_node = BufferAssignmentNode(bf, idx, child, last_idx_node)
-            last_idx_node = idx_node
-
         index_slice = get_slice(node, covering_node)
+        start, stop = index_slice[0] if covering_node.shape.vertical else index_slice[1]
+        for idx in range(start, stop):
+            if idx not in assigned:
+                assigned.add(idx)
+                last_idx_node = BufferAssignmentNode(bf, idx, covering_children[idx], last_idx_node)
+
         new_node = BufferIndexNode(bf.varname, bf, index_slice, last_idx_node)
         node.replace_in_graph(new_node)
         for child in node.children:
             child.remove_parent(node)
 
 
-def get_slice(child, covering_node: Node):
-    child_variables = [child for child in child.children]
-    cluster_variables = [node for node in covering_node.children]
+def find_offset(child: Node, covering_node: Node) -> int | None:
+    """
+    Position of the elements of the child array within the covering array, or None if they aren't a contiguous run of
+    it.  Elements are matched by position rather than looked up, since the same node can be several elements of an
+    array (i.e. the default value of blank cells).
+    """
+    child_variables = child.children
+    cluster_variables = covering_node.children
+    size = len(child_variables)
+    for start in range(0, len(cluster_variables) - size + 1):
+        if all(x is y for x, y in zip(child_variables, cluster_variables[start:start + size])):
+            return start
+    return None
 
-    # Create list of indexes for each of the child variables in the cluster variable
-    indexes = [cluster_variables.index(var) for var in child_variables]
 
+def get_slice(child, covering_node: Node):
     # for now this only supports contiguous indexes, for the future need to enhance if somehow we wind up discrete
     # subsets
     # todo support non-continguous indexes
-    logger.debug("Indexes are %s", indexes)
-    assert indexes == list(range(min(indexes), max(indexes) + 1))
+    start = find_offset(child, covering_node)
+    logger.debug("Offset is %s", start)
+    assert start is not None
+    stop = start + len(child.children)
     if covering_node.shape.vertical:
-        return (min(indexes), max(indexes) + 1), (0, 1)
+        return (start, stop), (0, 1)
     else:
         assert covering_node.shape.horizontal
-        return (0, 1), (min(indexes), max(indexes) + 1)
+        return (0, 1), (start, stop)
@@ -0,0 +1,52 @@
+"""
+Reachability answers dependency queries between nodes of the graph (whether one node is below another) without walking
+the graph for each query, which is exponential on graphs where nodes share children.  The index is built once for an
+optimization pass, in time linear in the size of the graph.
+"""
+from ..nodes import Node, post_order
+
+
+class ReachabilityIndex:
+    """
+    Topological numbering of the nodes below a set of roots, and for each node which of a set of target nodes are
+    above it (depend on it).
+
+    Nodes are numbered in post order, so every node is numbered after all the nodes below it.  The targets above each
+    node are held as a bitset, an int with a bit for each target, built from the parents of the node as the nodes are
+    visited in reverse order.  Only the targets queried by the pass need a bit.
+    """
+
+    def __init__(self, roots: list[Node], targets: list[Node] = ()):
+        self.order = post_order(list(roots))
+        self.position = {node: idx for idx, node in enumerate(self.order)}
+        self._bits = {target: 1 << idx for idx, target in enumerate(targets)}
+
+        self._above = {}
+        for node in reversed(self.order):  # parents are always ahead of their children.
+            above = 0
+            for parent in node.parents_set():
+                if parent in self._above:  # parents outside the graph, i.e. nodes which were replaced, are ignored.
+                    above |= self._above[parent] | self._bits.get(parent, 0)
+            self._above[node] = above
+
+    def below(self, node: Node, targets: list[Node]) -> bool:
+        """ Whether any of the targets depend on the node. """
+        mask = 0
+        for target in targets:
+            mask |= self._bits[target]
+        return bool(self._above.get(node, 0) & mask)
+
+    def add_dependents(self, node: Node, other: Node):
+        """
+        Record that the targets depending on the other node now depend on the node as well, after the graph has been
+        changed, i.e. the other node has been replaced by a node using the node.  Numbering is not updated.
+        """
+        extra = self._above.get(other, 0) | self._bits.get(other, 0)
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            above = self._above.get(current, 0)
+            if above | extra == above:
+                continue  # nodes below already depend on everything above this node.
+            self._above[current] = above | extra
+            stack.extend(current.children)
@@ -0,0 +1,147 @@
+"""
+Simplify arithmetic rewrites operations in to cheaper equivalent ones, where collapse_literals can only remove
+operations when all of their inputs are known.  This covers:
+    1) Identities, such as x + 0, x - 0, x * 1 and x ^ 1, which are removed.
+    2) Small integer powers, x ^ 3 becomes x * x * x and x ^ 0.5 becomes a square root.
+    3) Division by a constant with an exact reciprocal (i.e. powers of two) becomes a multiplication.
+    4) Negation, which is compiled as a multiplication by -1, is folded in to the addition or subtraction using it.
+
+Rewrites must give exactly the same result as the original operation, so identities are only removed for integer
+literals (x * 1.0 turns an integer array in to floats), and only numbers are simplified as Python treats booleans
+differently (True * True is 1 but the product of two boolean arrays is a boolean array).
+"""
+import ast
+import math
+import sys
+
+from .. import excel_functions
+from ..excel_reference import DataType
+from ..logger import logger
+from ..nodes import Graph, Node, BinOpNode, FunctionOpNode, LiteralNode, post_order
+
+# Largest integer power expanded in to multiplications.
+MAX_INTEGER_POWER = 8
+
+
+def simplify_arithmetic(graph: Graph) -> Graph:
+    simplified = 0
+    # output nodes are never simplified, so start from their children
+    for node in post_order([child for _, root in graph for child in root.children]):
+        if not node.parents_set():
+            continue  # already removed from the graph by an earlier rewrite
+        new_node = _simplify(node)
+        while new_node is not None:
+            logger.debug(f"Simplified {node} to {new_node}")
+            node.replace_in_graph(new_node)
+            for child in node.children:
+                child.remove_parent(node)
+            node, new_node = new_node, _simplify(new_node)
+            simplified += 1
+    logger.debug(f"Simplified {simplified} arithmetic operations")
+    return graph
+
+
+def _simplify(node: Node) -> Node | None:
+    """ Cheaper node computing the same value as the node, or None if it can't be simplified. """
+    operation = _operation(node)
+    if operation is None:
+        return None
+    operator, left, right = operation
+    if not _is_number(left) or not _is_number(right):
+        return None
+
+    if operator is ast.Add:
+        if _is_integer(right, 0):
+            return left
+        elif _is_integer(left, 0):
+            return right
+        elif _negated(right) is not None:
+            return BinOpNode(node.varname, ast.Sub, left, _negated(right))
+        elif _negated(left) is not None:
+            return BinOpNode(node.varname, ast.Sub, right, _negated(left))
+    elif operator is ast.Sub:
+        if _is_integer(right, 0):
+            return left
+        elif _negated(right) is not None:
+            return BinOpNode(node.varname, ast.Add, left, _negated(right))
+    elif operator is ast.Mult:
+        if _is_integer(right, 1):
+            return left
+        elif _is_integer(left, 1):
+            return right
+        elif _negated(left) is not None and _negated(right) is not None:
+            return BinOpNode(node.varname, ast.Mult, _negated(left), _negated(right))
+        elif _negated(left) is not None and _literal(right) is not None:
+            return BinOpNode(node.varname, ast.Mult, _negated(left), LiteralNode(node.varname + "_c", -right.value))
+        elif _negated(right) is not None and _literal(left) is not None:
+            return BinOpNode(node.varname, ast.Mult, _negated(right), LiteralNode(node.varname + "_c", -left.value))
+    elif operator is ast.Div:
+        reciprocal = _exact_reciprocal(_literal(right))
+        if reciprocal is not None:
+            return BinOpNode(node.varname, ast.Mult, left, LiteralNode(node.varname + "_c", reciprocal))
+    elif operator is ast.Pow:
+        if _is_integer(right, 1):
+            return left
+        elif _literal(right) is not None and right.value == 0.5:
+            return FunctionOpNode(node.varname, excel_functions.INTERNAL_SQRT, [left])
+        elif _literal(right) is not None and isinstance(right.value, int) and 2 <= right.value <= MAX_INTEGER_POWER:
+            return _integer_power(node.varname, left, right.value)
+    return None
+
+
+def _operation(node: Node) -> tuple | None:
+    """ The operator and operands of arithmetic operations, treating POWER the same as the ^ operator. """
+    if isinstance(node, BinOpNode):
+        return node.operator, node.left, node.right
+    elif isinstance(node, FunctionOpNode) and node.excel_name == 'POWER' and len(node.children) == 2:
+        return ast.Pow, node.children[0], node.children[1]
+    return None
+
+
+def _is_number(node: Node) -> bool:
+    return node.data_type == DataType.Number
+
+
+def _literal(node: Node) -> LiteralNode | None:
+    """ The node if it is a scalar numeric literal. """
+    if isinstance(node, LiteralNode) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node
+    return None
+
+
+def _is_integer(node: Node, value: int) -> bool:
+    return _literal(node) is not None and type(node.value) is int and node.value == value
+
+
+def _negated(node: Node) -> Node | None:
+    """ The node being negated if the node is a negation (a multiplication by the integer -1), otherwise None. """
+    if not isinstance(node, BinOpNode) or node.operator is not ast.Mult:
+        return None
+    elif _is_integer(node.right, -1) and _is_number(node.left):
+        return node.left
+    elif _is_integer(node.left, -1) and _is_number(node.right):
+        return node.right
+    return None
+
+
+def _exact_reciprocal(node: LiteralNode | None) -> float | None:
+    """
+    Reciprocal of the literal if multiplying by it gives exactly the same result as dividing by the literal, which
+    is only the case for powers of two.
+    """
+    if node is None or node.value == 0 or not math.isfinite(node.value):
+        return None
+    reciprocal = 1 / node.value
+    if abs(math.frexp(node.value)[0]) != 0.5 or abs(reciprocal) < sys.float_info.min:
+        return None
+    return reciprocal
+
+
+def _integer_power(varname: str, base: Node, exponent: int) -> Node:
+    """ Raise the base to the power by repeated squaring, i.e. x ^ 5 is ((x * x) * (x * x)) * x. """
+    if exponent == 1:
+        return base
+    half = _integer_power(varname + "_h", base, exponent // 2)
+    if exponent % 2 == 0:
+        return BinOpNode(varname, ast.Mult, half, half)
+    return BinOpNode(varname, ast.Mult, BinOpNode(varname + "_sq", ast.Mult, half, half), base)
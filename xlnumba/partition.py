@@ -0,0 +1,114 @@
+"""
+Partitioning splits the body of a large generated function in to helper functions, each compiled separately by numba
+and called in turn by the function.  Numba's typing and optimization time grows faster than the size of the function,
+so several small functions compile faster than one large one, and with a compilation cache each helper is cached on
+its own (see CompilationCache.store_parts) so editing a cell only recompiles the helpers whose code changed.
+
+The body is split between its top level statements.  Each helper takes the variables it uses which are assigned ahead
+of it (its live-in variables) and returns the variables it assigns which are used after it (its live-out variables),
+which the function passes on to the later helpers.  Arrays are passed by reference, so writes in to arrays created by
+an earlier helper (see buffer_reuse) are seen by the rest of the function.
+"""
+import ast
+import hashlib
+import zlib
+
+import astor
+
+from .execution import ast_module
+
+PART_FNC_SUFFIX = "_part_"
+
+
+def partition_statements(statements: list[ast.stmt], budget: int) -> list[list[ast.stmt]]:
+    """
+    Split the statements in to chunks of about the budget in length.  Chunks end after a statement chosen by a hash of
+    the variable it assigns, rather than after a fixed number of statements, so adding or removing a statement only
+    changes the chunk containing it rather than moving the boundaries of every chunk after it.  Chunks are at least
+    half and at most twice the budget in length.
+    """
+    chunks, chunk = [], []
+    for stmt in statements:
+        chunk.append(stmt)
+        target = next(iter(_names(stmt, ast.Store)), None)
+        boundary = target is not None and zlib.crc32(target.encode('utf-8')) % budget < 2
+        if len(chunk) >= 2 * budget or (len(chunk) >= budget // 2 and boundary):
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def ast_partitioned_body(name: str, body: list[ast.stmt], inputs: list[str], budget: int,
+                         decorator_list: list[ast.expr], constants: list[ast.Assign]) \
+        -> tuple[list[ast.FunctionDef], list[ast.stmt]]:
+    """
+    Move the statements of a function body in to helper functions called by the body.  Helpers are named by a hash of
+    the module defining them on their own, including the constants and user functions they use, so a helper generated
+    again for an unchanged part of the workbook has the same name and code.
+
+    :param name: Name of the function, helpers are named after it.
+    :param body: Statements of the function, ending with its return statement.
+    :param inputs: Arguments of the function.
+    :param budget: Number of statements in each helper, see partition_statements.
+    :param decorator_list: Decorators of the helpers.
+    :param constants: Constants of the function, see ast_constants.
+    :return: The helpers, and the body of the function calling them in turn.
+    """
+    *statements, tail = body
+    chunks = partition_statements(statements, budget)
+    loads = [_names(chunk, ast.Load) for chunk in chunks] + [_names([tail], ast.Load)]
+    stores = [_names(chunk, ast.Store) for chunk in chunks]
+
+    helpers, calls = [], []
+    defined = set(inputs)
+    for idx, chunk in enumerate(chunks):
+        live_in = [x for x in loads[idx] if x in defined]
+        used_later = set().union(*loads[idx + 1:])
+        live_out = [x for x in stores[idx] if x in used_later]
+        defined.update(stores[idx])
+
+        helper = _ast_helper(name, chunk, live_in, live_out, decorator_list, constants)
+        call = ast.Call(func=ast.Name(id=helper.name, ctx=ast.Load()),
+                        args=[ast.Name(id=x, ctx=ast.Load()) for x in live_in], keywords=[])
+        if live_out:
+            targets = ast.Tuple(elts=[ast.Name(id=x, ctx=ast.Store()) for x in live_out], ctx=ast.Store())
+            calls.append(ast.Assign(targets=[targets], value=call))
+        else:
+            calls.append(ast.Expr(value=call))
+        helpers.append(helper)
+    return helpers, calls + [tail]
+
+
+def helper_constants(helper: ast.FunctionDef, constants: list[ast.Assign]) -> list[ast.Assign]:
+    """ Constants used by a helper, which are defined by the module of the helper when written on its own. """
+    used = set(_names(helper, ast.Load))
+    return [x for x in constants if x.targets[0].id in used]
+
+
+def _ast_helper(name: str, chunk: list[ast.stmt], live_in: list[str], live_out: list[str],
+                decorator_list: list[ast.expr], constants: list[ast.Assign]) -> ast.FunctionDef:
+    outputs = ast.Tuple(elts=[ast.Name(id=x, ctx=ast.Load()) for x in live_out], ctx=ast.Load())
+    helper = ast.FunctionDef(
+        name=name,
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(arg=x) for x in live_in], vararg=None, kwonlyargs=[],
+                           kw_defaults=[], kwarg=None, defaults=[]),
+        body=chunk + [ast.Return(outputs)],
+        decorator_list=decorator_list
+    )
+    code = astor.to_source(ast_module(helper_constants(helper, constants) + [helper]))
+    helper.name = f"{name}{PART_FNC_SUFFIX}{hashlib.sha256(code.encode('utf-8')).hexdigest()[:16]}"
+    return helper
+
+
+def _names(statements, ctx) -> list[str]:
+    """ Variables loaded or stored by the statements, in order of first use. """
+    if isinstance(statements, ast.AST):
+        statements = [statements]
+    names = {}
+    for stmt in statements:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ctx):
+                names[node.id] = None
+    return list(names)
@@ -0,0 +1,190 @@
+"""
+Helpers for comparing formulas in relative (R1C1) form.  Formulas copied across a range of cells are written with
+different addresses in each cell (=B1*2, =B2*2, ...) but are the same relative to the cell they are in (=RC[-1]*2).
+"""
+import re
+from collections import namedtuple
+from typing import Iterable
+
+from openpyxl.formula import Tokenizer
+from openpyxl.utils.cell import column_index_from_string, get_column_letter
+
+# single cell reference within a formula, optionally on another sheet, e.g. B1, $B$1 or 'Sheet 2'!B$1
+CELL_TOKEN_EXPRESSION = re.compile(
+    r"^(?P<sheet>.+!)?(?P<col_abs>\$?)(?P<col>[A-Za-z]{1,3})(?P<row_abs>\$?)(?P<row>[0-9]+)$")
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+CellToken = namedtuple("CellToken", ["sheet", "col_abs", "col", "row_abs", "row"])
+
+
+def parse_cell_token(value: str) -> CellToken | None:
+    """
+    Split a single cell reference from a formula in to its parts, or None if it isn't a single cell (i.e. a range or a
+    defined name).  The sheet is kept as written including the trailing "!", or empty if there is no sheet.
+    """
+    match = CELL_TOKEN_EXPRESSION.match(value)
+    if match is None:
+        return None
+    return CellToken(match['sheet'] or '', bool(match['col_abs']), column_index_from_string(match['col'].upper()),
+                     bool(match['row_abs']), int(match['row']))
+
+
+def parse_range_token(value: str) -> tuple[CellToken, CellToken] | None:
+    """
+    Split a range of cells from a formula in to its first and last cell (see parse_cell_token), or None if it isn't a
+    range of cells (i.e. a whole column or a defined name).  The sheet is only written before the first cell.
+    """
+    if ':' not in value:
+        return None
+    first, last = value.rsplit(':', 1)
+    start, end = parse_cell_token(first), parse_cell_token(last)
+    if start is None or end is None or end.sheet:
+        return None
+    return start, end
+
+
+def sheet_name(sheet: str, default: str) -> str:
+    """ Name of the sheet written in front of a cell reference (i.e. 'Sheet 2'!), or the default if there is none. """
+    if not sheet:
+        return default
+    sheet = sheet[:-1]
+    if sheet.startswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    return sheet
+
+
+def cell_address(sheet: str, col: int, row: int) -> str:
+    """ Address of a cell, the sheet is as written in a formula (see parse_cell_token). """
+    return f"{sheet}{get_column_letter(col)}{row}"
+
+
+def range_address(sheet: str, min_col: int, min_row: int, max_col: int, max_row: int) -> str:
+    """ Address of a range, the sheet is as written in a formula (see parse_cell_token). """
+    return f"{sheet}{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}"
+
+
+def relative_signature(row: int, col: int, tokens: list) -> tuple:
+    """
+    The tokens of a formula in relative (R1C1) form, cell references and both ends of ranges are stored relative to
+    the cell they are in unless they are absolute.  Other references (i.e. defined names) are kept as written.
+
+    :param row: Row of the cell the formula is in.
+    :param col: Column of the cell the formula is in.
+    :param tokens: Tokens of the formula.
+    """
+    signature = []
+    for token in tokens:
+        if token.type == token.WSPACE:
+            continue
+        elif token.type == token.OPERAND and token.subtype == token.RANGE:
+            cells = parse_range_token(token.value)
+            cells = (parse_cell_token(token.value),) if cells is None else cells
+            if cells[0] is None:
+                signature.append((token.RANGE, token.value))
+                continue
+            signature.append((token.RANGE, cells[0].sheet) + tuple(
+                x for cell in cells for x in (cell.col_abs, cell.col if cell.col_abs else cell.col - col,
+                                              cell.row_abs, cell.row if cell.row_abs else cell.row - row)))
+        else:
+            value = token.value.upper() if token.type == token.FUNC else token.value
+            signature.append((token.type, token.subtype, value))
+    return tuple(signature)
+
+
+class SignatureIndex:
+    """
+    Base for finding blocks of cells with the same relative formula in a workbook (i.e. recurrences), caching the
+    relative signature of each cell as it is examined.  Positions run along the direction of the block, rows for a
+    vertical block and columns for a horizontal one, and lines the other way around.
+    """
+
+    def __init__(self, wb, inputs: Iterable = (), signatures: dict = None):
+        """
+        :param wb: Workbook to examine.
+        :param inputs: Input references, inputs replace the formula in their cells so can't be part of a block.
+        :param signatures: Signatures already found, shared between indexes of the same workbook so each formula is
+        only tokenized once.
+        """
+        self._wb = wb
+        self._inputs = [ref.key for ref in inputs]
+        self._signatures: dict[tuple[str, int, int], tuple | None] = {} if signatures is None else signatures
+        self._bounds: dict[str, tuple[int, int]] = {}
+
+    def _run(self, sheet: str, anchor: int, line: int, vertical: bool) -> tuple[int, int]:
+        """ First and last position of the cells around the anchor with the same formula relative to the cell. """
+        signature = self._signature(sheet, *self._coordinate(anchor, line, vertical))[0]
+
+        def same(pos):
+            pos_signature = self._signature(sheet, *self._coordinate(pos, line, vertical))
+            return pos_signature is not None and pos_signature[0] == signature
+
+        start = anchor
+        while start > 1 and same(start - 1):
+            start -= 1
+        last = anchor
+        while same(last + 1):
+            last += 1
+        return start, last
+
+    def _signature(self, sheet: str, row: int, col: int) -> tuple | None:
+        """ Formula of a cell in relative form along with its tokens, None if the cell isn't a formula. """
+        key = (sheet, row, col)
+        if key not in self._signatures:
+            ws = self._wb[sheet]
+            max_row, max_col = self._sheet_bounds(sheet)
+
+            result = None
+            if row <= max_row and col <= max_col:
+                cell = ws.cell(row, col)
+                if cell.data_type == 'f' and isinstance(cell.value, str):
+                    tokens = Tokenizer(cell.value).items
+                    result = relative_signature(row, col, tokens), tokens
+            self._signatures[key] = result
+        return self._signatures[key]
+
+    def _numeric_range(self, ref, allow_blank: bool = True) -> bool:
+        """
+        Whether a range has numbers (or formulas), so it can be read as an array of numbers.  Blank cells are read as
+        zero, unless not allowed.
+        """
+        ws = self._wb[ref.sheet]
+        max_row, max_col = self._sheet_bounds(ref.sheet)
+
+        key = ref.key
+        if not allow_blank and (key.max_row > max_row or key.max_col > max_col):
+            return False
+        values = False
+        for row in range(key.min_row, min(key.max_row, max_row) + 1):
+            for col in range(key.min_col, min(key.max_col, max_col) + 1):
+                cell = ws.cell(row, col)
+                if cell.value is None:
+                    if not allow_blank:
+                        return False
+                    continue
+                elif cell.data_type not in ('n', 'b', 'f'):
+                    return False
+                values = True
+        return values
+
+    def _overridden(self, cells: list[tuple[str, int, int]]) -> bool:
+        """ Whether any of the cells is an input, inputs replace the formula in their cells. """
+        for key in self._inputs:
+            for sheet, row, col in cells:
+                if sheet == key.sheet and key.min_row <= row <= key.max_row and key.min_col <= col <= key.max_col:
+                    return True
+        return False
+
+    def _sheet_bounds(self, sheet: str) -> tuple[int, int]:
+        """
+        Last row and column of the sheet.  Only cells within the sheet are read, openpyxl creates cells when reading
+        them which would change its dimensions.
+        """
+        if sheet not in self._bounds:
+            ws = self._wb[sheet]
+            self._bounds[sheet] = (ws.max_row, ws.max_column)
+        return self._bounds[sheet]
+
+    @staticmethod
+    def _coordinate(pos: int, line: int, vertical: bool) -> tuple[int, int]:
+        return (pos, line) if vertical else (line, pos)
@@ -0,0 +1,349 @@
+"""
+Recurrences are blocks of formulas filled along consecutive rows (or columns) in which each cell depends on the cells
+before it, such as a balance carried forward each period of a projection:
+
+    C3 = C2 * (1 + $B$1) - D3
+
+Each line of the block (a column for a vertical recurrence) has the same formula relative to its position, and the
+lines refer to each other at the same or earlier positions.  Rather than building every cell, the block is computed by a
+single loop over an array holding all the lines (see RecurrenceNode), with the cells before the loop (the seeds)
+providing the initial state.
+"""
+from collections import namedtuple
+from dataclasses import dataclass
+from typing import Iterable
+
+from .excel_reference import ExcelReference
+from .exceptions import UnsupportedException
+from .logger import logger
+from .r1c1 import MAX_ROW, MAX_COLUMN, SignatureIndex, parse_cell_token, parse_range_token, cell_address, \
+    range_address, sheet_name
+
+# loops shorter than this are left to be built cell by cell.
+MIN_LOOP_LENGTH = 2
+
+ELEMENT = 'element'  # a line of the recurrence, offset from the position being computed.
+MOVING = 'moving'  # a range outside the recurrence, moving along with the position being computed.
+FIXED = 'fixed'  # a cell or range which is the same for every position.
+
+RecurrenceRef = namedtuple("RecurrenceRef", ["kind", "line", "offset", "reference"])
+
+
+@dataclass(eq=False)
+class RecurrenceTemplate:
+    """
+    Formula computing a line of the recurrence.  References to cells are replaced in the compiled loop, refs maps the
+    position of each cell reference in the tokens to what it refers to.
+    """
+    line: int
+    cell: ExcelReference
+    tokens: tuple
+    refs: dict[int, RecurrenceRef]
+
+
+@dataclass(eq=False)
+class Recurrence:
+    """
+    A recurrence covering the positions first to last of its lines.  Positions are rows for a vertical recurrence
+    and columns for a horizontal one, and lines the other way around.  The loop computes positions start to last,
+    the positions before start are seeds which are built as normal cells.
+    """
+    box: ExcelReference
+    vertical: bool
+    first: int
+    start: int
+    last: int
+    templates: tuple[RecurrenceTemplate, ...]  # in the order they are computed
+    seeds: dict[int, int]  # line to its first seed position, only lines used before the start of the loop
+
+    @property
+    def key(self) -> tuple:
+        """ Identity of the recurrence for compiler references. """
+        return 'RECURRENCE', self.vertical, tuple(x.line for x in self.templates), self.start, self.last
+
+    @property
+    def lines(self) -> list[int]:
+        return [x.line for x in self.templates]
+
+    def column(self, line: int) -> int:
+        """ Index of the line in the array holding the recurrence. """
+        return self.lines.index(line)
+
+    def seed_cells(self) -> list[tuple[ExcelReference, tuple[int, int]]]:
+        """ Cells before the start of the loop which are used by the loop, along with their offsets in the array. """
+        cells = []
+        for line, seed in self.seeds.items():
+            column = self.column(line)
+            for pos in range(seed, self.start):
+                if self.vertical:
+                    cells.append((self.box.create_relative(cell_address('', line, pos)), (pos - self.first, column)))
+                else:
+                    cells.append((self.box.create_relative(cell_address('', pos, line)), (column, pos - self.first)))
+        return cells
+
+    def slice(self, ref: ExcelReference) -> tuple[tuple[int, int], tuple[int, int]] | None:
+        """
+        Offsets of a cell or range within the array holding the recurrence, or None if it isn't held by the array.
+        Single cells must be computed by the loop, ranges within a single line may also include the seeds.
+        """
+        key = ref.key
+        if key.sheet != self.box.sheet:
+            return None
+        if self.vertical:
+            pos_range, line_range = (key.min_row, key.max_row), (key.min_col, key.max_col)
+        else:
+            pos_range, line_range = (key.min_col, key.max_col), (key.min_row, key.max_row)
+        line = line_range[0]
+        if line != line_range[1] or line not in self.lines:
+            return None
+
+        first = self.start if pos_range[0] == pos_range[1] else self.seeds.get(line, self.start)
+        if pos_range[0] < first or pos_range[1] > self.last:
+            return None
+        column = self.column(line)
+        positions = (pos_range[0] - self.first, pos_range[1] - self.first + 1)
+        return (positions, (column, column + 1)) if self.vertical else ((column, column + 1), positions)
+
+
+class RecurrenceIndex(SignatureIndex):
+    """
+    Recurrences found in a workbook during a compilation.  Cells are examined when they are first requested, and each
+    cell computed by a recurrence maps to it so the rest of the recurrence is found without examining it again.
+    """
+
+    def __init__(self, wb, inputs: Iterable[ExcelReference] = (), signatures: dict = None):
+        """
+        :param wb: Workbook to find recurrences in.
+        :param inputs: Input references, cells which are inputs can't be computed by a recurrence.
+        :param signatures: Relative signatures of cells already examined, see SignatureIndex.
+        """
+        super().__init__(wb, inputs, signatures)
+        self._cells: dict[tuple[str, int, int], Recurrence | None] = {}
+        self._recurrences: dict[tuple, Recurrence] = {}
+
+    def __getitem__(self, key: tuple) -> Recurrence:
+        return self._recurrences[key]
+
+    def find(self, ref: ExcelReference) -> tuple[Recurrence, tuple] | None:
+        """
+        Recurrence holding a cell or a range along one of its lines, along with the offsets of the reference within
+        the recurrence.  None if the reference isn't held by a recurrence.
+        """
+        key = ref.key
+        if ref.is_array or key.ref_type not in (ExcelReference.ReferenceType.CELL, ExcelReference.ReferenceType.RANGE):
+            return None
+        # the last cell of a range is the one most likely to be computed by the loop rather than a seed.
+        cell = (key.sheet, key.max_row, key.max_col)
+        if cell not in self._cells:
+            self._cells[cell] = self._detect(*cell)
+        recurrence = self._cells[cell]
+        if recurrence is None:
+            return None
+        offsets = recurrence.slice(ref)
+        return None if offsets is None else (recurrence, offsets)
+
+    def _detect(self, sheet: str, row: int, col: int) -> Recurrence | None:
+        if self._signature(sheet, row, col) is None:
+            return None
+        for vertical in (True, False):
+            pos, line = (row, col) if vertical else (col, row)
+            recurrence = self._detect_along(sheet, pos, line, vertical)
+            if recurrence is not None:
+                logger.debug("Found recurrence %s with lines %s computing positions %d to %d", recurrence.box,
+                             recurrence.lines, recurrence.start, recurrence.last)
+                return recurrence
+        return None
+
+    def _detect_along(self, sheet: str, anchor: int, anchor_line: int, vertical: bool) -> Recurrence | None:
+        """
+        Find the recurrence through the anchor cell along the given direction.  The lines of the recurrence are those
+        which refer to each other (directly or indirectly) through references moving along with the position, the
+        loop covers the positions where every line has the same formula as at the anchor.
+        """
+        refs = self._cell_refs(sheet, anchor, anchor_line, vertical)
+        if refs is None or not any(x.moving and x.sheet == sheet and x.offset <= 0 for x in refs.values()):
+            return None
+
+        lines = self._cycle(sheet, anchor, anchor_line, vertical)
+        if lines is None:
+            return None
+
+        # positions where every line has the same formula relative to its position.
+        start, last = 1, MAX_ROW if vertical else MAX_COLUMN
+        for line in lines:
+            line_start, line_last = self._run(sheet, anchor, line, vertical)
+            start, last = max(start, line_start), min(last, line_last)
+        if last - start + 1 < MIN_LOOP_LENGTH:
+            return None
+
+        body = [(sheet, *self._coordinate(pos, line, vertical)) for line in lines for pos in range(start, last + 1)]
+        recurrence = self._build(sheet, anchor, lines, start, last, vertical)
+        if recurrence is None or any(self._cells.get(x) is not None for x in body) or self._overridden(body):
+            # cells of the loop give the same result, so don't examine them again.
+            self._cells.update((x, None) for x in body)
+            return None
+
+        self._cells.update((x, recurrence) for x in body)
+        self._recurrences[recurrence.key] = recurrence
+        return recurrence
+
+    def _build(self, sheet: str, anchor: int, lines: set[int], start: int, last: int, vertical: bool) \
+            -> Recurrence | None:
+        templates = {}
+        same_position: dict[int, set[int]] = {}
+        first = start
+        seeds = {}
+        for line in lines:
+            cell_refs = self._cell_refs(sheet, anchor, line, vertical)
+            tokens = self._signature(sheet, *self._coordinate(anchor, line, vertical))[1]
+            if not all(_loop_token(x, vertical) for x in tokens):
+                return None
+
+            cell = ExcelReference._from_cell(self._wb, sheet, *self._coordinate(anchor, line, vertical))
+            refs = {}
+            same_position[line] = set()
+            for idx, cell_ref in cell_refs.items():
+                if not cell_ref.moving:
+                    refs[idx] = RecurrenceRef(FIXED, None, 0, cell.create_relative(tokens[idx].value))
+                elif cell_ref.sheet == sheet and cell_ref.line in lines:
+                    if cell_ref.offset > 0 or (cell_ref.offset == 0 and cell_ref.line == line):
+                        return None  # depends on positions not computed yet.
+                    if cell_ref.offset == 0:
+                        same_position[line].add(cell_ref.line)
+                    else:
+                        position = start + cell_ref.offset
+                        seeds[cell_ref.line] = min(seeds.get(cell_ref.line, start), position)
+                        first = min(first, position)
+                    refs[idx] = RecurrenceRef(ELEMENT, cell_ref.line, cell_ref.offset, None)
+                else:
+                    min_pos, max_pos = start + cell_ref.offset, last + cell_ref.offset
+                    if min_pos < 1 or max_pos > (MAX_ROW if vertical else MAX_COLUMN):
+                        return None
+                    if vertical:
+                        address = range_address(cell_ref.written_sheet, cell_ref.line, min_pos, cell_ref.line, max_pos)
+                    else:
+                        address = range_address(cell_ref.written_sheet, min_pos, cell_ref.line, max_pos, cell_ref.line)
+                    reference = cell.create_relative(address)
+                    if not self._numeric_range(reference):
+                        return None
+                    refs[idx] = RecurrenceRef(MOVING, cell_ref.line, cell_ref.offset, reference)
+            templates[line] = RecurrenceTemplate(line, cell, tuple(tokens), refs)
+
+        if first < 1:
+            return None
+        order = _computation_order(same_position)
+        if order is None:
+            return None
+
+        for line, seed in seeds.items():
+            for pos in range(seed, start):
+                data_type = self._wb[sheet].cell(*self._coordinate(pos, line, vertical)).data_type
+                if data_type not in ('n', 'b', 'f'):
+                    return None  # the loop only holds numbers.
+
+        min_line, max_line = min(lines), max(lines)
+        if vertical:
+            address = range_address('', min_line, first, max_line, last)
+        else:
+            address = range_address('', first, min_line, last, max_line)
+        box = ExcelReference(self._wb, address, sheet)
+        return Recurrence(box, vertical, first, start, last, tuple(templates[x] for x in order), seeds)
+
+    def _cycle(self, sheet: str, anchor: int, anchor_line: int, vertical: bool) -> set[int] | None:
+        """
+        Lines which both depend on and are depended on by the anchor line, through references on the same sheet
+        moving along with the position.  None if the anchor line doesn't depend on itself.
+        """
+        edges: dict[int, set[int]] = {}
+        stack = [anchor_line]
+        while stack:
+            line = stack.pop()
+            if line in edges:
+                continue
+            refs = self._cell_refs(sheet, anchor, line, vertical) or {}
+            edges[line] = {x.line for x in refs.values() if x.moving and x.sheet == sheet}
+            stack.extend(edges[line])
+
+        lines = set()
+        stack = [anchor_line]
+        while stack:
+            target = stack.pop()
+            for line, targets in edges.items():
+                if target in targets and line not in lines:
+                    lines.add(line)
+                    stack.append(line)
+        return lines if anchor_line in lines else None
+
+    def _cell_refs(self, sheet: str, pos: int, line: int, vertical: bool) -> dict | None:
+        """ Cell references in the formula of a cell by the position of their token, None if not a formula. """
+        row, col = self._coordinate(pos, line, vertical)
+        signature = self._signature(sheet, row, col)
+        if signature is None:
+            return None
+        refs = {}
+        for idx, token in enumerate(signature[1]):
+            if token.type != token.OPERAND or token.subtype != token.RANGE:
+                continue
+            cell = parse_cell_token(token.value)
+            if cell is None:
+                continue
+            moving = not (cell.row_abs if vertical else cell.col_abs)
+            ref_pos, ref_line = (cell.row, cell.col) if vertical else (cell.col, cell.row)
+            refs[idx] = _CellRef(sheet_name(cell.sheet, sheet), cell.sheet, moving, ref_line, ref_pos - pos)
+        return refs
+
+
+_CellRef = namedtuple("_CellRef", ["sheet", "written_sheet", "moving", "line", "offset"])
+
+
+def _computation_order(same_position: dict[int, set[int]]) -> list[int] | None:
+    """
+    Order to compute the lines at each position, lines which use other lines at the same position must be computed
+    after them.  None if the lines depend on each other at the same position (a circular reference).
+    """
+    order = []
+    remaining = {line: set(x) for line, x in same_position.items()}
+    while remaining:
+        ready = sorted(line for line, depends in remaining.items() if not depends)
+        if not ready:
+            return None
+        for line in ready:
+            del remaining[line]
+            order.append(line)
+        for depends in remaining.values():
+            depends.difference_update(ready)
+    return order
+
+
+def _loop_token(token, vertical: bool) -> bool:
+    """
+    Whether the token can be compiled in to the loop, the loop only holds numbers.  Only single cells are replaced
+    in the loop, so ranges must be the same at every position.
+    """
+    match token.type:
+        case token.OPERAND if token.subtype == token.RANGE:
+            cells = parse_range_token(token.value)
+            return cells is None or all(x.row_abs if vertical else x.col_abs for x in cells)
+        case token.OPERAND:
+            return token.subtype in (token.NUMBER, token.LOGICAL)
+        case token.OP_IN:
+            return token.value != '&'
+        case token.FUNC if token.subtype == token.OPEN:
+            from . import excel_functions as exl
+            from .special_functions import SPECIAL_FUNCTION_MAP
+
+            # special functions depend on the cell they are used in.
+            fn_name = token.value[:-1].upper().replace("_XLFN.", "").replace(".", "_x_")
+            if fn_name in SPECIAL_FUNCTION_MAP:
+                return False
+            try:
+                exl.find_function_details(fn_name)
+            except (NotImplementedError, UnsupportedException):
+                return False
+            return True
+        case token.SEP:
+            return token.subtype == token.ARG
+        case token.OP_PRE | token.OP_POST | token.PAREN | token.WSPACE | token.FUNC:
+            return True
+        case _:
+            return False
@@ -0,0 +1,7 @@
+"""
+Functions called by the generated code.  These only depend on numpy, numba and scipy, so modules written by
+Compiler.export_module can be imported without the compiler or its dependencies.
+"""
+from numba import jit
+
+xjit = jit(nopython=True, fastmath=True)
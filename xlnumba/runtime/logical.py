@@ -0,0 +1,29 @@
+import numpy as np
+
+from . import xjit
+
+
+@xjit
+def excel_xor(arr):  # xor is defined as number of true values is odd
+    return np.count_nonzero(arr) % 2 == 1
+
+
+@xjit
+def ifs_impl(conds, values):
+    for c, vals in zip(conds, values):
+        if c:
+            return vals
+    raise NotImplementedError("Ifs must return valid entry")
+
+
+@xjit
+def switch_impl(expr, conds, values):
+    for c, vals in zip(conds, values):
+        if c == expr:
+            return vals
+    raise NotImplementedError("Invalid switch function")
+
+
+@xjit
+def excel_if(test, true_val, false_val):
+    return true_val if test else false_val
@@ -0,0 +1,14 @@
+from . import xjit
+
+
+@xjit
+def choose(idx, arr):
+    return arr[idx - 1]
+
+
+@xjit
+def lookup(target, target_vector, value_vector, _approx=False):
+    for t, v in zip(target_vector[0], value_vector[0]):
+        if target == t:
+            return v
+    raise NotImplementedError("Lookups must find match to execute correctly")
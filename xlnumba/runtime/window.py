@@ -0,0 +1,169 @@
+"""
+Kernels computing an aggregate of every window along a vector in a single pass, used for blocks of running totals and
+moving averages (see windows.py).  The vector is a row or column, and the result has an element for each window in
+the same orientation.
+
+Expanding windows all start at the start of the vector, the first window covering the first "first" elements and each
+following window one more.  Sliding windows all cover "size" elements, each window starting one element after the
+previous one.
+"""
+import numpy as np
+from numba import jit
+
+from . import xjit
+
+
+@xjit
+def _orient(values: np.ndarray, result: np.ndarray) -> np.ndarray:
+    if values.shape[1] == 1:
+        return result.reshape((-1, 1))
+    return result.reshape((1, -1))
+
+
+@xjit
+def expanding_sum(values: np.ndarray, first: int) -> np.ndarray:
+    """
+    >>> expanding_sum.py_func(np.array([[1.], [2.], [3.], [4.]]), 2)
+    array([[ 3.],
+           [ 6.],
+           [10.]])
+    """
+    flat = values.flatten().astype(np.float64)
+    return _orient(values, np.cumsum(flat)[first - 1:])
+
+
+@xjit
+def expanding_average(values: np.ndarray, first: int) -> np.ndarray:
+    """
+    >>> expanding_average.py_func(np.array([[1., 2., 3., 4.]]), 1)
+    array([[1. , 1.5, 2. , 2.5]])
+    """
+    flat = values.flatten().astype(np.float64)
+    counts = np.arange(first, flat.size + 1).astype(np.float64)
+    return _orient(values, np.cumsum(flat)[first - 1:] / counts)
+
+
+@xjit
+def _expanding_extreme(values: np.ndarray, first: int, sign: float) -> np.ndarray:
+    """ Running maximum of the values multiplied by the sign, a sign of -1 gives the running minimum. """
+    flat = values.flatten().astype(np.float64)
+    result = np.empty(flat.size - first + 1)
+    current = flat[0]
+    for i in range(1, first):
+        if sign * flat[i] > sign * current:
+            current = flat[i]
+    result[0] = current
+    for i in range(first, flat.size):
+        if sign * flat[i] > sign * current:
+            current = flat[i]
+        result[i - first + 1] = current
+    return _orient(values, result)
+
+
+@xjit
+def expanding_max(values: np.ndarray, first: int) -> np.ndarray:
+    """
+    >>> expanding_max.py_func(np.array([[3.], [1.], [4.], [1.], [5.]]), 2)
+    array([[3.],
+           [4.],
+           [4.],
+           [5.]])
+    """
+    return _expanding_extreme(values, first, 1.0)
+
+
+@xjit
+def expanding_min(values: np.ndarray, first: int) -> np.ndarray:
+    return _expanding_extreme(values, first, -1.0)
+
+
+@jit(nopython=True)
+def _add(total: float, compensation: float, value: float):
+    """ Neumaier's compensated addition, the rounding error of each addition is kept in the compensation. """
+    result = total + value
+    if abs(total) >= abs(value):
+        compensation += (total - result) + value
+    else:
+        compensation += (value - result) + total
+    return result, compensation
+
+
+@jit(nopython=True)
+def _compensated_sum(flat: np.ndarray):
+    total, compensation = 0.0, 0.0
+    for value in flat:
+        total, compensation = _add(total, compensation, value)
+    return total, compensation
+
+
+@jit(nopython=True)
+def sliding_sum(values: np.ndarray, size: int) -> np.ndarray:
+    """
+    Each window adds the element entering the window and subtracts the one leaving it.  The additions are compensated
+    so rounding errors don't build up along the vector, i.e. after a large value leaves the window.  Windows are summed
+    again whenever the total or the elements entering and leaving it aren't finite, as subtracting an infinity would
+    leave every later window nan.  Compiled without fastmath, which lets numba reorder the additions and assume the
+    values are finite.
+
+    >>> sliding_sum.py_func(np.array([[1., 2., 3., 4., 5.]]), 3)
+    array([[ 6.,  9., 12.]])
+    >>> sliding_sum.py_func(np.array([[1e16, 1., 1., 1., 1.]]), 2)
+    array([[1.e+16, 2.e+00, 2.e+00, 2.e+00]])
+    """
+    flat = values.flatten().astype(np.float64)
+    result = np.empty(flat.size - size + 1)
+    total, compensation = _compensated_sum(flat[:size])
+    result[0] = total + compensation if np.isfinite(total) else total
+    for i in range(size, flat.size):
+        if np.isfinite(total) and np.isfinite(flat[i]) and np.isfinite(flat[i - size]):
+            total, compensation = _add(total, compensation, flat[i])
+            total, compensation = _add(total, compensation, -flat[i - size])
+        else:
+            total, compensation = _compensated_sum(flat[i - size + 1:i + 1])
+        result[i - size + 1] = total + compensation if np.isfinite(total) else total
+    return _orient(values, result)
+
+
+@xjit
+def sliding_average(values: np.ndarray, size: int) -> np.ndarray:
+    return sliding_sum(values, size) / size
+
+
+@xjit
+def _sliding_extreme(values: np.ndarray, size: int, sign: float) -> np.ndarray:
+    """
+    Maximum of each window of the values multiplied by the sign, a sign of -1 gives the minimum.  Keeps a queue of the
+    positions which can still be the maximum of a window, in decreasing order of their values, so each position is
+    added and removed at most once.
+    """
+    flat = values.flatten().astype(np.float64)
+    result = np.empty(flat.size - size + 1)
+    queue = np.empty(flat.size, dtype=np.int64)
+    head, tail = 0, 0
+    for i in range(flat.size):
+        while tail > head and sign * flat[queue[tail - 1]] <= sign * flat[i]:
+            tail -= 1
+        queue[tail] = i
+        tail += 1
+        if queue[head] <= i - size:
+            head += 1
+        if i >= size - 1:
+            result[i - size + 1] = flat[queue[head]]
+    return _orient(values, result)
+
+
+@xjit
+def sliding_max(values: np.ndarray, size: int) -> np.ndarray:
+    """
+    >>> sliding_max.py_func(np.array([[3.], [1.], [4.], [1.], [5.]]), 2)
+    array([[3.],
+           [4.],
+           [4.],
+           [5.]])
+    """
+    return _sliding_extreme(values, size, 1.0)
+
+
+@xjit
+def sliding_min(values: np.ndarray, size: int) -> np.ndarray:
+    return _sliding_extreme(values, size, -1.0)
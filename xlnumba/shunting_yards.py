@@ -56,7 +56,9 @@ class ShuntingYardsOperator:
 
 def wrap_node_with_multiplier(node: Node, multiplier: float, postfix: str) -> Node:
     """
-    Modify the node to handle prefix/postfix operators with a multiplication (specifically % or -).
+    Modify the node to handle prefix/postfix operators with a multiplication (specifically % or -).  The result needs
+    its own variable, as other nodes can use the node being modified.
     """
-    new_node = BinOpNode(node.varname, ast.Mult, node, LiteralNode(node.varname + postfix, multiplier))
+    varname = node.varname + postfix
+    new_node = BinOpNode(varname, ast.Mult, node, LiteralNode(varname + "_m", multiplier))
     return new_node
@@ -0,0 +1,30 @@
+"""
+Tuple functions return the outputs of the compiled workbook as a tuple rather than a dictionary.  Returning a
+dictionary from numba builds a typed dictionary on every call, and requires every output to have the same type, while
+a tuple can mix scalar and array outputs.  This module provides the thin Python layer giving access to the outputs
+by name.
+"""
+from collections import namedtuple
+
+
+class TupleFunction:
+    """
+    Callable wrapper around a generated function returning its outputs as a tuple in the order they were added.  The
+    result is a named tuple, so outputs can be read by name as attributes (result.dst), by position, or converted to a
+    dictionary with _asdict.
+
+    Output names must be valid field names of a named tuple, i.e. not start with an underscore.
+    """
+
+    def __init__(self, fn, output_names: list[str]):
+        """
+        :param fn: Generated function returning a tuple of outputs.
+        :param output_names: Names of the outputs in the order they are returned.
+        """
+        self.fn = fn
+        self.output_names = list(output_names)
+        self.result_type = namedtuple("Outputs", self.output_names)
+        self._make = self.result_type._make
+
+    def __call__(self, *args, **inputs):
+        return self._make(self.fn(*args, **inputs))
@@ -0,0 +1,171 @@
+"""
+Windows are blocks of formulas filled along consecutive rows (or columns) which each aggregate a window of the same
+vector, such as running totals or moving averages:
+
+    C2 = SUM($B$2:B2)        expanding windows, the start of the range is fixed so each window grows by a cell.
+    C13 = AVERAGE(B2:B13)    sliding windows, the whole range moves so each window has the same size.
+
+Building every cell aggregates the whole window for each cell, which is quadratic in the length of the block.  Instead
+the block is computed by a single pass over the vector (see excel_functions/window.py), and cells of the block are
+extracted from its result.
+"""
+from dataclasses import dataclass
+from typing import Iterable
+
+from .excel_reference import ExcelReference
+from .logger import logger
+from .r1c1 import MAX_ROW, MAX_COLUMN, SignatureIndex, CellToken, parse_range_token, range_address, sheet_name
+
+# blocks shorter than this are left to be built cell by cell.
+MIN_WINDOW_BLOCK_LENGTH = 2
+
+# Excel functions along with the functions computing them over expanding and sliding windows.
+WINDOW_FUNCTIONS = {
+    'SUM': ('INTERNAL_EXPANDING_SUM', 'INTERNAL_SLIDING_SUM'),
+    'AVERAGE': ('INTERNAL_EXPANDING_AVERAGE', 'INTERNAL_SLIDING_AVERAGE'),
+    'MAX': ('INTERNAL_EXPANDING_MAX', 'INTERNAL_SLIDING_MAX'),
+    'MIN': ('INTERNAL_EXPANDING_MIN', 'INTERNAL_SLIDING_MIN'),
+}
+
+
+@dataclass(eq=False)
+class Window:
+    """
+    A block of cells aggregating windows along the source vector.  The first cell of the block aggregates the first
+    "size" cells of the source, for expanding windows each following cell aggregates one more cell, and for sliding
+    windows each following cell moves the window along by a cell.
+    """
+    box: ExcelReference
+    function: str
+    expanding: bool
+    source: ExcelReference
+    size: int
+
+    @property
+    def function_details(self):
+        from . import excel_functions as exl
+
+        expanding, sliding = WINDOW_FUNCTIONS[self.function]
+        return getattr(exl, expanding if self.expanding else sliding)
+
+    def slice(self, ref: ExcelReference) -> tuple[tuple[int, int], tuple[int, int]] | None:
+        """ Offsets of a cell or range within the block, or None if it isn't within the block. """
+        key, box = ref.key, self.box.key
+        if key.sheet != box.sheet or key.min_row < box.min_row or key.max_row > box.max_row or \
+                key.min_col < box.min_col or key.max_col > box.max_col:
+            return None
+        return ((key.min_row - box.min_row, key.max_row - box.min_row + 1),
+                (key.min_col - box.min_col, key.max_col - box.min_col + 1))
+
+
+class WindowIndex(SignatureIndex):
+    """
+    Windows found in a workbook during a compilation.  Cells are examined when they are first requested, and each
+    cell of a block maps to its window so the rest of the block is found without examining it again.
+    """
+
+    def __init__(self, wb, inputs: Iterable[ExcelReference] = (), signatures: dict = None):
+        """
+        :param wb: Workbook to find windows in.
+        :param inputs: Input references, cells which are inputs can't be part of a window.
+        :param signatures: Relative signatures of cells already examined, see SignatureIndex.
+        """
+        super().__init__(wb, inputs, signatures)
+        self._cells: dict[tuple[str, int, int], Window | None] = {}
+
+    def find(self, ref: ExcelReference) -> tuple[Window, tuple] | None:
+        """
+        Window block holding a cell or range, along with the offsets of the reference within the block.  None if
+        the reference isn't held by a window block.
+        """
+        key = ref.key
+        if ref.is_array or key.ref_type not in (ExcelReference.ReferenceType.CELL, ExcelReference.ReferenceType.RANGE):
+            return None
+        cell = (key.sheet, key.max_row, key.max_col)
+        if cell not in self._cells:
+            self._cells[cell] = self._detect(*cell)
+        window = self._cells[cell]
+        if window is None:
+            return None
+        offsets = window.slice(ref)
+        return None if offsets is None else (window, offsets)
+
+    def _detect(self, sheet: str, row: int, col: int) -> Window | None:
+        signature = self._signature(sheet, row, col)
+        formula = _window_formula(signature[1]) if signature is not None else None
+        if formula is None:
+            return None
+        for vertical in (True, False):
+            pos, line = (row, col) if vertical else (col, row)
+            window = self._detect_along(sheet, pos, line, vertical, *formula)
+            if window is not None:
+                logger.debug("Found %s windows of %s over %s computing %s", window.function, window.size,
+                             window.source, window.box)
+                return window
+        return None
+
+    def _detect_along(self, sheet: str, anchor: int, line: int, vertical: bool, function: str, start: CellToken,
+                      end: CellToken) -> Window | None:
+        """
+        Find the window block through the anchor cell along the given direction.  The range must be along a single
+        line with its end moving along with the position, and the block covers the positions with the same formula as
+        the anchor.
+        """
+        if vertical:
+            (start_abs, start_pos, start_line), (end_abs, end_pos, end_line) = \
+                (start.row_abs, start.row, start.col), (end.row_abs, end.row, end.col)
+        else:
+            (start_abs, start_pos, start_line), (end_abs, end_pos, end_line) = \
+                (start.col_abs, start.col, start.row), (end.col_abs, end.col, end.row)
+        source_sheet = sheet_name(start.sheet, sheet)
+        if start_line != end_line or end_abs or (source_sheet == sheet and start_line == line):
+            return None  # not a vector moving along the block, or aggregates the block itself.
+
+        first, last = self._run(sheet, anchor, line, vertical)
+        if last - first + 1 < MIN_WINDOW_BLOCK_LENGTH:
+            return None
+
+        # positions of the source covered by the first and last window.
+        end_offset = end_pos - anchor
+        source_first = start_pos if start_abs else first + start_pos - anchor
+        source_last = last + end_offset
+        size = first + end_offset - source_first + 1
+        if source_first < 1 or size < 1 or source_last > (MAX_ROW if vertical else MAX_COLUMN):
+            return None
+
+        body = [(sheet, *self._coordinate(pos, line, vertical)) for pos in range(first, last + 1)]
+        if vertical:
+            box = ExcelReference(self._wb, range_address('', line, first, line, last), sheet)
+            source = box.create_relative(range_address(start.sheet, start_line, source_first, start_line, source_last))
+        else:
+            box = ExcelReference(self._wb, range_address('', first, line, last, line), sheet)
+            source = box.create_relative(range_address(start.sheet, source_first, start_line, source_last, start_line))
+
+        # blank cells are ignored by Excel's aggregates, so the source must be all numbers.
+        if self._overridden(body) or not self._numeric_range(source, allow_blank=False):
+            self._cells.update((x, None) for x in body)
+            return None
+
+        window = Window(box, function, start_abs, source, size)
+        self._cells.update((x, window) for x in body)
+        return window
+
+
+def _window_formula(tokens: list) -> tuple[str, CellToken, CellToken] | None:
+    """
+    The function and the start and end of the range, if the formula is only an aggregate of a range such as
+    =SUM($B$2:B10), otherwise None.
+    """
+    tokens = [x for x in tokens if x.type != x.WSPACE]
+    if len(tokens) != 3:
+        return None
+    func, operand, close = tokens
+    if func.type != func.FUNC or func.subtype != func.OPEN or close.type != close.FUNC or \
+            operand.type != operand.OPERAND or operand.subtype != operand.RANGE:
+        return None
+
+    function = func.value[:-1].upper().replace("_XLFN.", "")
+    if function not in WINDOW_FUNCTIONS:
+        return None
+    cells = parse_range_token(operand.value)
+    return None if cells is None else (function, *cells)
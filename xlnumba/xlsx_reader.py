@@ -0,0 +1,406 @@
+"""
+Fast loader for XLSX files.  Only the parts of the workbook used by the compiler are read: the workbook structure,
+shared strings, number formats (to identify dates) and the cells of each worksheet.  Worksheets are parsed lazily the
+first time they are referenced and cells are held in columns per sheet (a sorted array of coordinates, a list of values
+and an array of data types) rather than as openpyxl cell objects, which greatly reduces load time and memory for large
+workbooks.
+
+The workbook, worksheet and cell objects mimic the subset of the openpyxl interface used by the compiler, with the
+same value and data type conventions as openpyxl's editable (non-readonly) mode.
+"""
+import io
+import posixpath
+import zipfile
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries, get_column_letter
+from openpyxl.utils.datetime import from_excel, from_ISO8601, WINDOWS_EPOCH, MAC_EPOCH
+from openpyxl.worksheet.formula import ArrayFormula
+
+from .logger import logger
+
+RELATIONSHIP_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+DefinedName = namedtuple("DefinedName", ["name", "value"])
+
+# largest column of a worksheet, coordinates are packed in to a single integer of row * (MAX_COLUMN + 1) + column.
+MAX_COLUMN = 16384
+
+
+def load_workbook(file) -> 'XlsxWorkbook':
+    """
+    Load a workbook, equivalent to openpyxl.load_workbook for the purposes of the compiler.
+
+    :param file: File name or binary file like object.
+    """
+    if hasattr(file, 'read'):
+        file = io.BytesIO(file.read())
+    return XlsxWorkbook(file)
+
+
+class XlsxWorkbook:
+    read_only = False
+
+    def __init__(self, file):
+        self._file = file
+        with zipfile.ZipFile(file) as archive:
+            workbook_path = _office_document_path(archive)
+            workbook_rels = _relationships(archive, workbook_path)
+            workbook = _parse(archive, workbook_path)
+
+            self.epoch = WINDOWS_EPOCH
+            active_index = 0
+            sheets = []
+            self.defined_names = {}
+            for elem in workbook.iter():
+                match _local_name(elem.tag):
+                    case 'workbookPr':
+                        if elem.get('date1904') in ('1', 'true'):
+                            self.epoch = MAC_EPOCH
+                    case 'workbookView':
+                        active_index = int(elem.get('activeTab', 0))
+                    case 'sheet':
+                        sheets.append((elem.get('name'), workbook_rels[elem.get(RELATIONSHIP_ID)][1]))
+                    case 'definedName':
+                        # sheet scoped names are not visible from the workbook, matching openpyxl.
+                        if elem.get('localSheetId') is None:
+                            self.defined_names[elem.get('name')] = DefinedName(elem.get('name'), elem.text)
+
+            shared_strings, styles = None, None
+            for rel_type, target in workbook_rels.values():
+                if rel_type.endswith('/sharedStrings'):
+                    shared_strings = target
+                elif rel_type.endswith('/styles'):
+                    styles = target
+            self._shared_strings_path = shared_strings
+            self._shared_strings = None
+            self.date_formats, self.timedelta_formats = _read_date_formats(archive, styles)
+
+        self._sheets = {name: XlsxWorksheet(self, name, path) for name, path in sheets}
+        self.active = list(self._sheets.values())[min(active_index, len(sheets) - 1)]
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return list(self._sheets.keys())
+
+    def __getitem__(self, name) -> 'XlsxWorksheet':
+        return self._sheets[name]
+
+    def __contains__(self, name):
+        return name in self._sheets
+
+    @property
+    def shared_strings(self) -> list[str]:
+        if self._shared_strings is None:
+            self._shared_strings = self._read_shared_strings()
+        return self._shared_strings
+
+    def open(self, path):
+        """ Open a part of the workbook package for reading. """
+        if isinstance(self._file, io.BytesIO):
+            self._file.seek(0)
+        archive = zipfile.ZipFile(self._file)
+        return archive, archive.open(path)
+
+    def _read_shared_strings(self) -> list[str]:
+        strings = []
+        if self._shared_strings_path is None:
+            return strings
+        archive, stream = self.open(self._shared_strings_path)
+        with archive, stream:
+            for event, elem in ElementTree.iterparse(stream):
+                if _local_name(elem.tag) == 'si':
+                    strings.append(_text_content(elem))
+                    elem.clear()
+        return strings
+
+
+class XlsxWorksheet:
+    """
+    Cells of a worksheet stored column wise; each cell has a position in the value and type columns, which is the
+    position of its packed coordinate in the sorted coordinate column.  Cells are written in row order so the
+    coordinates are usually sorted as they are read.  Shared formulas are only translated to the cell when accessed.
+    """
+
+    def __init__(self, workbook: XlsxWorkbook, title: str, path: str):
+        self.parent = workbook
+        self.title = title
+        self._path = path
+        self._loaded = False
+        self._keys = array('q')
+        self._unsorted = False
+        self._values: list = []
+        self._types = bytearray()
+        self._shared: dict[int, str] = {}
+        self._translators: dict[str, Translator] = {}
+        self._array_formulae: dict[str, str] = {}
+        self._max_row = 0
+        self._max_column = 0
+
+    @property
+    def max_row(self) -> int:
+        self._load()
+        return max(self._max_row, 1)
+
+    @property
+    def max_column(self) -> int:
+        self._load()
+        return max(self._max_column, 1)
+
+    @property
+    def array_formulae(self) -> dict[str, str]:
+        self._load()
+        return self._array_formulae
+
+    def cell(self, row: int, column: int) -> 'XlsxCell':
+        self._load()
+        key = _pack(row, column)
+        position = bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            return XlsxCell(row, column, None, 'n')
+        if position in self._shared:
+            coordinate = _coordinate(row, column)
+            self._values[position] = self._translators[self._shared.pop(position)].translate_formula(coordinate)
+        return XlsxCell(row, column, self._values[position], chr(self._types[position]))
+
+    def __getitem__(self, key: str):
+        if ':' in key:
+            min_col, min_row, max_col, max_row = range_boundaries(key)
+            return tuple(tuple(self.cell(row, col) for col in range(min_col, max_col + 1))
+                         for row in range(min_row, max_row + 1))
+        return self.cell(*coordinate_to_tuple(key))
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        logger.debug("Loading worksheet %s from %s", self.title, self._path)
+        archive, stream = self.parent.open(self._path)
+        with archive, stream:
+            self._parse(stream)
+        logger.debug("Loaded %d cells from worksheet %s", len(self._values), self.title)
+
+    def _sort(self):
+        """ Sort cells written out of order by their coordinates, a repeated cell overrides the earlier ones. """
+        latest = {key: position for position, key in enumerate(self._keys)}
+        order = [latest[key] for key in sorted(latest)]
+        new_positions = {old: new for new, old in enumerate(order)}
+        self._keys = array('q', (self._keys[x] for x in order))
+        self._values = [self._values[x] for x in order]
+        self._types = bytearray(self._types[x] for x in order)
+        self._shared = {new_positions[x]: idx for x, idx in self._shared.items() if x in new_positions}
+
+    def _parse(self, stream):
+        row, column = 0, 0
+        sheet_data = None
+        for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+            tag = _local_name(elem.tag)
+            if event == 'start':
+                if tag == 'row':
+                    row = int(elem.get('r', row + 1))
+                    column = 0
+                elif tag == 'sheetData':
+                    sheet_data = elem
+            elif tag == 'c':
+                coordinate = elem.get('r')
+                if coordinate:
+                    row, column = coordinate_to_tuple(coordinate)
+                else:
+                    column += 1
+                self._parse_cell(elem, row, column)
+            elif tag == 'row':
+                # rows are fully processed into the store, drop them to keep memory flat on large sheets.
+                sheet_data.clear()
+        if self._unsorted:
+            self._sort()
+
+    def _parse_cell(self, elem, row: int, column: int):
+        """ Convert the cell to the same value and data type as openpyxl's WorkSheetParser.parse_cell """
+        data_type = elem.get('t', 'n')
+        style_id = int(elem.get('s', 0))
+        value = None
+        formula = None
+        inline = None
+        for child in elem:
+            match _local_name(child.tag):
+                case 'v':
+                    value = child.text or None
+                case 'f':
+                    formula = child
+                case 'is':
+                    inline = child
+        if data_type == 'inlineStr':
+            value = None
+
+        position = len(self._values)
+        if formula is not None:
+            data_type = 'f'
+            value = self._parse_formula(formula, row, column, position)
+        elif value is not None:
+            if data_type == 'n':
+                value = _cast_number(value)
+                if style_id in self.parent.date_formats:
+                    data_type = 'd'
+                    try:
+                        value = from_excel(value, self.parent.epoch,
+                                           timedelta=style_id in self.parent.timedelta_formats)
+                    except (OverflowError, ValueError):
+                        data_type, value = 'e', '#VALUE!'
+            elif data_type == 's':
+                value = self.parent.shared_strings[int(value)]
+            elif data_type == 'b':
+                value = bool(int(value))
+            elif data_type == 'str':
+                data_type = 's'
+            elif data_type == 'd':
+                value = from_ISO8601(value)
+        elif data_type == 'inlineStr' and inline is not None:
+            data_type = 's'
+            value = _text_content(inline)
+
+        if value is None and formula is None:
+            # styled but empty cells, only count towards the sheet dimensions.
+            data_type = 'n'
+
+        key = _pack(row, column)
+        if self._keys and key <= self._keys[-1]:
+            self._unsorted = True
+        self._keys.append(key)
+        self._values.append(value)
+        self._types.append(ord(data_type))
+        self._max_row = max(self._max_row, row)
+        self._max_column = max(self._max_column, column)
+
+    def _parse_formula(self, formula, row: int, column: int, position: int):
+        value = "=" + (formula.text or "")
+        match formula.get('t'):
+            case 'array':
+                coordinate = _coordinate(row, column)
+                self._array_formulae[coordinate] = formula.get('ref')
+                value = ArrayFormula(ref=formula.get('ref'), text=value)
+            case 'shared':
+                idx = formula.get('si')
+                if idx in self._translators:
+                    self._shared[position] = idx
+                    value = None
+                elif value != "=":
+                    coordinate = _coordinate(row, column)
+                    self._translators[idx] = Translator(value, coordinate)
+        return value
+
+
+class XlsxCell:
+    __slots__ = ('row', 'col_idx', 'value', 'data_type')
+
+    def __init__(self, row: int, col_idx: int, value, data_type: str):
+        self.row = row
+        self.col_idx = col_idx
+        self.value = value
+        self.data_type = data_type
+
+    @property
+    def column(self) -> int:
+        return self.col_idx
+
+    @property
+    def coordinate(self) -> str:
+        return _coordinate(self.row, self.col_idx)
+
+    def __repr__(self):
+        return f"<XlsxCell {self.coordinate}>"
+
+
+def _pack(row: int, column: int) -> int:
+    return row * (MAX_COLUMN + 1) + column
+
+
+def _coordinate(row: int, column: int) -> str:
+    return f"{get_column_letter(column)}{row}"
+
+
+def _cast_number(value: str):
+    """ Convert numbers as string to an int or float, matching openpyxl. """
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def _local_name(tag: str) -> str:
+    """ Strip the namespace from a tag, transitional and strict files use different namespaces. """
+    return tag.rsplit('}', 1)[-1]
+
+
+def _text_content(elem) -> str:
+    """ Plain text of a string item, joining rich text runs and skipping phonetic runs. """
+    parts = []
+    for child in elem:
+        match _local_name(child.tag):
+            case 't':
+                parts.append(child.text or "")
+            case 'r':
+                parts.extend(x.text or "" for x in child if _local_name(x.tag) == 't')
+    return "".join(parts)
+
+
+def _parse(archive: zipfile.ZipFile, path: str):
+    with archive.open(path) as f:
+        return ElementTree.parse(f).getroot()
+
+
+def _office_document_path(archive: zipfile.ZipFile) -> str:
+    for rel_type, target in _relationships(archive, "").values():
+        if rel_type.endswith('/officeDocument'):
+            return target
+    return "xl/workbook.xml"
+
+
+def _relationships(archive: zipfile.ZipFile, part: str) -> dict[str, tuple[str, str]]:
+    """
+    Relationships of a part in the package, id mapped to the type and the full path of the target.
+    """
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", name + ".rels")
+    if rels_path not in archive.namelist():
+        return {}
+
+    result = {}
+    for elem in _parse(archive, rels_path):
+        target = elem.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(folder, target))
+        result[elem.get('Id')] = (elem.get('Type'), target)
+    return result
+
+
+def _read_date_formats(archive: zipfile.ZipFile, path: str | None) -> tuple[set[int], set[int]]:
+    """
+    Index of the cell styles which format numbers as dates or time deltas, matching openpyxl's stylesheet.
+    """
+    date_formats, timedelta_formats = set(), set()
+    if path is None:
+        return date_formats, timedelta_formats
+
+    root = _parse(archive, path)
+    custom = {}
+    cell_styles = []
+    for elem in root:
+        match _local_name(elem.tag):
+            case 'numFmts':
+                custom = {int(x.get('numFmtId')): x.get('formatCode') for x in elem}
+            case 'cellXfs':
+                cell_styles = [int(x.get('numFmtId', 0)) for x in elem]
+
+    for idx, fmt_id in enumerate(cell_styles):
+        fmt = custom[fmt_id] if fmt_id in custom else builtin_format_code(fmt_id)
+        if is_date_format(fmt):
+            date_formats.add(idx)
+        if is_timedelta_format(fmt):
+            timedelta_formats.add(idx)
+    return date_formats, timedelta_formats